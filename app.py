@@ -1,29 +1,48 @@
 import streamlit as st
 import asyncio
-from src.creg.creg_information import CREG
-from src.upme.upme_information import UPME
+from src.xm_db.connection_pool import ReadOnlyPool
+from src.xm_db.metric_catalog import MetricCatalog
+from src.xm_db.metric_vector_store import MetricVectorStore
+from src.xm_db.sql_query_engine import SQLQueryEngine
+from utils.logger import logging
+from utils.resources import get_query_engine, warm_up
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+
+@st.cache_resource
+def warm_up_resources():
+    # Once per process: models, Chroma client and query engines are shared by every session
+    warm_up()
+    return True
+
+
 def get_vector_stores():
-    creg = CREG()
-    creg_documents = creg.model_resolution_doc()
-    if creg_documents:
-        creg_vector_store = creg.get_creg_vector_store(creg_documents)
-        creg_query_engine = creg.get_query_engine(creg_vector_store)
-
-    upme = UPME()
-    upme_documents = upme.model_resolution_doc()
-    if upme_documents:
-        upme_vector_store = upme.get_upme_vector_store(upme_documents)
-        upme_query_engine = upme.get_query_engine(upme_vector_store)
-        
+    # Shared query engines, rebuilt only after new CREG or UPME resolutions are indexed
+    creg_query_engine = get_query_engine("creg")
+    upme_query_engine = get_query_engine("upme")
     return creg_query_engine, upme_query_engine
 
 
+@st.cache_resource
+def get_sql_query_engine():
+    # Shared by every session so the schema context and the result cache are reused
+    pool = ReadOnlyPool("src/xm_db/dbs/test_xm_data.db")
+    # Questions are resolved to their metrics with one vector lookup instead of sending
+    # the whole catalog to the LLM
+    metric_vector_store = MetricVectorStore(MetricCatalog(pool))
+    try:
+        metric_vector_store.sync()
+    except Exception as err:
+        logging.warning(f"No se pudo sincronizar el indice de metricas: {err}")
+    return SQLQueryEngine(pool=pool, metric_resolver=metric_vector_store)
+
+
 async def get_response(prompt: str, engine:str, creg_query_engine, upme_query_engine) -> str:
-    if engine == "Resoluciones CREG":
+    if engine == "Metricas XM":
+        response = await asyncio.to_thread(get_sql_query_engine().query, prompt)
+    elif engine == "Resoluciones CREG":
         response = await creg_query_engine.aquery(prompt)
     elif engine == "Resoluciones UPME":
         response = await upme_query_engine.aquery(prompt)
@@ -33,11 +52,12 @@ st.set_page_config(page_title="AI Chatbot del sector energetico", layout="wide")
 
 engine = st.sidebar.selectbox(
     "Selecciona de que quieres obtener información",
-    ["Resoluciones CREG", "Resoluciones UPME"]
+    ["Resoluciones CREG", "Resoluciones UPME", "Metricas XM"]
 )
 
 st.title(f"Información sobre el sector energetico de {engine}")
 
+warm_up_resources()
 creg_query_engine, upme_query_engine = get_vector_stores()
 
 for message in st.session_state.messages:
@@ -55,7 +75,15 @@ if prompt := st.chat_input("¿Que deseas saber?"):
             response = asyncio.run(
                 get_response(prompt, engine, creg_query_engine, upme_query_engine)
             )
-            st.write(response.response)
+            if engine == "Metricas XM" and response.error:
+                st.error(response.error)
+                response = response.error
+            elif engine == "Metricas XM":
+                st.code(response.sql, language="sql")
+                st.dataframe(response.data)
+                response = response.data
+            else:
+                st.write(response.response)
 
     st.session_state.messages.append({"role": "assistant", "content": response})
 
@@ -0,0 +1,164 @@
+"""
+Benchmark of CREG/UPME document downloads against a local HTTP stand-in: one requests.get per
+file against utils.downloader.Downloader, on a first run and on a re-run with nothing changed.
+
+Usage:
+    python -m benchmarks.bench_downloads --files 40 --size-kb 300 --latency-ms 80
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+from utils.downloader import Downloader
+
+
+def build_fixtures(files: int, size_kb: int, seed: int = 0) -> dict:
+    """
+    Random bodies served as .docx and .pdf resolutions, keyed by URL path.
+    """
+    rng = np.random.default_rng(seed)
+    fixtures = {}
+    for number in range(files):
+        extension = "docx" if number % 2 else "pdf"
+        fixtures[f"/documentos/resolucion_{number:04d}.{extension}"] = rng.bytes(size_kb * 1024)
+    return fixtures
+
+
+def start_server(fixtures: dict, latency: float, failures: int) -> tuple:
+    """
+    Serves the fixtures with ETag and Last-Modified, answering 304 to conditional requests.
+    The first `failures` requests of every path answer 503 to exercise the retries.
+    """
+    last_modified = formatdate(time.time() - 3600, usegmt=True)
+    requests_seen = {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = fixtures.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            with lock:
+                requests_seen[self.path] = requests_seen.get(self.path, 0) + 1
+                attempt = requests_seen[self.path]
+            if attempt <= failures:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def sequential_download(urls: list, folder: str) -> int:
+    """
+    Previous behaviour of download_documents: one bare requests.get per file, body in memory.
+    """
+    for url in urls:
+        response = requests.get(url, timeout=10)
+        with open(os.path.join(folder, url.rsplit("/", 1)[-1]), "wb") as file:
+            file.write(response.content)
+    return len(urls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--size-kb", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--json", help="Optional path to write the results as JSON")
+    args = parser.parse_args()
+
+    fixtures = build_fixtures(args.files, args.size_kb)
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        server, base_url = start_server(fixtures, args.latency_ms / 1000, failures=0)
+        urls = [base_url + path for path in fixtures]
+
+        for run in ("first", "unchanged"):
+            start = time.perf_counter()
+            sequential_download(urls, folder)
+            seconds = time.perf_counter() - start
+            results.append({"implementation": "requests.get", "run": run, "seconds": seconds})
+        server.shutdown()
+
+        # A fresh server whose first answer to every file is a 503
+        server, base_url = start_server(fixtures, args.latency_ms / 1000, failures=1)
+        destination = os.path.join(folder, "downloader")
+        items = [
+            (base_url + path, os.path.join(destination, path.rsplit("/", 1)[-1]))
+            for path in fixtures
+        ]
+        downloader = Downloader(
+            validators_path=os.path.join(destination, "download_validators.json"),
+            max_workers=args.workers,
+            backoff_seconds=0.05,
+        )
+        for run in ("first", "unchanged"):
+            start = time.perf_counter()
+            outcome = downloader.download_many(items)
+            seconds = time.perf_counter() - start
+            statuses = {}
+            for result in outcome:
+                statuses[result.status] = statuses.get(result.status, 0) + 1
+            results.append({"implementation": "Downloader", "run": run, "seconds": seconds, **statuses})
+        downloader.close()
+        server.shutdown()
+
+        for path, body in fixtures.items():
+            with open(os.path.join(destination, path.rsplit("/", 1)[-1]), "rb") as file:
+                assert file.read() == body
+
+    for result in results:
+        statuses = {
+            key: value
+            for key, value in result.items()
+            if key not in ("implementation", "run", "seconds")
+        }
+        print(
+            f"{result['implementation']:<13} {result['run']:<10} "
+            f"{result['seconds'] * 1000:>9.1f} ms  {statuses or ''}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark of CREG/UPME indexing throughput (chunks/sec) per embedding batch size and requests in flight.
+Embeddings come from a local stand-in of the Ollama embed API that simulates model latency.
+
+Usage:
+    python -m benchmarks.bench_embeddings --documents 20 --batch-sizes 1,16,32 --in-flight 1,2,4
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import chromadb
+import numpy as np
+from llama_index.embeddings.ollama import OllamaEmbedding
+
+from utils.corpus_store import CorpusStore
+from utils.document_registry import DocumentRegistry
+from utils.indexing import IndexingPipeline
+
+
+def build_corpus(folder: str, documents: int, articles: int, seed: int = 0) -> tuple:
+    """
+    Synthetic processed resolutions registered as parsed and not indexed.
+    """
+    rng = np.random.default_rng(seed)
+    words = ["energia", "mercado", "tarifa", "comercializador", "generador", "cargo",
+             "resolucion", "usuario", "red", "transmision", "distribucion", "precio"]
+    records = []
+    for number in range(documents):
+        paragraphs = [
+            f"Articulo {article}. " + " ".join(rng.choice(words, size=120)) + "."
+            for article in range(articles)
+        ]
+        records.append({
+            "url": f"https://example.org/resolucion_{number:04d}",
+            "name": f"CREG {number:03d} 2024",
+            "resolution_date": "2024-01-01",
+            "concept": " ".join(rng.choice(words, size=8)),
+            "full_text": "\n\n".join(paragraphs),
+            "process_date": "2024-01-02",
+            "content_hash": f"hash_{number}",
+        })
+    corpus = CorpusStore(os.path.join(folder, "processed"))
+    corpus.append(records)
+    registry = DocumentRegistry("creg", os.path.join(folder, "document_registry.db"))
+    for record in records:
+        registry.mark_parsed(record["url"], record["content_hash"], record["name"])
+    return corpus, registry
+
+
+def start_server(latency: float, per_item: float, parallel: int, dimension: int) -> tuple:
+    """
+    Answers POST /api/embed like Ollama, taking `latency` plus `per_item` seconds per text,
+    with at most `parallel` requests computed at the same time (OLLAMA_NUM_PARALLEL).
+    """
+    slots = threading.Semaphore(parallel)
+    stats = {"requests": 0, "texts": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            texts = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+            with lock:
+                stats["requests"] += 1
+                stats["texts"] += len(texts)
+            with slots:
+                time.sleep(latency + per_item * len(texts))
+            rng = np.random.default_rng(len(texts))
+            body = json.dumps({
+                "model": payload["model"],
+                "embeddings": rng.random((len(texts), dimension)).round(6).tolist(),
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--articles", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=30, help="Fixed cost of a request")
+    parser.add_argument("--per-item-ms", type=float, default=8, help="Model time per chunk")
+    parser.add_argument("--server-parallel", type=int, default=4)
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--batch-sizes", default="1,16,32")
+    parser.add_argument("--in-flight", default="1,2,4")
+    parser.add_argument("--json", help="Optional path to write the results as JSON")
+    args = parser.parse_args()
+
+    server, base_url, stats = start_server(
+        args.latency_ms / 1000, args.per_item_ms / 1000, args.server_parallel, args.dimension
+    )
+    client = chromadb.EphemeralClient()
+    results = []
+    for batch_size in [int(value) for value in args.batch_sizes.split(",")]:
+        for in_flight in [int(value) for value in args.in_flight.split(",")]:
+            with tempfile.TemporaryDirectory() as folder:
+                corpus, registry = build_corpus(folder, args.documents, args.articles)
+                collection_name = f"bench_{batch_size}_{in_flight}"
+                collection = client.get_or_create_collection(collection_name)
+                model = OllamaEmbedding(
+                    model_name="mxbai-embed-large", base_url=base_url, embed_batch_size=batch_size
+                )
+                pipeline = IndexingPipeline(
+                    "creg", corpus, registry, collection, model,
+                    batch_size=batch_size, max_in_flight=in_flight,
+                )
+                requests_before = stats["requests"]
+                start = time.perf_counter()
+                counts = pipeline.run()
+                seconds = time.perf_counter() - start
+                assert collection.count() == counts["embedded"]
+                assert not registry.pending_index()
+                registry.close()
+                client.delete_collection(collection_name)
+            results.append({
+                "batch_size": batch_size,
+                "in_flight": in_flight,
+                "chunks": counts["embedded"],
+                "requests": stats["requests"] - requests_before,
+                "seconds": seconds,
+                "chunks_per_second": counts["embedded"] / seconds,
+            })
+    server.shutdown()
+
+    for result in results:
+        print(
+            f"batch {result['batch_size']:>3}  in flight {result['in_flight']:>2}  "
+            f"{result['chunks']:>5} chunks  {result['requests']:>5} requests  "
+            f"{result['seconds']:>7.2f} s  {result['chunks_per_second']:>8.1f} chunks/s"
+        )
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark of the cold import time of the serving path of app.py and of the CREG/UPME ingestion modules.
+Every import runs in a fresh interpreter from an empty folder, reporting the scraping and parsing libraries it loads.
+
+Usage:
+    python -m benchmarks.bench_import_time --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Modules imported by app.py (streamlit apart) and by the ingestion jobs
+TARGETS = {
+    "serving": ["utils.resources", "src.xm_db.sql_query_engine"],
+    "logger": ["utils.logger"],
+    "creg": ["src.creg.creg_information"],
+    "upme": ["src.upme.upme_information"],
+}
+
+# Libraries only needed to scrape and parse documents
+INGESTION_MODULES = ["selenium", "PyPDF2", "bs4", "docx"]
+
+SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "ingestion_modules": [name for name in {ingestion!r} if name in sys.modules],
+    "log_folder": os.path.exists("logs"),
+}}))
+"""
+
+
+def measure(modules: list, repeat: int) -> dict:
+    """
+    Imports `modules` in `repeat` fresh interpreters and returns the median time.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(
+        path for path in (root, environment.get("PYTHONPATH")) if path
+    )
+    script = SCRIPT.format(modules=modules, ingestion=INGESTION_MODULES)
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as folder:
+            output = subprocess.run(
+                [sys.executable, "-c", script],
+                cwd=folder,
+                env=environment,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "seconds": statistics.median(run["seconds"] for run in runs),
+        "ingestion_modules": runs[-1]["ingestion_modules"],
+        "log_folder": runs[-1]["log_folder"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--json", help="Optional path to write the results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for target in args.targets.split(","):
+        results.append({"target": target, **measure(TARGETS[target], args.repeat)})
+
+    for result in results:
+        print(
+            f"{result['target']:<8} {result['seconds'] * 1000:>8.1f} ms  "
+            f"log folder {'yes' if result['log_folder'] else 'no':<3}  "
+            f"ingestion modules {result['ingestion_modules'] or '-'}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
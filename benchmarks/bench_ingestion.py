@@ -0,0 +1,125 @@
+"""
+Synthetic-load benchmark of the XM ingestion pipeline, without network access.
+
+Runs DBClient.update_master_table, update_data and update_list_entities against a FakeReadDB
+generating hourly, daily, monthly and list payloads of configurable size, once per ingestion
+mode, and reports the time of every stage (fetch, normalize, delete, insert, commit), the
+write throughput and the peak Python memory as JSON.
+
+Usage:
+    python -m benchmarks.bench_ingestion --hourly 50 --daily 100 --monthly 30 --lists 5 \
+        --resources 20 --days 15 --modes sequential bulk concurrent_bulk --json bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from src.xm_db.database_client import DBClient
+from src.xm_db.fake_api import FakeReadDB, build_fake_catalog
+
+MODES = {
+    "sequential": {},
+    "bulk": {"bulk": True},
+    "concurrent": {"concurrent": True, "requests_per_second": None},
+    "concurrent_bulk": {"concurrent": True, "requests_per_second": None, "bulk": True},
+}
+
+
+def run_mode(args, mode: str, trace_memory: bool) -> dict:
+    catalog = build_fake_catalog(args.hourly, args.daily, args.monthly, args.lists)
+    fake = FakeReadDB(catalog, resources_per_metric=args.resources, latency=args.latency)
+    end_date = date(2024, 12, 31)
+    start_date = end_date - timedelta(days=args.days - 1)
+
+    with tempfile.TemporaryDirectory() as folder:
+        db_client = DBClient(os.path.join(folder, "bench_xm.db"), api_object=fake)
+        lists = catalog[catalog["Type"] == "ListsEntities"]
+        for metric_id, entity in zip(lists["MetricId"], lists["Entity"]):
+            # The list tables are created by hand in production, mirror their columns here
+            columns = fake.request_data(metric_id, entity, start_date, start_date).columns
+            columns = [column for column in columns if column != "Id"] + ["id", "metricName"]
+            db_client.conn.execute(f"CREATE TABLE {metric_id} ({', '.join(columns)})")
+        fake.calls = 0
+
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        db_client.update_master_table(catalog.rename(columns={"MetricId": "metricId"}))
+        master_seconds = time.perf_counter() - start
+
+        options = {**MODES[mode], "max_workers": args.workers}
+        reports = [
+            db_client.update_data(start_date, end_date, **options),
+            db_client.update_list_entities(start_date, end_date, **options),
+        ]
+        total_seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+        db_client.close_connection()
+
+    stages = {"master_table": master_seconds}
+    for report in reports:
+        for stage, seconds in report.stage_seconds.items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    rows = sum(report.rows_written for report in reports)
+    write_seconds = sum(report.write_seconds for report in reports)
+    return {
+        "mode": mode,
+        "total_seconds": total_seconds,
+        "stage_seconds": stages,
+        "rows_written": rows,
+        "write_rows_per_second": rows / write_seconds if write_seconds else 0.0,
+        "failed": sum(len(report.failed) for report in reports),
+        "api_calls": fake.calls,
+        "peak_memory_mb": peak / 2**20 if peak is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--hourly", type=int, default=20)
+    parser.add_argument("--daily", type=int, default=40)
+    parser.add_argument("--monthly", type=int, default=10)
+    parser.add_argument("--lists", type=int, default=3)
+    parser.add_argument("--resources", type=int, default=20, help="Resources per non system metric")
+    parser.add_argument("--days", type=int, default=15, help="Days requested per metric")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per API request")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--json", help="Path of the JSON results, printed when omitted")
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        result = run_mode(args, mode, trace_memory=False)
+        if not args.no_memory:
+            # tracemalloc slows everything down, so the peak comes from a separate run
+            result["peak_memory_mb"] = run_mode(args, mode, trace_memory=True)["peak_memory_mb"]
+        results.append(result)
+        stages = ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in result["stage_seconds"].items())
+        print(f"{mode:<16} {result['total_seconds']:.2f}s  {result['rows_written']:,} filas  {stages}")
+
+    output = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "parameters": vars(args),
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(output, file, indent=4)
+    else:
+        print(json.dumps(output, indent=4))
+
+
+if __name__ == "__main__":
+    main()
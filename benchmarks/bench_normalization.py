@@ -0,0 +1,114 @@
+"""
+Micro-benchmark of the hourly payload normalization: the former chain of column checks,
+renames and in-place drops of DBClient.update_data against the compiled declarative transform
+of src/xm_db/normalization.py, on wide synthetic hourly payloads.
+
+Usage:
+    python -m benchmarks.bench_normalization --rows 10000 100000 --repeat 7
+"""
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from src.xm_db.migrations import HOUR_COLUMNS
+from src.xm_db.normalization import normalize_payload
+
+
+def build_hourly_payload(rows: int, resources: int = 900, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(0, 500, size=(rows, len(HOUR_COLUMNS)))
+    values[rng.random(size=values.shape) < 0.01] = np.nan
+    # Like the real payloads, every resource keeps its name, market and fuel on every date
+    resource = rng.integers(0, resources, rows)
+    data = {
+        "Id": np.full(rows, "Recurso"),
+        "Values_code": np.char.add("REC", resource.astype(str)),
+        "Values_Name": np.char.add("Planta ", resource.astype(str)),
+        "Values_MarketType": np.array(["Nacional", "Internacional"])[resource % 2],
+        "Values_FuelType": np.array(["AGUA", "GAS", "CARBON"])[resource % 3],
+    }
+    data.update({column: values[:, hour] for hour, column in enumerate(HOUR_COLUMNS)})
+    data["Date"] = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, rows), unit="D")
+    return pd.DataFrame(data)
+
+
+def legacy_normalize(df_variable: pd.DataFrame) -> pd.DataFrame:
+    """
+    Hourly branch of DBClient.update_data before the declarative mapping.
+    """
+    df_variable = df_variable.fillna(0).drop("Id", axis=1, errors="ignore")
+    if "Code" in df_variable.columns or "Name" in df_variable.columns:
+        df_variable.rename(columns={"Code": "id_recurso", "Name": "id_recurso"}, inplace=True)
+    if all(col in df_variable.columns for col in ["Values_code", "Values_Name"]):
+        df_variable["id_recurso"] = df_variable["Values_code"] + " - " + df_variable["Values_Name"]
+        df_variable.drop(["Values_code", "Values_Name"], axis=1, inplace=True)
+    else:
+        df_variable.rename(
+            columns={"Values_code": "id_recurso", "Values_Name": "id_recurso"}, inplace=True
+        )
+    if "Values_Activity" in df_variable.columns and "Values_Subactivity" in df_variable.columns:
+        df_variable["id_recurso"] = (
+            df_variable["Values_Activity"] + " - " + df_variable["Values_Subactivity"]
+        )
+        df_variable.drop(["Values_Activity", "Values_Subactivity"], axis=1, inplace=True)
+    if "Values_MarketType" in df_variable.columns:
+        df_variable["id_recurso"] += " - " + df_variable["Values_MarketType"]
+        df_variable.drop(["Values_MarketType"], axis=1, inplace=True)
+    if "Values_FuelType" in df_variable.columns:
+        df_variable["id_recurso"] += " - " + df_variable["Values_FuelType"]
+        df_variable.drop(["Values_FuelType"], axis=1, inplace=True)
+    return df_variable
+
+
+def measure(function, payload: pd.DataFrame, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(payload)
+        samples.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"median_ms": statistics.median(samples) * 1000, "peak_mb": peak / 2**20}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--json", help="Optional path to write the results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.rows:
+        payload = build_hourly_payload(rows)
+        legacy = legacy_normalize(payload)
+        compiled = normalize_payload(payload, "HourlyEntities")
+        assert legacy["id_recurso"].equals(compiled["id_recurso"])
+        assert np.allclose(legacy[HOUR_COLUMNS], compiled[HOUR_COLUMNS])
+
+        for name, function in [
+            ("legacy", legacy_normalize),
+            ("compiled", lambda df: normalize_payload(df, "HourlyEntities")),
+        ]:
+            result = {"rows": rows, "implementation": name, **measure(function, payload, args.repeat)}
+            results.append(result)
+            print(
+                f"{rows:>9,} filas  {name:<9} {result['median_ms']:>9.2f} ms  "
+                f"pico {result['peak_mb']:>8.2f} MB"
+            )
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
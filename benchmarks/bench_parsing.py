@@ -0,0 +1,154 @@
+"""
+Benchmark of CREG (.docx) and UPME (PDF) resolution parsing on a local fixture corpus, one
+document after another against utils.parallel_parse.iter_parsed with several processes.
+
+Usage:
+    python -m benchmarks.bench_parsing --documents 120 --pages 8 --workers 1 2 4
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import docx
+
+from src.creg.parsing import parse_resolution as parse_creg
+from src.upme.parsing import parse_resolution as parse_upme
+from utils.parallel_parse import iter_parsed
+
+PARAGRAPH = (
+    "Que de acuerdo con lo previsto en el articulo 23 de la Ley 143 de 1994, la Comision "
+    "de Regulacion de Energia y Gas debe asegurar una adecuada prestacion del servicio. "
+)
+
+
+def write_docx(path: str, number: int, paragraphs: int) -> None:
+    document = docx.Document()
+    document.add_paragraph("Ministerio de Minas y Energia")
+    document.add_paragraph(f"RESOLUCIÓN No. 101 {number:03d} DE 2024")
+    document.add_paragraph("(15 ENE. 2024)")
+    document.add_paragraph("")
+    document.add_paragraph(f"Por la cual se establece la regla numero {number}")
+    for _ in range(paragraphs):
+        document.add_paragraph(PARAGRAPH * 4)
+    document.save(path)
+
+
+def write_pdf(path: str, number: int, pages: int) -> None:
+    """
+    Minimal PDF with Helvetica text pages, written by hand to avoid extra dependencies.
+    """
+    lines = [f"RESOLUCION No. {number:06d} de 2024", "19-06-2024"] + [PARAGRAPH[:90]] * 50
+    streams = []
+    for _ in range(pages):
+        text = " ".join(f"({line}) '" for line in lines)
+        streams.append(f"BT /F1 9 Tf 12 TL 40 800 Td {text} ET".encode("latin-1"))
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for stream in streams:
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    content = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number_object, body in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += b"%d 0 obj\n%s\nendobj\n" % (number_object, body)
+    xref = len(content)
+    content += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    content += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    content += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    with open(path, "wb") as file:
+        file.write(content)
+
+
+def build_corpus(folder: str, documents: int, pages: int) -> tuple:
+    """
+    Writes `documents` .docx and `documents` PDF resolutions, plus a broken file of each kind.
+    """
+    docx_paths, pdf_paths = [], []
+    for number in range(documents):
+        docx_paths.append(os.path.join(folder, f"creg_{number:04d}.docx"))
+        write_docx(docx_paths[-1], number, paragraphs=pages * 10)
+        pdf_paths.append(os.path.join(folder, f"upme_{number:04d}.pdf"))
+        write_pdf(pdf_paths[-1], number, pages)
+    for name, paths in (("broken.docx", docx_paths), ("broken.pdf", pdf_paths)):
+        paths.append(os.path.join(folder, name))
+        with open(paths[-1], "wb") as file:
+            file.write(b"not a document")
+    return docx_paths, pdf_paths
+
+
+def run(parse_function, paths: list, workers: int, start_method: str) -> tuple:
+    start = time.perf_counter()
+    results = {
+        path: (result, error)
+        for path, result, error in iter_parsed(
+            parse_function, paths, workers=workers, start_method=start_method
+        )
+    }
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=120)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--start-method", default="spawn", choices=["spawn", "fork", "forkserver"])
+    parser.add_argument("--json", help="Optional path to write the results as JSON")
+    args = parser.parse_args()
+
+    print(f"CPUs disponibles: {os.cpu_count()}")
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        docx_paths, pdf_paths = build_corpus(folder, args.documents, args.pages)
+        sources = (("creg", parse_creg, docx_paths), ("upme", parse_upme, pdf_paths))
+        for source, parse_function, paths in sources:
+            baseline = None
+            for workers in args.workers:
+                seconds, parsed = run(parse_function, paths, workers, args.start_method)
+                failed = sorted(
+                    os.path.basename(path) for path, (_, error) in parsed.items() if error
+                )
+                texts = {
+                    path: result["full_text"] for path, (result, _) in parsed.items() if result
+                }
+                if baseline is None:
+                    baseline = texts
+                assert texts == baseline and len(parsed) == len(paths)
+                result = {
+                    "source": source,
+                    "workers": workers,
+                    "documents": len(paths),
+                    "seconds": seconds,
+                    "documents_per_second": len(paths) / seconds,
+                    "failed": failed,
+                }
+                results.append(result)
+                print(
+                    f"{source}  {workers} procesos  {seconds:>7.2f} s  "
+                    f"{result['documents_per_second']:>7.1f} docs/s  fallidos: {failed}"
+                )
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Before/after query latency of the schema migrations on a synthetic multi-year XM database.
+
+Builds a database with the legacy schema (migration 1: VARCHAR dates, no indexes), times the
+queries run by the ingestion and the analytics, applies the rest of the migrations in place
+and times the same queries again.
+
+Usage:
+    python -m benchmarks.bench_schema_migration --years 3 --metrics 20 --resources 10
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from src.xm_db.migrations import HOUR_COLUMNS, get_schema_version, migrate
+
+QUERIES = {
+    "delete_window_lookup": (
+        "SELECT COUNT(*) FROM hourly_entity WHERE id = ? AND date >= ? AND date < ?",
+        "window",
+    ),
+    "daily_metric_one_year": (
+        "SELECT date, id_recurso, value FROM daily_entity WHERE id = ? AND date >= ? AND date < ?",
+        "year",
+    ),
+    "hourly_resource_one_year": (
+        "SELECT date, Values_Hour01, Values_Hour12, Values_Hour24 FROM hourly_entity "
+        "WHERE id = ? AND id_recurso = ? AND date >= ? AND date < ?",
+        "resource_year",
+    ),
+    "monthly_metric_history": (
+        "SELECT date, value FROM monthly_entity WHERE id = ? ORDER BY date",
+        "metric",
+    ),
+}
+
+
+def populate(conn: sqlite3.Connection, years: int, metrics: int, resources: int) -> int:
+    rng = random.Random(0)
+    start = date(2024, 12, 31) - timedelta(days=365 * years)
+    days = [start + timedelta(days=offset) for offset in range(365 * years)]
+    hourly_sql = (
+        f"INSERT INTO hourly_entity (id, id_recurso, {', '.join(HOUR_COLUMNS)}, date, metricName) "
+        f"VALUES ({', '.join(['?'] * (len(HOUR_COLUMNS) + 4))})"
+    )
+    rows = 0
+    for metric in range(1, metrics + 1):
+        for resource in range(resources):
+            code = f"REC{resource:04d}"
+            conn.executemany(
+                hourly_sql,
+                (
+                    (metric, code, *[rng.random() for _ in HOUR_COLUMNS], day.isoformat(), f"m{metric}")
+                    for day in days
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO daily_entity (id, value, id_recurso, date, metricName) VALUES (?, ?, ?, ?, ?)",
+                ((metric, rng.random(), code, day.isoformat(), f"m{metric}") for day in days),
+            )
+            rows += 2 * len(days)
+        conn.executemany(
+            "INSERT INTO monthly_entity (id, value, date, metricName) VALUES (?, ?, ?, ?)",
+            ((metric, rng.random(), day.isoformat(), f"m{metric}") for day in days if day.day == 1),
+        )
+    conn.commit()
+    return rows
+
+
+def parameters(kind: str, metrics: int, resources: int) -> list:
+    end = date(2024, 12, 31)
+    params = []
+    for metric in range(1, metrics + 1):
+        if kind == "window":
+            params.append((metric, (end - timedelta(days=15)).isoformat(), end.isoformat()))
+        elif kind == "year":
+            params.append((metric, (end - timedelta(days=365)).isoformat(), end.isoformat()))
+        elif kind == "resource_year":
+            code = f"REC{metric % resources:04d}"
+            params.append((metric, code, (end - timedelta(days=365)).isoformat(), end.isoformat()))
+        else:
+            params.append((metric,))
+    return params
+
+
+def time_queries(conn: sqlite3.Connection, metrics: int, resources: int, repeat: int) -> dict:
+    results = {}
+    for name, (sql, kind) in QUERIES.items():
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for params in parameters(kind, metrics, resources):
+                conn.execute(sql, params).fetchall()
+            samples.append((time.perf_counter() - start) * 1000 / metrics)
+        results[name] = statistics.median(samples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--metrics", type=int, default=20)
+    parser.add_argument("--resources", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Optional path to write the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        conn = sqlite3.connect(os.path.join(folder, "bench_xm.db"))
+        migrate(conn, target=1)
+        rows = populate(conn, args.years, args.metrics, args.resources)
+        before = time_queries(conn, args.metrics, args.resources, args.repeat)
+
+        start = time.perf_counter()
+        migrate(conn)
+        migration_seconds = time.perf_counter() - start
+        after = time_queries(conn, args.metrics, args.resources, args.repeat)
+        version = get_schema_version(conn)
+        conn.close()
+
+    print(f"{rows:,} filas, migracion a version {version} en {migration_seconds:.2f}s")
+    print(f"{'consulta':<28}{'antes (ms)':>12}{'despues (ms)':>14}{'mejora':>9}")
+    for name in QUERIES:
+        speedup = before[name] / after[name] if after[name] else float("inf")
+        print(f"{name:<28}{before[name]:>12.3f}{after[name]:>14.3f}{speedup:>8.1f}x")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(
+                {
+                    "rows": rows,
+                    "migration_seconds": migration_seconds,
+                    "before_ms": before,
+                    "after_ms": after,
+                    **vars(args),
+                },
+                file,
+                indent=4,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark of multi-year hourly reads from the XM store: pd.read_sql of the wide rows plus
+hourly_to_long against the chunked array reader of src/xm_db/timeseries.py, as NumPy arrays
+and as Arrow record batches.
+
+Usage:
+    python -m benchmarks.bench_timeseries --years 1 3 --resources 50 --repeat 5
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from src.xm_db.migrations import HOUR_COLUMNS, migrate
+from src.xm_db.parquet_store import hourly_to_long
+from src.xm_db.timeseries import iter_record_batches, read_series
+
+METRIC_ID = 1
+
+
+def build_database(path: str, years: int, resources: int, seed: int = 0) -> tuple:
+    """
+    Stores `years` of hourly rows of one metric with `resources` resources, plus a second
+    metric of the same size that every read has to skip.
+    """
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2020-01-01", periods=365 * years, freq="D").strftime("%Y-%m-%d")
+    columns = ["id", "id_recurso", "date", *HOUR_COLUMNS, "metricName"]
+    sql = f"INSERT INTO hourly_entity ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    for metric_id in (METRIC_ID, METRIC_ID + 1):
+        for resource in range(resources):
+            values = rng.uniform(0, 500, size=(len(days), len(HOUR_COLUMNS))).round(4)
+            conn.executemany(
+                sql,
+                (
+                    (metric_id, f"REC{resource:04d}", day, *row, "Generacion")
+                    for day, row in zip(days, values.tolist())
+                ),
+            )
+    conn.commit()
+    return conn, days[0], days[-1]
+
+
+def pandas_read(conn, start, end):
+    df = pd.read_sql(
+        f"SELECT id, id_recurso, date, {', '.join(HOUR_COLUMNS)} FROM hourly_entity "
+        "WHERE id = ? AND date >= ? AND date <= ? ORDER BY id, id_recurso, date",
+        conn,
+        params=(METRIC_ID, start, end),
+    )
+    return hourly_to_long(df)
+
+
+def arrow_read(conn, start, end):
+    return sum(
+        batch.num_rows
+        for batch in iter_record_batches(
+            conn, METRIC_ID, start_date=start, end_date=end, table_name="hourly_entity"
+        )
+    )
+
+
+def measure(function, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"median_ms": statistics.median(samples) * 1000, "peak_mb": peak / 2**20}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--resources", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Optional path to write the results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for years in args.years:
+        with tempfile.TemporaryDirectory() as folder:
+            conn, start, end = build_database(
+                os.path.join(folder, "bench_xm.db"), years, args.resources
+            )
+            expected = pandas_read(conn, start, end)
+            series = read_series(conn, METRIC_ID, start, end)
+            assert np.allclose(expected["value"].to_numpy(), series["value"])
+            assert (expected["timestamp"].to_numpy() == series["timestamp"]).all()
+
+            for name, function in [
+                ("read_sql", lambda: pandas_read(conn, start, end)),
+                ("numpy", lambda: read_series(conn, METRIC_ID, start, end)),
+                ("arrow", lambda: arrow_read(conn, start, end)),
+            ]:
+                result = {
+                    "years": years,
+                    "long_rows": len(expected),
+                    "implementation": name,
+                    **measure(function, args.repeat),
+                }
+                results.append(result)
+                print(
+                    f"{years} años {len(expected):>11,} filas  {name:<9} "
+                    f"{result['median_ms']:>9.1f} ms  pico {result['peak_mb']:>8.1f} MB"
+                )
+            conn.close()
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,60 @@
-import requests
-from bs4 import BeautifulSoup
 import os
-import json
-from datetime import datetime
 from utils.logger import logging, CustomException
+from utils.document_registry import DocumentRegistry, file_hash
+from utils.corpus_store import CorpusStore
+from utils.indexing import IndexingPipeline
+from utils.resources import get_chroma_client, get_embedding_model, get_llm
+from utils.parallel_parse import iter_parsed
+from src.creg.parsing import MONTH_INDEX_TRANSLATION, parse_resolution, remove_accents
 import sys
-import docx
-import unicodedata
-from llama_index.core import (
-    Document,
-    VectorStoreIndex,
-    Settings
-)
-from llama_index.embeddings.ollama import OllamaEmbedding
-from llama_index.llms.ollama import Ollama
+from llama_index.core import VectorStoreIndex
 from llama_index.vector_stores.chroma import ChromaVectorStore
-import chromadb
 
 
 class CREG:
-    def __init__(self, url: str = "https://creg.gov.co/loader.php?lServicio=Documentos&lFuncion=infoCategoriaConsumo&tipo=RE"):
+    def __init__(
+        self,
+        url: str = "https://creg.gov.co/loader.php?lServicio=Documentos&lFuncion=infoCategoriaConsumo&tipo=RE",
+        embedding_model=None,
+        llm=None,
+    ):
         self.url = url
         self.data_path = "src/creg/data"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36"
         }
-        self.month_index_translation = {
-            "DIC": "DEC",
-            "NOV": "NOV",
-            "OCT": "OCT",
-            "SEP": "SEP",
-            "AGO": "AUG",
-            "JUL": "JUL",
-            "JUN": "JUN",
-            "MAY": "MAY",
-            "ABR": "APR",
-            "MAR": "MAR",
-            "FEB": "FEB",
-            "ENE": "JAN",
-        }
-        self.embedding_model = OllamaEmbedding(
-            model_name="mxbai-embed-large",
-            base_url="http://localhost:11434",
-            ollama_additional_kwargs={"mirostat": 0},
+        self.month_index_translation = MONTH_INDEX_TRANSLATION
+        # Created on first use, building the object to query the index does not need requests
+        self._downloader = None
+        self.registry = DocumentRegistry(
+            "creg", os.path.join(self.data_path, "document_registry.db")
+        )
+        self.corpus = CorpusStore(
+            f"{self.data_path}/processed",
+            # Previous versions of CREG and UPME wrote the same file, split by source
+            legacy_json="src/creg/data/processed/resolutions_processed.json",
+            source="creg",
         )
-        Settings.embed_model = self.embedding_model
-        self.llm = Ollama(model="llama3.2:3b", request_timeout=120.0)
-        Settings.llm = self.llm
+        # Models shared by every CREG/UPME object and Streamlit session of the process
+        self.embedding_model = embedding_model or get_embedding_model()
+        self.llm = llm or get_llm()
+
+    @property
+    def downloader(self):
+        """
+        Pooled downloader of the CREG documents, created on first use
+
+        Returns:
+            downloader (Downloader): Downloader with the validators of previous runs
+        """
+        if self._downloader is None:
+            from utils.downloader import Downloader
+
+            self._downloader = Downloader(
+                headers=self.headers,
+                validators_path=os.path.join(self.data_path, "download_validators.json"),
+            )
+        return self._downloader
 
     def detect_file_links(self):
         """ Detects file links from CREG website and returns 10 last resolutions
@@ -58,6 +66,9 @@ class CREG:
             None
         """
         try:
+            import requests
+            from bs4 import BeautifulSoup
+
             response = requests.get(self.url, headers=self.headers, timeout=10)
             soup = BeautifulSoup(response.text, "html.parser")
             links = soup.find_all("a", href=True)
@@ -73,7 +84,9 @@ class CREG:
 
     def download_documents(self, documents: list) -> bool:
         """
-        Downloads the documents from the CREG website
+        Downloads the documents from the CREG website, skipping the ones the server reports
+        as unchanged since the last download. Downloaded files whose content was already
+        processed are removed, so only new or changed resolutions reach process_documents
 
         Args:
             documents (list): List of dictionaries containing the title and url of the document
@@ -82,17 +95,24 @@ class CREG:
             sucess: True if the documents were downloaded successfully, False otherwise
         """
         try:
+            items = []
             for document in documents:
                 filename = f"{document['url'][-12:]}.docx"
                 filename = filename.replace("\\", "")
-                url = document["url"]
-                file_path = os.path.join(self.data_path, filename)
-                response = requests.get(url, headers=self.headers, timeout=10)
-                with open(file_path, "wb") as file:
-                    file.write(response.content)
-
-            logging.info(f"Downloaded latest 10 resolutions from CREG")
-            return True
+                items.append((document["url"], os.path.join(self.data_path, filename)))
+            results = self.downloader.download_many(items)
+
+            new = 0
+            for result in results:
+                if result.status != "downloaded":
+                    continue
+                filename = os.path.basename(result.path)
+                if self.registry.record_download(result.url, filename, result.content_hash):
+                    new += 1
+                else:
+                    os.remove(result.path)
+            logging.info(f"Downloaded {new} new or changed of {len(results)} resolutions from CREG")
+            return all(result.ok for result in results)
         except Exception as e:
             logging.error(f"Error downloading documents: {CustomException(e, sys)}")
             return False
@@ -107,76 +127,88 @@ class CREG:
         Returns:
             text (str): Text without accents
         """
-        return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+        return remove_accents(text)
 
-    def process_documents(self, documents: list) -> bool:
+    def process_documents(self, documents: list, workers: int = 1) -> bool:
         """
-        Processes the documents downloaded from the CREG website and get text and metadata
+        Processes the documents downloaded from the CREG website and get text and metadata.
+        Documents whose content is already in the registry are skipped, and the new ones
+        are appended to the corpus store. A document is marked as parsed and its file removed
+        only after its record is saved, so a stopped run leaves it for the next one
 
         Args:
-            documents (list): List of dictionaries containing the title and url of the document
+            documents (list): List of file names of the downloaded documents
+            workers (int): Number of processes parsing documents at the same time
 
         Returns:
             sucess: True if the documents were processed successfully, False otherwise
         """
-        resolutions = []
+        os.makedirs(f"{self.data_path}/processed", exist_ok=True)
+        os.makedirs(f"{self.data_path}/to_check", exist_ok=True)
+        candidates = {}
+        hashes = set()
+        skipped = 0
         for resolution in documents:
+            file_path = f"{self.data_path}/{resolution}"
             try:
-                doc = docx.Document(f"{self.data_path}/{resolution}")
-                resolution_metadata = {}
-                resolution_values_para = [0,1]
-
-                resolution_name = doc.paragraphs[resolution_values_para[0]].text
-                while not resolution_name.startswith("RESOLUCIÓN"):
-                    resolution_values_para[0] += 1
-                    resolution_name = doc.paragraphs[resolution_values_para[0]].text
-
-                resolution_name = self.remove_accents(resolution_name)
-
-                resolution_date = doc.paragraphs[resolution_values_para[1]].text
-                while not resolution_date.startswith("("):
-                    resolution_values_para[1] += 1
-                    resolution_date = doc.paragraphs[resolution_values_para[1]].text
-
-                resolution_concept = doc.paragraphs[resolution_values_para[1]+1].text
-                while resolution_concept == "":
-                    resolution_values_para[1] += 1
-                    resolution_concept = doc.paragraphs[resolution_values_para[1]+1].text
-
-                resolution_concept = self.remove_accents(resolution_concept)
-
-                resolution_date = resolution_date.replace("(", "").replace(")", "").replace(".", " ")
-                day, month, year = resolution_date.split()
-                month_en = self.month_index_translation.get(month, month)
-                date_english = f"{day} {month_en} {year}"
-                resolution_date = datetime.strptime(date_english, "%d %b %Y")
-
-                full_text = [p.text for p in doc.paragraphs]
-                full_text = [p for p in full_text if p]  # Remove empty paragraphs
-                full_text = [self.remove_accents(p) for p in full_text]
-                resolution_metadata = {
-                    "name": resolution_name,
-                    "resolution_date": resolution_date.strftime("%Y-%m-%d"),
-                    "concept": resolution_concept,
-                    "full_text": "\n".join(full_text),
-                    "process_date": datetime.now().strftime("%Y-%m-%d"),
-                }
-                resolutions.append(resolution_metadata)
-                # delete file
-                os.remove(f"{self.data_path}/{resolution}")
-                logging.info(f"Processed resolution: {resolution_metadata['name']}")    
-
+                content_hash = file_hash(file_path)
+                entry = self.registry.by_filename(resolution)
+                url = entry["url"] if entry else f"local:{resolution}"
+                # The same content under two URLs of the batch is parsed once
+                if not self.registry.needs_parsing(url, content_hash) or content_hash in hashes:
+                    os.remove(file_path)
+                    skipped += 1
+                    continue
             except Exception as e:
-                logging.error(f"Error processing documents: {CustomException(e, sys)}")
-                os.rename(f"{self.data_path}/{resolution}", f"{self.data_path}/to_check/{resolution}")
+                # Unreadable or missing file, the rest of the batch goes on
+                logging.error(f"Error reading document {resolution}: {CustomException(e, sys)}")
+                if os.path.exists(file_path):
+                    os.rename(file_path, f"{self.data_path}/to_check/{resolution}")
                 continue
+            hashes.add(content_hash)
+            candidates[file_path] = (resolution, url, content_hash)
+
+        resolutions = []
+        parsed = []
+        try:
+            for file_path, resolution_metadata, error in iter_parsed(
+                parse_resolution, list(candidates), workers=workers
+            ):
+                resolution, url, content_hash = candidates[file_path]
+                try:
+                    if error is not None:
+                        raise ValueError(error)
+                    resolution_metadata["url"] = url
+                    resolution_metadata["content_hash"] = content_hash
+                    parsed.append((file_path, url, content_hash, resolution_metadata["name"]))
+                    resolutions.append(resolution_metadata)
+
+                except Exception as e:
+                    logging.error(f"Error processing documents: {CustomException(e, sys)}")
+                    self.registry.mark_parsed(url, content_hash, error=str(e))
+                    os.rename(file_path, f"{self.data_path}/to_check/{resolution}")
+                    continue
+        except Exception as e:
+            # The process pool failed, documents not parsed yet stay for the next run
+            logging.error(f"Error parsing documents: {CustomException(e, sys)}")
 
         if resolutions:
-            file_name = f"resolutions_processed.json"
-            folder = f"{self.data_path}/processed"
-            file_path = os.path.join(folder, file_name)
-            with open(file_path, "w") as file:
-                json.dump(resolutions, file, indent=4, ensure_ascii=False)
+            try:
+                total = self.corpus.append(resolutions)
+            except Exception as e:
+                # Nothing is marked as parsed, the files stay for the next run
+                logging.error(f"Error saving processed resolutions: {CustomException(e, sys)}")
+                return False
+            # Marked as parsed only once their records are in the corpus
+            for file_path, url, content_hash, name in parsed:
+                self.registry.mark_parsed(url, content_hash, name=name)
+                # delete file
+                os.remove(file_path)
+                logging.info(f"Processed resolution: {name}")
+            logging.info(f"Processed {len(resolutions)} resolutions, {total} in total")
+            return True
+        elif skipped == len(documents):
+            logging.info(f"No new resolutions to process, {skipped} already processed")
             return True
         else:
             logging.error(f"No resolutions were processed")
@@ -193,25 +225,67 @@ class CREG:
             documents (list): List of documents modeled with llama index
         """
         try:
-            file_path = f"{self.data_path}/processed/resolutions_processed.json"
-            with open(file_path, "r", encoding="utf-8") as f:
-                resolutions = json.load(f)
-            documents = [
-                Document(
-                    text=resolution["full_text"],
-                    metadata={
-                        "name": resolution["name"],
-                        "date": resolution["resolution_date"],
-                        "concept": resolution["concept"],
-                    },
-                )
-                for resolution in resolutions
-            ]
-            return documents
+            return list(self.corpus.iter_documents())
         except Exception as e:
             logging.error(f"Error modeling resolution document: {CustomException(e, sys)}")
             return []
 
+    def iter_resolution_docs(self, keys: list = None):
+        """
+        Yields the resolution documents one at a time, so the corpus is never fully in memory
+
+        Args:
+            keys (list): Optional keys (url) of the resolutions, all by default
+
+        Returns:
+            documents (generator): Documents modeled with llama index
+        """
+        return self.corpus.iter_documents(keys)
+
+    def resolution_metadata(self) -> list:
+        """
+        Gets name, date and concept of every processed resolution without reading their text
+
+        Returns:
+            metadata (list): List of dictionaries with the metadata of the resolutions
+        """
+        return self.corpus.metadata()
+
+    def index_documents(
+        self, rebuild: bool = False, batch_size: int = 32, max_in_flight: int = 2
+    ) -> dict:
+        """
+        Chunks and embeds into the creg_index collection the resolutions that are new or
+        changed since the last run
+
+        Args:
+            rebuild (bool): Empty the collection and index every resolution again
+            batch_size (int): Chunks per request to the embedding model
+            max_in_flight (int): Requests to the embedding model running at the same time
+
+        Returns:
+            counts (dict): Documents indexed and chunks embedded, reused and deleted
+        """
+        try:
+            chroma_collection = get_chroma_client().get_or_create_collection("creg_index")
+            pipeline = IndexingPipeline(
+                "creg",
+                self.corpus,
+                self.registry,
+                chroma_collection,
+                self.embedding_model,
+                batch_size=batch_size,
+                max_in_flight=max_in_flight,
+            )
+            counts = pipeline.run(rebuild=rebuild)
+            cache = getattr(self.embedding_model, "cache", None)
+            if cache is not None:
+                logging.info(f"Embedding cache: {cache.stats()}")
+            return counts
+        except Exception as e:
+            logging.error(f"Error indexing CREG documents: {CustomException(e, sys)}")
+            return {}
+
     def get_creg_vector_store(self, documents: list) -> VectorStoreIndex:
         """
         Get the vector store for the CREG model
@@ -223,8 +297,7 @@ class CREG:
             index (VectorStoreIndex): Vector store index for the CREG model
         """
         try:
-            db2 = chromadb.PersistentClient(path="chroma_db")
-            chroma_collection = db2.get_or_create_collection("creg_index")
+            chroma_collection = get_chroma_client().get_or_create_collection("creg_index")
             vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
             index = VectorStoreIndex.from_vector_store(
                 vector_store,
@@ -246,7 +319,7 @@ class CREG:
             query_engine (QueryEngine): Query engine for the CREG model
         """
         try:
-            query_engine = index.as_query_engine()
+            query_engine = index.as_query_engine(llm=self.llm)
             return query_engine
         except Exception as e:
             logging.error(f"Error getting query engine: {CustomException(e, sys)}")
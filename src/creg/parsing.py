@@ -0,0 +1,87 @@
+import unicodedata
+from datetime import datetime
+
+MONTH_INDEX_TRANSLATION = {
+    "DIC": "DEC",
+    "NOV": "NOV",
+    "OCT": "OCT",
+    "SEP": "SEP",
+    "AGO": "AUG",
+    "JUL": "JUL",
+    "JUN": "JUN",
+    "MAY": "MAY",
+    "ABR": "APR",
+    "MAR": "MAR",
+    "FEB": "FEB",
+    "ENE": "JAN",
+}
+
+
+def remove_accents(text: str) -> str:
+    """
+    Removes accents from the text
+
+    Args:
+        text (str): Text to remove accents from
+
+    Returns:
+        text (str): Text without accents
+    """
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def parse_resolution(file_path: str) -> dict:
+    """
+    Gets the text and metadata of a CREG resolution in .docx format. Defined at module level,
+    with only python-docx as dependency, so process pool workers can import it cheaply.
+
+    Args:
+        file_path (str): Path to the .docx file
+
+    Returns:
+        dict: name, resolution_date, concept, full_text and process_date of the resolution
+
+    Raises:
+        Exception: If the document does not follow the layout of a resolution
+    """
+    # Only ingestion parses documents, importing this module does not need python-docx
+    import docx
+
+    doc = docx.Document(file_path)
+    resolution_values_para = [0, 1]
+
+    resolution_name = doc.paragraphs[resolution_values_para[0]].text
+    while not resolution_name.startswith("RESOLUCIÓN"):
+        resolution_values_para[0] += 1
+        resolution_name = doc.paragraphs[resolution_values_para[0]].text
+
+    resolution_name = remove_accents(resolution_name)
+
+    resolution_date = doc.paragraphs[resolution_values_para[1]].text
+    while not resolution_date.startswith("("):
+        resolution_values_para[1] += 1
+        resolution_date = doc.paragraphs[resolution_values_para[1]].text
+
+    resolution_concept = doc.paragraphs[resolution_values_para[1] + 1].text
+    while resolution_concept == "":
+        resolution_values_para[1] += 1
+        resolution_concept = doc.paragraphs[resolution_values_para[1] + 1].text
+
+    resolution_concept = remove_accents(resolution_concept)
+
+    resolution_date = resolution_date.replace("(", "").replace(")", "").replace(".", " ")
+    day, month, year = resolution_date.split()
+    month_en = MONTH_INDEX_TRANSLATION.get(month, month)
+    date_english = f"{day} {month_en} {year}"
+    resolution_date = datetime.strptime(date_english, "%d %b %Y")
+
+    full_text = [p.text for p in doc.paragraphs]
+    full_text = [p for p in full_text if p]  # Remove empty paragraphs
+    return {
+        "name": resolution_name,
+        "resolution_date": resolution_date.strftime("%Y-%m-%d"),
+        "concept": resolution_concept,
+        # Accents are removed once over the whole text instead of paragraph by paragraph
+        "full_text": remove_accents("\n".join(full_text)),
+        "process_date": datetime.now().strftime("%Y-%m-%d"),
+    }
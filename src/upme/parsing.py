@@ -0,0 +1,93 @@
+import re
+import unicodedata
+from datetime import datetime
+
+
+def remove_accents(text: str) -> str:
+    """
+    Removes accents from the text
+
+    Args:
+        text (str): Text to remove accents from
+
+    Returns:
+        text (str): Text without accents
+    """
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def extract_text_from_pdf(pdf_path: str) -> str:
+    """ Extracts text from a PDF file
+
+    Args:
+        pdf_path (str): Path to the PDF file
+
+    Returns:
+        str: Full text extracted from the PDF file
+    """
+    # Only ingestion parses documents, importing this module does not need PyPDF2
+    import PyPDF2
+
+    with open(pdf_path, "rb") as file:
+        reader = PyPDF2.PdfReader(file)
+        full_text = [p.extract_text() for p in reader.pages]
+        full_text = [p for p in full_text if p]  # Remove empty paragraphs
+
+    # Accents are removed once over the whole text instead of page by page
+    return remove_accents("\n".join(full_text))
+
+
+def extract_metadata(text: str) -> dict:
+    """ Extracts metadata from the text
+
+    Args:
+        text (str): Text to extract metadata from
+
+    Returns:
+        dict: Dictionary with the metadata extracted from the text
+    """
+    resolution_number = None
+    date = None
+    concept = None
+
+    # Buscar número de resolución (ejemplo: RESOLUCIÓN No. 000457 de 2024)
+    res_match = re.search(r"RESOLUCIÓN\s+No\.\s+\d+\s+de\s+\d{4}", text, re.IGNORECASE)
+    if res_match:
+        resolution_number = res_match.group()
+        resolution_number = remove_accents(resolution_number)
+
+    # Buscar fecha (ejemplo: 19-06-2024)
+    date_match = re.search(r"\d{2}-\d{2}-\d{4}", text)
+    if date_match:
+        date = date_match.group()
+        date = datetime.strptime(date, "%d-%m-%Y").strftime("%Y-%m-%d")
+
+    # Buscar concepto (usando comillas y heurística)
+    concept_match = re.search(r"“([^”]+)”", text)
+    if concept_match:
+        concept = concept_match.group(1)
+        concept = remove_accents(concept)
+
+    return {
+        "name": resolution_number,
+        "resolution_date": date,
+        "concept": concept,
+        "process_date": datetime.now().strftime("%Y-%m-%d"),
+    }
+
+
+def parse_resolution(pdf_path: str) -> dict:
+    """
+    Gets the text and metadata of a UPME resolution in PDF format. Defined at module level,
+    with only PyPDF2 as dependency, so process pool workers can import it cheaply.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+
+    Returns:
+        dict: name, resolution_date, concept, process_date and full_text of the resolution
+    """
+    full_text = extract_text_from_pdf(pdf_path)
+    metadata = extract_metadata(full_text)
+    metadata["full_text"] = full_text
+    return metadata
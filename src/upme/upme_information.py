@@ -1,117 +1,254 @@
-import requests
 import os
-import json
-from datetime import datetime
 from utils.logger import logging, CustomException
+from utils.document_registry import DocumentRegistry, file_hash
+from utils.corpus_store import CorpusStore
+from utils.indexing import IndexingPipeline
+from utils.resources import get_chroma_client, get_embedding_model, get_llm
+from utils.parallel_parse import iter_parsed
+from utils.browser import USER_AGENT, shared_browser, start_chrome
+from src.upme.parsing import (
+    extract_metadata,
+    extract_text_from_pdf,
+    parse_resolution,
+    remove_accents,
+)
 import sys
-import unicodedata
-from llama_index.core import Document, VectorStoreIndex, Settings
-from llama_index.embeddings.ollama import OllamaEmbedding
-from llama_index.llms.ollama import Ollama
+from llama_index.core import VectorStoreIndex
 from llama_index.vector_stores.chroma import ChromaVectorStore
-import chromadb
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import PyPDF2
-import re
+from urllib.parse import urljoin
+
+
+def search_result_rows(payload: dict) -> list:
+    """
+    Rows of a SharePoint search REST response as {property: value} dictionaries, for both
+    the odata=nometadata and odata=verbose formats
+
+    Args:
+        payload (dict): JSON response of /_api/search/query
+
+    Returns:
+        list: One dictionary per result, e.g. {"Path": ..., "Title": ...}
+    """
+    query = payload.get("d", {}).get("query", payload)
+    rows = query["PrimaryQueryResult"]["RelevantResults"]["Table"]["Rows"]
+    if isinstance(rows, dict):
+        rows = rows.get("results", [])
+    results = []
+    for row in rows:
+        cells = row["Cells"]
+        if isinstance(cells, dict):
+            cells = cells.get("results", [])
+        results.append({cell["Key"]: cell["Value"] for cell in cells})
+    return results
+
 
 class UPME:
-    def __init__(self, url: str = "https://www1.upme.gov.co/Entornoinstitucional/Biblioteca-juridica/Paginas/Resoluciones-UPME-Energia-electrica.aspx"):
-        self.data_path = "src/creg/data"
+    def __init__(
+        self,
+        url: str = "https://www1.upme.gov.co/Entornoinstitucional/Biblioteca-juridica/Paginas/Resoluciones-UPME-Energia-electrica.aspx",
+        search_url: str = None,
+        search_query: str = "IsDocument:1 FileExtension:pdf",
+        embedding_model=None,
+        llm=None,
+    ):
+        self.data_path = "src/upme/data"
         self.url = url
-        self.embedding_model = OllamaEmbedding(
-            model_name="mxbai-embed-large",
-            base_url="http://localhost:11434",
-            ollama_additional_kwargs={"mirostat": 0},
+        # SharePoint search REST endpoint of the site behind the page, which renders its
+        # results with JavaScript from this same API
+        self.search_url = search_url or f"{url.split('/Paginas/')[0]}/_api/search/query"
+        self.search_query = search_query
+        self.headers = {"User-Agent": USER_AGENT}
+        # Created on first use, building the object to query the index does not need requests
+        self._downloader = None
+        self.registry = DocumentRegistry(
+            "upme", os.path.join(self.data_path, "document_registry.db")
+        )
+        self.corpus = CorpusStore(
+            f"{self.data_path}/processed",
+            # Previous versions of CREG and UPME wrote the same file, split by source
+            legacy_json="src/creg/data/processed/resolutions_processed.json",
+            source="upme",
         )
-        Settings.embed_model = self.embedding_model
-        self.llm = Ollama(model="llama3.2:3b", request_timeout=120.0)
-        Settings.llm = self.llm
+        # Models shared by every CREG/UPME object and Streamlit session of the process
+        self.embedding_model = embedding_model or get_embedding_model()
+        self.llm = llm or get_llm()
 
-    def set_up_driver(self) -> webdriver.Chrome:
+    @property
+    def downloader(self):
         """
-        Sets up the Chrome driver for Selenium
+        Pooled downloader of the UPME documents, created on first use
+
+        Returns:
+            downloader (Downloader): Downloader with the validators of previous runs
+        """
+        if self._downloader is None:
+            from utils.downloader import Downloader
+
+            self._downloader = Downloader(
+                headers=self.headers,
+                validators_path=os.path.join(self.data_path, "download_validators.json"),
+            )
+        return self._downloader
+
+    def set_up_driver(self):
+        """
+        Sets up the Chrome driver for Selenium. get_pdf_links uses the shared browser
+        instead when it does not receive a driver
 
         Returns:
             driver (webdriver.Chrome): Chrome driver
         """
         try:
-            options = webdriver.ChromeOptions()
-            options.add_argument("--headless")  # Run in headless mode (optional)
-            options.add_argument("--no-sandbox")
-            options.add_argument("--disable-dev-shm-usage")
-            options.add_argument("start-maximized")
-            options.add_argument("disable-infobars")
-            options.add_argument("--disable-blink-features=AutomationControlled")
-            options.add_argument(
-                "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36"
-            )
-            driver = webdriver.Chrome(options=options)
-            return driver
+            return start_chrome()
         except Exception as e:
             logging.error(f"Error setting up driver: {CustomException(e, sys)}")
             return None
 
-    def get_pdf_links(self, driver) -> list:
+    def get_pdf_links(self, driver=None) -> list:
         """
-        Gets the PDF links from the CREG website
+        Gets the PDF links from the UPME website with Selenium
 
         Args:
-            driver (webdriver.Chrome): Chrome driver
+            driver (webdriver.Chrome): Chrome driver. Defaults to the browser shared by the
+                process, kept alive between runs
         
         Returns:
             pdf_links (list): List of PDF links
         """
         try:
-            driver.get(self.url)
-            WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-            pdf_links = [
-                element.get_attribute("href")
-                for element in driver.find_elements(
-                    By.CSS_SELECTOR, "a.ms-srch-item-link"
-                )
-            ]
+            from selenium.webdriver.common.by import By
+            from selenium.webdriver.support import expected_conditions as EC
+            from selenium.webdriver.support.ui import WebDriverWait
+
+            if driver is None:
+                with shared_browser.page(self.url, "a.ms-srch-item-link") as shared_driver:
+                    pdf_links = [
+                        element.get_attribute("href")
+                        for element in shared_driver.find_elements(
+                            By.CSS_SELECTOR, "a.ms-srch-item-link"
+                        )
+                    ]
+            else:
+                driver.get(self.url)
+                WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+                pdf_links = [
+                    element.get_attribute("href")
+                    for element in driver.find_elements(
+                        By.CSS_SELECTOR, "a.ms-srch-item-link"
+                    )
+                ]
             pdf_links = [link for link in pdf_links if link.endswith(".pdf")]
             return pdf_links
         except Exception as e:
             logging.error(f"Error detecting file links: {CustomException(e, sys)}")
             return []
 
-    def quit_driver(self, driver: webdriver.Chrome):
+    def get_pdf_links_http(self, row_limit: int = 10) -> list:
+        """
+        Gets the PDF links without a browser: from the static HTML of the page when it
+        already contains the results, otherwise from the SharePoint search API behind it
+
+        Args:
+            row_limit (int): Number of results asked to the search API
+
+        Returns:
+            pdf_links (list): List of PDF links, empty if neither source returned any
+        """
+        try:
+            from bs4 import BeautifulSoup
+
+            response = self.downloader.session.get(self.url, timeout=10)
+            response.raise_for_status()
+            soup = BeautifulSoup(response.text, "html.parser")
+            pdf_links = [
+                urljoin(self.url, link["href"])
+                for link in soup.select("a.ms-srch-item-link[href]")
+            ]
+            pdf_links = [link for link in pdf_links if link.endswith(".pdf")]
+            if pdf_links:
+                return pdf_links
+
+            response = self.downloader.session.get(
+                self.search_url,
+                params={
+                    "querytext": f"'{self.search_query}'",
+                    "selectproperties": "'Path,Title,LastModifiedTime'",
+                    "sortlist": "'LastModifiedTime:descending'",
+                    "rowlimit": row_limit,
+                },
+                headers={"Accept": "application/json;odata=nometadata"},
+                timeout=10,
+            )
+            response.raise_for_status()
+            pdf_links = [row.get("Path") or "" for row in search_result_rows(response.json())]
+            return [link for link in pdf_links if link.endswith(".pdf")]
+        except Exception as e:
+            logging.error(f"Error detecting file links over HTTP: {CustomException(e, sys)}")
+            return []
+
+    def list_pdf_links(self, mode: str = "auto") -> list:
+        """
+        Gets the PDF links from the UPME website
+
+        Args:
+            mode (str): 'http' to never start a browser, 'browser' to always use Selenium,
+                'auto' to use Selenium only when the HTTP listing finds nothing
+
+        Returns:
+            pdf_links (list): List of PDF links
+        """
+        pdf_links = [] if mode == "browser" else self.get_pdf_links_http()
+        if not pdf_links and mode != "http":
+            logging.info("Listado HTTP sin resultados, usando el navegador")
+            pdf_links = self.get_pdf_links()
+        return pdf_links
+
+    def quit_driver(self, driver=None):
         """
         Quits the Chrome driver
 
         Args:
-            driver (webdriver.Chrome): Chrome driver
+            driver (webdriver.Chrome): Chrome driver. Defaults to the shared browser
         """
         try:
-            driver.quit()
+            if driver is None:
+                shared_browser.close()
+            else:
+                driver.quit()
         except Exception as e:
             logging.error(f"Error quitting driver: {CustomException(e, sys)}")
 
     def download_documents(self, link_list: list) -> bool:
         """
-        Downloads the documents from the UPME website
+        Downloads the documents from the UPME website, skipping the ones the server reports
+        as unchanged since the last download. Downloaded files whose content was already
+        processed are removed, so only new or changed resolutions reach process_documents
 
         Args:
-            documents (list): List of dictionaries containing the title and url of the document
+            link_list (list): List of PDF links
 
         Returns:
             sucess: True if the documents were downloaded successfully, False otherwise
         """
         try:
+            items = []
             for link in link_list:
                 filename = link[-26:]
                 filename = filename.replace("/", "-")
-                file_path = os.path.join(self.data_path, filename)
-                response = requests.get(link, timeout=10)
-                with open(file_path, "wb") as file:
-                    file.write(response.content)
-
-            logging.info(f"Downloaded latest 10 resolutions from CREG")
-            return True
+                items.append((link, os.path.join(self.data_path, filename)))
+            results = self.downloader.download_many(items)
+
+            new = 0
+            for result in results:
+                if result.status != "downloaded":
+                    continue
+                filename = os.path.basename(result.path)
+                if self.registry.record_download(result.url, filename, result.content_hash):
+                    new += 1
+                else:
+                    os.remove(result.path)
+            logging.info(f"Downloaded {new} new or changed of {len(results)} resolutions from UPME")
+            return all(result.ok for result in results)
         except Exception as e:
             logging.error(f"Error downloading documents: {CustomException(e, sys)}")
             return False
@@ -126,7 +263,7 @@ class UPME:
         Returns:
             text (str): Text without accents
         """
-        return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+        return remove_accents(text)
 
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """ Extracts text from a PDF file
@@ -137,13 +274,7 @@ class UPME:
         Returns:
             str: Full text extracted from the PDF file
         """
-        with open(pdf_path, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
-            full_text = [p.extract_text() for p in reader.pages]
-            full_text = [p for p in full_text if p]  # Remove empty paragraphs
-            full_text = [self.remove_accents(p) for p in full_text]
-
-        return "\n".join(full_text)
+        return extract_text_from_pdf(pdf_path)
 
     def extract_metadata(self, text: str) -> dict:
         """ Extracts metadata from the text
@@ -154,67 +285,87 @@ class UPME:
         Returns:
             dict: Dictionary with the metadata extracted from the text
         """
-        resolution_number = None
-        date = None
-        concept = None
-
-        # Buscar número de resolución (ejemplo: RESOLUCIÓN No. 000457 de 2024)
-        res_match = re.search(r"RESOLUCIÓN\s+No\.\s+\d+\s+de\s+\d{4}", text, re.IGNORECASE)
-        if res_match:
-            resolution_number = res_match.group()
-            resolution_number = self.remove_accents(resolution_number)
-
-        # Buscar fecha (ejemplo: 19-06-2024)
-        date_match = re.search(r"\d{2}-\d{2}-\d{4}", text)
-        if date_match:
-            date = date_match.group()
-            date = datetime.strptime(date, "%d-%m-%Y").strftime("%Y-%m-%d")
-
-        # Buscar concepto (usando comillas y heurística)
-        concept_match = re.search(r"“([^”]+)”", text)
-        if concept_match:
-            concept = concept_match.group(1)
-            concept = self.remove_accents(concept)
-
-        return {
-            "name": resolution_number,
-            "resolution_date": date,
-            "concept": concept,
-            "process_date": datetime.now().strftime("%Y-%m-%d"),
-        }
-
-    def process_documents(self, documents: list) -> bool:
-        """ Processes the documents downloaded from the CREG website and get text and metadata
+        return extract_metadata(text)
+
+    def process_documents(self, documents: list, workers: int = 1) -> bool:
+        """ Processes the documents downloaded from the UPME website and get text and metadata.
+        Documents whose content is already in the registry are skipped, and the new ones
+        are appended to the corpus store. A document is marked as parsed and its file removed
+        only after its record is saved, so a stopped run leaves it for the next one
 
         Args:
-            documents (list): List of dictionaries containing the title and url of the document
+            documents (list): List of file names of the downloaded documents
+            workers (int): Number of processes parsing documents at the same time
 
         Returns:
             bool: True if the documents were processed successfully, False otherwise
         """
-        resolutions = []
+        os.makedirs(f"{self.data_path}/processed", exist_ok=True)
+        os.makedirs(f"{self.data_path}/to_check", exist_ok=True)
+        candidates = {}
+        hashes = set()
+        skipped = 0
         for resolution in documents:
+            pdf_path = f"{self.data_path}/{resolution}"
             try:
-                pdf_path = f"{self.data_path}/{resolution}"
-                full_text = self.extract_text_from_pdf(pdf_path)
-                metadata = self.extract_metadata(full_text)
-                metadata["full_text"] = full_text
-                resolutions.append(metadata)
-                # delete file
-                os.remove(pdf_path)
-                logging.info(f"Processed resolution: {metadata['name']}")    
-
+                content_hash = file_hash(pdf_path)
+                entry = self.registry.by_filename(resolution)
+                url = entry["url"] if entry else f"local:{resolution}"
+                # The same content under two URLs of the batch is parsed once
+                if not self.registry.needs_parsing(url, content_hash) or content_hash in hashes:
+                    os.remove(pdf_path)
+                    skipped += 1
+                    continue
             except Exception as e:
-                logging.error(f"Error processing documents: {CustomException(e, sys)}")
-                os.rename(f"{self.data_path}/{resolution}", f"{self.data_path}/to_check/{resolution}")
+                # Unreadable or missing file, the rest of the batch goes on
+                logging.error(f"Error reading document {resolution}: {CustomException(e, sys)}")
+                if os.path.exists(pdf_path):
+                    os.rename(pdf_path, f"{self.data_path}/to_check/{resolution}")
                 continue
+            hashes.add(content_hash)
+            candidates[pdf_path] = (resolution, url, content_hash)
+
+        resolutions = []
+        parsed = []
+        try:
+            for pdf_path, metadata, error in iter_parsed(
+                parse_resolution, list(candidates), workers=workers
+            ):
+                resolution, url, content_hash = candidates[pdf_path]
+                try:
+                    if error is not None:
+                        raise ValueError(error)
+                    metadata["url"] = url
+                    metadata["content_hash"] = content_hash
+                    parsed.append((pdf_path, url, content_hash, metadata["name"]))
+                    resolutions.append(metadata)
+
+                except Exception as e:
+                    logging.error(f"Error processing documents: {CustomException(e, sys)}")
+                    self.registry.mark_parsed(url, content_hash, error=str(e))
+                    os.rename(pdf_path, f"{self.data_path}/to_check/{resolution}")
+                    continue
+        except Exception as e:
+            # The process pool failed, documents not parsed yet stay for the next run
+            logging.error(f"Error parsing documents: {CustomException(e, sys)}")
 
         if resolutions:
-            file_name = f"resolutions_processed.json"
-            folder = f"{self.data_path}/processed"
-            file_path = os.path.join(folder, file_name)
-            with open(file_path, "w") as file:
-                json.dump(resolutions, file, indent=4, ensure_ascii=False)
+            try:
+                total = self.corpus.append(resolutions)
+            except Exception as e:
+                # Nothing is marked as parsed, the files stay for the next run
+                logging.error(f"Error saving processed resolutions: {CustomException(e, sys)}")
+                return False
+            # Marked as parsed only once their records are in the corpus
+            for pdf_path, url, content_hash, name in parsed:
+                self.registry.mark_parsed(url, content_hash, name=name)
+                # delete file
+                os.remove(pdf_path)
+                logging.info(f"Processed resolution: {name}")
+            logging.info(f"Processed {len(resolutions)} resolutions, {total} in total")
+            return True
+        elif skipped == len(documents):
+            logging.info(f"No new resolutions to process, {skipped} already processed")
             return True
         else:
             logging.error(f"No resolutions were processed")
@@ -231,25 +382,67 @@ class UPME:
             documents (list): List of documents modeled with llama index
         """
         try:
-            file_path = f"{self.data_path}/processed/resolutions_processed.json"
-            with open(file_path, "r", encoding="utf-8") as f:
-                resolutions = json.load(f)
-            documents = [
-                Document(
-                    text=resolution["full_text"],
-                    metadata={
-                        "name": resolution["name"],
-                        "date": resolution["resolution_date"],
-                        "concept": resolution["concept"],
-                    },
-                )
-                for resolution in resolutions
-            ]
-            return documents
+            return list(self.corpus.iter_documents())
         except Exception as e:
             logging.error(f"Error modeling resolution document: {CustomException(e, sys)}")
             return []
 
+    def iter_resolution_docs(self, keys: list = None):
+        """
+        Yields the resolution documents one at a time, so the corpus is never fully in memory
+
+        Args:
+            keys (list): Optional keys (url) of the resolutions, all by default
+
+        Returns:
+            documents (generator): Documents modeled with llama index
+        """
+        return self.corpus.iter_documents(keys)
+
+    def resolution_metadata(self) -> list:
+        """
+        Gets name, date and concept of every processed resolution without reading their text
+
+        Returns:
+            metadata (list): List of dictionaries with the metadata of the resolutions
+        """
+        return self.corpus.metadata()
+
+    def index_documents(
+        self, rebuild: bool = False, batch_size: int = 32, max_in_flight: int = 2
+    ) -> dict:
+        """
+        Chunks and embeds into the upme_index collection the resolutions that are new or
+        changed since the last run
+
+        Args:
+            rebuild (bool): Empty the collection and index every resolution again
+            batch_size (int): Chunks per request to the embedding model
+            max_in_flight (int): Requests to the embedding model running at the same time
+
+        Returns:
+            counts (dict): Documents indexed and chunks embedded, reused and deleted
+        """
+        try:
+            chroma_collection = get_chroma_client().get_or_create_collection("upme_index")
+            pipeline = IndexingPipeline(
+                "upme",
+                self.corpus,
+                self.registry,
+                chroma_collection,
+                self.embedding_model,
+                batch_size=batch_size,
+                max_in_flight=max_in_flight,
+            )
+            counts = pipeline.run(rebuild=rebuild)
+            cache = getattr(self.embedding_model, "cache", None)
+            if cache is not None:
+                logging.info(f"Embedding cache: {cache.stats()}")
+            return counts
+        except Exception as e:
+            logging.error(f"Error indexing UPME documents: {CustomException(e, sys)}")
+            return {}
+
     def get_upme_vector_store(self, documents: list) -> VectorStoreIndex:
         """
         Get the vector store for the UPME model
@@ -261,8 +454,7 @@ class UPME:
             index (VectorStoreIndex): Vector store index for the UPME model
         """
         try:
-            db2 = chromadb.PersistentClient(path="chroma_db")
-            chroma_collection = db2.get_or_create_collection("upme_index")
+            chroma_collection = get_chroma_client().get_or_create_collection("upme_index")
             vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
             index = VectorStoreIndex.from_vector_store(
                 vector_store,
@@ -284,7 +476,7 @@ class UPME:
             query_engine (QueryEngine): Query engine for the UPME model
         """
         try:
-            query_engine = index.as_query_engine()
+            query_engine = index.as_query_engine(llm=self.llm)
             return query_engine
         except Exception as e:
             logging.error(f"Error getting query engine: {CustomException(e, sys)}")
@@ -0,0 +1,213 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils.logger import logging
+
+# (age of the end of the window, time to live): windows ending in the last days are revised by
+# XM and expire quickly, older ones are settled and kept until evicted
+TTL_RULES = [
+    (timedelta(days=7), timedelta(hours=1)),
+    (timedelta(days=60), timedelta(days=1)),
+]
+
+
+class CacheMiss(KeyError):
+    """
+    Raised in replay-only mode when a request is not available in the cache.
+    """
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        cache_dir: str = "src/xm_db/cache",
+        max_size_mb: float = 1024,
+        replay_only: bool = False,
+        ttl_rules: list = None,
+    ):
+        """
+        On-disk cache of XM API responses keyed by (metricId, Entity, start date, end date).
+
+        Frames are stored as Parquet files next to a small SQLite index holding their size,
+        expiration and last access, used for the least recently used eviction. The expiration
+        only applies to live runs, a replay-only cache serves every stored response.
+
+        Args:
+            cache_dir (str): Folder where the responses and the index are stored.
+            max_size_mb (float): Maximum size of the stored responses before evicting.
+            replay_only (bool): Never call the API, serve stored responses even if expired and
+                raise CacheMiss for uncached requests.
+            ttl_rules (list): (window age, ttl) pairs, see TTL_RULES.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = int(max_size_mb * 2**20)
+        self.replay_only = replay_only
+        self.ttl_rules = ttl_rules or TTL_RULES
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(
+            os.path.join(cache_dir, "index.db"), check_same_thread=False
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                metricId TEXT,
+                Entity TEXT,
+                start_date TEXT,
+                end_date TEXT,
+                size INTEGER,
+                created_at REAL,
+                expires_at REAL,
+                last_access REAL
+            )
+            """
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(metric_id: str, entity: str, start_date, end_date) -> tuple:
+        """
+        Returns the hash identifying a request and its window as ('YYYY-MM-DD', 'YYYY-MM-DD').
+        """
+        window = (
+            pd.Timestamp(start_date).strftime("%Y-%m-%d"),
+            pd.Timestamp(end_date).strftime("%Y-%m-%d"),
+        )
+        digest = hashlib.sha1("|".join((metric_id, entity, *window)).encode()).hexdigest()
+        return digest, window
+
+    def ttl_for(self, end_date: str, empty: bool = False):
+        """
+        Returns the time to live of a response given the end of its window, None for no expiration.
+        Empty responses always get the shortest time to live, XM may publish the data later.
+        """
+        if empty:
+            return self.ttl_rules[0][1]
+        age = datetime.now() - datetime.strptime(end_date, "%Y-%m-%d")
+        for max_age, ttl in self.ttl_rules:
+            if age <= max_age:
+                return ttl
+        return None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.parquet")
+
+    def _delete_file(self, key: str) -> None:
+        # Responses written by older versions were gzip compressed pickles
+        for path in (self._path(key), os.path.join(self.cache_dir, key[:2], f"{key}.pkl.gz")):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def get(self, metric_id: str, entity: str, start_date, end_date):
+        """
+        Returns the cached response of a request, None if it is missing, or expired when the
+        cache is not replay-only.
+        """
+        key, _ = self.make_key(metric_id, entity, start_date, end_date)
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            expired = row is not None and row[0] is not None and row[0] < now
+            if row is None or (expired and not self.replay_only):
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self.conn.commit()
+            self.hits += 1
+        try:
+            return pd.read_parquet(self._path(key))
+        except (OSError, ValueError) as err:
+            logging.warning(f"Respuesta en cache ilegible {key}: {err}")
+            self._remove(key)
+            return None
+
+    def put(self, metric_id: str, entity: str, start_date, end_date, df: pd.DataFrame) -> None:
+        """
+        Stores the response of a request and evicts the least recently used ones if the cache
+        grows past its maximum size.
+        """
+        key, (window_start, window_end) = self.make_key(metric_id, entity, start_date, end_date)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        df.to_parquet(temporary)
+        os.replace(temporary, path)
+
+        ttl = self.ttl_for(window_end, empty=df.empty)
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    metric_id,
+                    entity,
+                    window_start,
+                    window_end,
+                    os.path.getsize(path),
+                    now,
+                    now + ttl.total_seconds() if ttl is not None else None,
+                    now,
+                ),
+            )
+            self.conn.commit()
+            self._evict()
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.conn.commit()
+        self._delete_file(key)
+
+    def _evict(self) -> None:
+        """
+        Removes expired responses, then the least recently used ones until the cache fits in
+        its maximum size. Must be called holding the lock.
+        """
+        victims = {
+            key
+            for (key,) in self.conn.execute(
+                "SELECT key FROM responses WHERE expires_at IS NOT NULL AND expires_at < ?",
+                (time.time(),),
+            )
+        }
+        entries = self.conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access"
+        ).fetchall()
+        total = sum(size for key, size in entries if key not in victims)
+        for key, size in entries:
+            if total <= self.max_size:
+                break
+            if key not in victims:
+                victims.add(key)
+                total -= size
+
+        for key in victims:
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._delete_file(key)
+        if victims:
+            self.conn.commit()
+            logging.info(f"{len(victims)} respuestas eliminadas de la cache")
+
+    def stats(self) -> dict:
+        """
+        Returns the number of stored responses, their size and the hit/miss counters.
+        """
+        with self._lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"entries": entries, "size_bytes": size, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,149 @@
+import argparse
+from dataclasses import replace
+from datetime import date, datetime, timedelta
+
+from src.xm_db.database_client import DBClient
+from src.xm_db.ingestion_report import IngestionReport
+from utils.logger import logging
+
+# Days covered by each request, within the limits the XM API accepts per entity type
+WINDOW_DAYS = {
+    "HourlyEntities": 30,
+    "DailyEntities": 30,
+    "MonthlyEntities": 365,
+}
+
+
+def split_windows(start_date: date, end_date: date, window_days: int) -> list:
+    """
+    Splits a date range into consecutive windows of at most `window_days` days.
+
+    Args:
+        start_date (date): First day of the range.
+        end_date (date): Last day of the range, included.
+        window_days (int): Maximum number of days per window.
+
+    Returns:
+        list: (window_start, window_end) tuples covering the range without overlaps.
+
+    Example:
+        >>> len(split_windows(date(2024, 1, 1), date(2024, 3, 1), 30))
+        3
+    """
+    windows = []
+    window_start = start_date
+    while window_start <= end_date:
+        window_end = min(window_start + timedelta(days=window_days - 1), end_date)
+        windows.append((window_start, window_end))
+        window_start = window_end + timedelta(days=1)
+    return windows
+
+
+class Backfill:
+    def __init__(self, db_client: DBClient, window_days: dict = None):
+        """
+        Loads long historical ranges of XM data in API-sized windows that can be resumed.
+
+        Every finished window is recorded in backfill_windows together with its data, so a
+        backfill interrupted at any point continues where it stopped when run again.
+
+        Args:
+            db_client (DBClient): Client of the XM database.
+            window_days (dict): Days per request for every entity type. Defaults to WINDOW_DAYS.
+        """
+        self.db_client = db_client
+        self.window_days = window_days or WINDOW_DAYS
+
+    def completed_windows(self) -> set:
+        """
+        Returns the windows already loaded.
+
+        Returns:
+            set: (metricId, Entity, window_start, window_end) tuples with dates as 'YYYY-MM-DD'.
+        """
+        rows = self.db_client.conn.execute(
+            "SELECT metricId, Entity, window_start, window_end FROM backfill_windows WHERE status = 'done'"
+        ).fetchall()
+        return set(rows)
+
+    def plan(self, start_date: date, end_date: date, entity_types: list = None) -> list:
+        """
+        Builds one FetchTask per metric and window that is not complete yet.
+
+        Args:
+            start_date (date): First day to load.
+            end_date (date): Last day to load.
+            entity_types (list): Types of master_table to load. Defaults to every type in WINDOW_DAYS.
+
+        Returns:
+            list: The pending FetchTask objects, oldest window first.
+        """
+        entity_types = entity_types or list(self.window_days)
+        completed = self.completed_windows()
+        tasks = self.db_client.build_fetch_tasks(entity_types, start_date, end_date)
+        pending = []
+        skipped = 0
+        for task in tasks:
+            for window_start, window_end in split_windows(
+                start_date, end_date, self.window_days[task.entity_type]
+            ):
+                key = (task.metric_id, task.entity, window_start.isoformat(), window_end.isoformat())
+                if key in completed:
+                    skipped += 1
+                    continue
+                pending.append(
+                    replace(task, start_date=window_start, end_date=window_end, backfill=True)
+                )
+        pending.sort(key=lambda task: task.start_date)
+        logging.info(f"Backfill: {len(pending)} ventanas pendientes, {skipped} ya completas")
+        return pending
+
+    def run(
+        self,
+        start_date: date,
+        end_date: date,
+        entity_types: list = None,
+        **ingestion_options,
+    ) -> IngestionReport:
+        """
+        Loads every pending window between two dates.
+
+        Args:
+            start_date (date): First day to load.
+            end_date (date): Last day to load.
+            entity_types (list): Types of master_table to load.
+            **ingestion_options: Options of `DBClient.run_ingestion` (concurrent, bulk, commit_every, ...).
+
+        Returns:
+            IngestionReport: Summary of the run.
+        """
+        tasks = self.plan(start_date, end_date, entity_types)
+        return self.db_client.run_ingestion(tasks, **ingestion_options)
+
+
+def parse_date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga historica de metricas de XM por ventanas")
+    parser.add_argument("--start", required=True, type=parse_date)
+    parser.add_argument(
+        "--end", type=parse_date, default=datetime.now().date() - timedelta(days=1)
+    )
+    parser.add_argument("--types", nargs="+", choices=list(WINDOW_DAYS), default=None)
+    parser.add_argument("--concurrent", action="store_true")
+    parser.add_argument("--commit-every", type=int, default=20)
+    args = parser.parse_args()
+
+    db_client = DBClient()
+    report = Backfill(db_client).run(
+        args.start,
+        args.end,
+        args.types,
+        concurrent=args.concurrent,
+        bulk=True,
+        commit_every=args.commit_every,
+    )
+    print(report.summary())
+    db_client.close_connection()
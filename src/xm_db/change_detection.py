@@ -0,0 +1,111 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+KEY_COLUMNS = ["id_recurso", "Date"]
+
+
+@dataclass
+class RowDiff:
+    """
+    Differences between the stored rows of a metric and the rows just fetched for the same dates.
+
+    Attributes:
+        new (pandas.DataFrame): Fetched rows whose key is not stored.
+        updated (pandas.DataFrame): Fetched rows whose key is stored with other values, with the
+            rowid of the stored row in the `row_id` column.
+        deleted (pandas.DataFrame): Stored rows whose key was not fetched.
+        unchanged (int): Fetched rows identical to the stored ones.
+    """
+
+    new: pd.DataFrame
+    updated: pd.DataFrame
+    deleted: pd.DataFrame
+    unchanged: int
+
+    @property
+    def changed_dates(self) -> list:
+        """
+        Dates ('YYYY-MM-DD') of the new, updated and deleted rows.
+        """
+        return [*self.new["Date"], *self.updated["Date"], *self.deleted["Date"]]
+
+
+def _canonical(df: pd.DataFrame, columns: list, numeric: set) -> pd.DataFrame:
+    """
+    Casts the compared columns to the same dtypes on both sides, so equal values hash equal
+    whether they come from the API or from SQLite (float64 numbers, '' for missing text).
+    """
+    canonical = {}
+    for column in columns:
+        if column in numeric:
+            canonical[column] = pd.to_numeric(df[column], errors="coerce").astype(np.float64)
+        else:
+            canonical[column] = df[column].fillna("").astype(str)
+    return pd.DataFrame(canonical, index=df.index)
+
+
+def hash_rows(df: pd.DataFrame) -> np.ndarray:
+    """
+    Returns one uint64 hash per row of the frame, computed over its values only.
+    """
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def diff_rows(
+    stored: pd.DataFrame,
+    fetched: pd.DataFrame,
+    value_columns: list,
+    key_columns: list = None,
+) -> Optional[RowDiff]:
+    """
+    Compares the fetched rows of a metric with the stored ones by hashing the key and the
+    values of every row, without looping over the rows.
+
+    Args:
+        stored (pandas.DataFrame): Stored rows with a `row_id` column holding their rowid.
+        fetched (pandas.DataFrame): Normalized rows returned by the XM API.
+        value_columns (list): Columns compared to detect updates.
+        key_columns (list): Columns identifying a row of the metric. Defaults to KEY_COLUMNS.
+
+    Returns:
+        RowDiff: The rows to insert, update and delete, or None when a key is repeated on either
+        side and the rows can not be matched one to one.
+
+    Example:
+        >>> diff = diff_rows(stored, fetched, ["value", "metricName"])
+        >>> len(diff.new), len(diff.updated), len(diff.deleted), diff.unchanged
+    """
+    key_columns = key_columns or KEY_COLUMNS
+    numeric = {
+        column for column in value_columns if pd.api.types.is_numeric_dtype(fetched[column])
+    }
+
+    fetched_keys = hash_rows(_canonical(fetched, key_columns, set()))
+    stored_keys = hash_rows(_canonical(stored, key_columns, set()))
+    if pd.Index(fetched_keys).has_duplicates or pd.Index(stored_keys).has_duplicates:
+        return None
+
+    fetched_values = hash_rows(_canonical(fetched, value_columns, numeric))
+    stored_values = pd.Series(
+        hash_rows(_canonical(stored, value_columns, numeric)), index=stored_keys
+    )
+    stored_ids = pd.Series(stored["row_id"].to_numpy(), index=stored_keys)
+
+    is_stored = np.isin(fetched_keys, stored_keys)
+    # Only reindex keys present on both sides, a missing key would turn the uint64 hashes into floats
+    is_updated = np.zeros(len(fetched), dtype=bool)
+    is_updated[is_stored] = (
+        stored_values.reindex(fetched_keys[is_stored]).to_numpy() != fetched_values[is_stored]
+    )
+
+    updated = fetched[is_updated].copy()
+    updated["row_id"] = stored_ids.reindex(fetched_keys[is_updated]).to_numpy()
+    return RowDiff(
+        new=fetched[~is_stored],
+        updated=updated,
+        deleted=stored[~np.isin(stored_keys, fetched_keys)],
+        unchanged=int((is_stored & ~is_updated).sum()),
+    )
@@ -0,0 +1,179 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+import pandas as pd
+
+from src.xm_db.api_cache import CacheMiss
+from utils.logger import logging
+
+
+@dataclass
+class FetchTask:
+    """
+    A single metric request to the XM API.
+
+    Attributes:
+        record_id (int): id of the metric inside master_table.
+        metric_id (str): metricId used by the XM API.
+        metric_name (str): MetricName stored next to the values.
+        entity (str): Entity associated with the metric.
+        entity_type (str): Type of the metric in master_table (HourlyEntities, ListsEntities, ...).
+        table_name (str): Destination table of the data.
+        start_date: Start date of the request.
+        end_date: End date of the request.
+        backfill (bool): Whether the task is a window of a historical backfill.
+    """
+
+    record_id: int
+    metric_id: str
+    metric_name: str
+    entity: str
+    entity_type: str
+    table_name: str
+    start_date: object
+    end_date: object
+    backfill: bool = False
+
+    @property
+    def key(self) -> str:
+        return f"{self.metric_id}/{self.entity}"
+
+
+@dataclass
+class FetchResult:
+    """
+    Outcome of a FetchTask once all its attempts are done.
+
+    Attributes:
+        task (FetchTask): The task that was executed.
+        data (pandas.DataFrame): Data returned by the API, None if every attempt failed.
+        attempts (int): Number of requests sent to the API.
+        error (str): Last error message, None if the request succeeded.
+        elapsed (float): Seconds spent on the task, waits included.
+    """
+
+    task: FetchTask
+    data: Optional[pd.DataFrame]
+    attempts: int
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class RateLimiter:
+    """
+    Thread safe limiter that spaces calls to at most `requests_per_second`.
+    """
+
+    def __init__(self, requests_per_second: Optional[float] = None):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def acquire(self) -> None:
+        """
+        Blocks the calling thread until it is allowed to send a new request.
+        """
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ConcurrentFetcher:
+    def __init__(
+        self,
+        api_client,
+        max_workers: int = 8,
+        requests_per_second: Optional[float] = 5.0,
+        max_retries: int = 3,
+        backoff_seconds: float = 1.0,
+        backoff_factor: float = 2.0,
+    ):
+        """
+        Fetches many XM metrics at the same time with a bounded number of requests in flight.
+
+        Args:
+            api_client (XM_API): Client whose `fetch_data` method is called for every task.
+            max_workers (int): Maximum number of requests in flight.
+            requests_per_second (float): Global limit of requests sent to the API, None to disable it.
+            max_retries (int): Number of retries per metric after the first failed attempt.
+            backoff_seconds (float): Wait before the first retry.
+            backoff_factor (float): Multiplier applied to the wait on every new retry.
+        """
+        self.api_client = api_client
+        self.max_workers = max(1, max_workers)
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.backoff_factor = backoff_factor
+
+    def _backoff(self, attempt: int) -> float:
+        delay = self.backoff_seconds * self.backoff_factor ** (attempt - 1)
+        return delay + random.uniform(0, delay / 2)
+
+    def _fetch_one(self, task: FetchTask) -> FetchResult:
+        start = time.monotonic()
+        error = None
+        for attempt in range(1, self.max_retries + 2):
+            self.rate_limiter.acquire()
+            try:
+                data = self.api_client.fetch_data(
+                    task.metric_id, task.entity, task.start_date, task.end_date
+                )
+                return FetchResult(task, data, attempt, None, time.monotonic() - start)
+            except CacheMiss as err:
+                # Replay-only mode, retrying can not make the response appear
+                return FetchResult(task, None, attempt, str(err), time.monotonic() - start)
+            except Exception as err:
+                error = f"{type(err).__name__}: {err}"
+                logging.warning(
+                    f"Intento {attempt} fallido para {task.key}: {error}"
+                )
+                if attempt <= self.max_retries:
+                    time.sleep(self._backoff(attempt))
+
+        return FetchResult(task, None, attempt, error, time.monotonic() - start)
+
+    def fetch(self, tasks: Iterable[FetchTask]) -> Iterator[FetchResult]:
+        """
+        Runs the tasks and yields their results in completion order.
+
+        Only `max_workers` tasks are submitted at any time, so the results can be
+        consumed (e.g. written to SQLite) by the calling thread while the next
+        requests are in flight.
+
+        Args:
+            tasks (iterable): FetchTask objects to run.
+
+        Yields:
+            FetchResult: The result of every task, failed ones included.
+        """
+        pending_tasks = iter(tasks)
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="xm-fetch"
+        ) as executor:
+            in_flight = set()
+            for task in pending_tasks:
+                in_flight.add(executor.submit(self._fetch_one, task))
+                if len(in_flight) >= self.max_workers:
+                    break
+
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    next_task = next(pending_tasks, None)
+                    if next_task is not None:
+                        in_flight.add(executor.submit(self._fetch_one, next_task))
+                    yield future.result()
@@ -0,0 +1,116 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from utils.logger import logging
+
+
+class ReadOnlyPool:
+    def __init__(
+        self,
+        sql_db_path: str = "src/xm_db/dbs/test_xm_data.db",
+        size: int = 4,
+        mmap_size_mb: int = 256,
+        cache_size_mb: int = 64,
+        busy_timeout_ms: int = 5000,
+    ):
+        """
+        Pool of read-only connections to the XM database for serving queries from several
+        threads (Streamlit sessions, agent tools) while DBClient keeps the only writer.
+
+        The database must be in WAL mode, which DBClient sets when it opens it, so readers see
+        the last committed data and never wait for an ingestion run in progress.
+
+        Connections are opened on demand up to `size`; a thread asking for one when all are
+        busy waits until another thread returns its connection.
+
+        Args:
+            sql_db_path (str): Path to the SQLite database file.
+            size (int): Maximum number of open connections.
+            mmap_size_mb (int): Memory mapped size of every connection (PRAGMA mmap_size).
+            cache_size_mb (int): Page cache of every connection (PRAGMA cache_size).
+            busy_timeout_ms (int): Time a connection waits for a lock before failing.
+
+        Example:
+            >>> pool = ReadOnlyPool()
+            >>> with pool.connection() as conn:
+            ...     conn.execute("SELECT COUNT(*) FROM master_table").fetchone()
+        """
+        self.sql_db_path = sql_db_path
+        self.size = size
+        self.mmap_size = mmap_size_mb * 2**20
+        self.cache_size_kb = cache_size_mb * 1024
+        self.busy_timeout_ms = busy_timeout_ms
+        self._idle = queue.LifoQueue()
+        self._opened = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"file:{self.sql_db_path}?mode=ro", uri=True, check_same_thread=False
+        )
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {self.mmap_size}")
+        # Negative values are KiB instead of pages
+        conn.execute(f"PRAGMA cache_size = -{self.cache_size_kb}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+        return conn
+
+    def acquire(self, timeout: float = None) -> sqlite3.Connection:
+        """
+        Returns an idle connection, opening a new one if the pool is not full.
+
+        Raises:
+            queue.Empty: If no connection is returned to the pool within `timeout` seconds.
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._opened) < self.size:
+                conn = self._connect()
+                self._opened.append(conn)
+                logging.info(f"Conexion de lectura {len(self._opened)}/{self.size} abierta")
+                return conn
+        return self._idle.get(timeout=timeout)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """
+        Returns a connection to the pool, ending any read transaction left open.
+        """
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """
+        Lends a connection for the duration of the block.
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def read_sql(self, sql: str, params=None) -> pd.DataFrame:
+        """
+        Runs a query on a pooled connection and returns its rows as a DataFrame.
+        """
+        with self.connection() as conn:
+            return pd.read_sql(sql, conn, params=params)
+
+    def close(self) -> None:
+        """
+        Closes every connection opened by the pool.
+        """
+        with self._lock:
+            for conn in self._opened:
+                conn.close()
+            self._opened = []
+            self._idle = queue.LifoQueue()
@@ -1,21 +1,86 @@
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
 from utils.logger import logging, CustomException
 import sys
+import numpy as np
 import pandas as pd
 import warnings
+from dataclasses import replace
 from datetime import datetime, timedelta
+from typing import Optional
 from pydataxm.pydataxm import ReadDB
+from src.xm_db.api_cache import CacheMiss, ResponseCache
+from src.xm_db.change_detection import KEY_COLUMNS, diff_rows
+from src.xm_db.concurrent_fetch import ConcurrentFetcher, FetchResult, FetchTask
+from src.xm_db.connection_pool import ReadOnlyPool
+from src.xm_db.ingestion_report import IngestionReport
+from src.xm_db.metric_catalog import MetricCatalog
+from src.xm_db.migrations import migrate
+from src.xm_db.normalization import normalize_payload
+from src.xm_db.rollups import ROLLUP_TABLES, read_rollup, refresh_rollups
+from src.xm_db.timeseries import iter_record_batches, iter_series, read_series
 
 warnings.filterwarnings("ignore")
 
 class XM_API:
 
-    def __init__(self):
+    def __init__(self, api_object=None, cache: ResponseCache = None):
         """
         Initializes a new instance of the XM_API Cliente class.
+
+        Args:
+            api_object: Object with the `ReadDB` interface, e.g. `FakeReadDB` to run offline. Defaults to `ReadDB()`.
+            cache (ResponseCache): Optional on-disk cache of the responses of `fetch_data`.
+        """
+
+        self._api_object = api_object
+        self._api_lock = threading.Lock()
+        self.cache = cache
+
+    @property
+    def api_object(self):
+        # Created on first use so a replay-only cache never needs to reach the API
+        if self._api_object is None:
+            # The fetch workers can all arrive here on a cold start, only one builds it
+            with self._api_lock:
+                if self._api_object is None:
+                    self._api_object = ReadDB()
+        return self._api_object
+
+    def fetch_data(
+        self, metricId: str, Entity: str, fecha_ini, fecha_fin
+    ) -> pd.DataFrame:
         """
+        Retrieves data for a specific metric and entity from the XM API without handling errors,
+        so callers can decide whether to retry.
 
-        self.api_object = ReadDB()
+        Args:
+            metricId (str): The ID of the metric to retrieve data for.
+            Entity (str): The entity associated with the metric.
+            fecha_ini (str): The start date for the data range (format: 'YYYY-MM-DD').
+            fecha_fin (str): The end date for the data range (format: 'YYYY-MM-DD').
+
+        Returns:
+            pandas.DataFrame: A DataFrame containing the retrieved data.
+
+        Raises:
+            CacheMiss: If the cache is in replay-only mode and the request is not cached.
+        """
+        if self.cache is not None:
+            df_data = self.cache.get(metricId, Entity, fecha_ini, fecha_fin)
+            if df_data is not None:
+                return df_data
+            if self.cache.replay_only:
+                raise CacheMiss(f"{metricId}/{Entity} {fecha_ini} - {fecha_fin} no esta en cache")
+
+        df_data = self.api_object.request_data(metricId, Entity, fecha_ini, fecha_fin)
+        if df_data is None:
+            df_data = pd.DataFrame()
+        if self.cache is not None:
+            self.cache.put(metricId, Entity, fecha_ini, fecha_fin, df_data)
+        return df_data
 
     def get_data(
         self, metricId: str, Entity: str, fecha_ini, fecha_fin
@@ -40,16 +105,14 @@ class XM_API:
             >>> data = api.get_data('metric_123', 'entity_abc', '2023-01-01', '2023-01-31')
         """
         try:
-            df_data = self.api_object.request_data(
-                metricId, Entity, fecha_ini, fecha_fin
-            )
+            df_data = self.fetch_data(metricId, Entity, fecha_ini, fecha_fin)
             logging.info(
                 f"Datos obtenidos de {metricId} de {fecha_ini} hasta {fecha_fin} exitosamente."
             )
             return df_data
         except Exception as err:
             logging.error(f"Exception: {err}")
-            return pd.DataFrame
+            return pd.DataFrame()
         # raise CustomException(err, sys)
 
     def get_master_data(self) -> pd.DataFrame:
@@ -74,20 +137,62 @@ class XM_API:
         raise CustomException(err, sys)
 
 
+def to_iso_date(value) -> str:
+    """
+    Formats a date, datetime or date string as 'YYYY-MM-DD'.
+    """
+    return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+
 class DBClient:
-    def __init__(self, sql_db_path: str = "src/xm_db/dbs/test_xm_data.db"):
+    # Trailing days re-fetched after the watermark because XM keeps revising recent data
+    REVISION_DAYS = {
+        "HourlyEntities": 7,
+        "DailyEntities": 7,
+        "MonthlyEntities": 62,
+    }
+
+    ENTITY_TABLES = [
+        ("hourly_entity", "HourlyEntities"),
+        ("monthly_entity", "MonthlyEntities"),
+        ("daily_entity", "DailyEntities"),
+    ]
+
+    def __init__(
+        self,
+        sql_db_path: str = "src/xm_db/dbs/test_xm_data.db",
+        api_object=None,
+        cache: ResponseCache = None,
+        metric_index: bool = False,
+    ):
         """
         Initializes a new instance of the DB class.
 
         Args:
-            driver (str): The name of the ODBC driver to use.
-            server (str): The name or IP address of the SQL Server instance.
-            database_name (str): The name of the database to connect to.
+            sql_db_path (str): Path to the SQLite database file.
+            api_object: Object with the `ReadDB` interface used by the XM client, e.g. `FakeReadDB`. Defaults to `ReadDB()`.
+            cache (ResponseCache): Optional cache of the XM API responses, see `src.xm_db.api_cache`.
+            metric_index (bool): Keep the xm_metrics_index vector store of the catalog in sync,
+                it needs the Ollama embedding model.
         """
 
+        self.sql_db_path = sql_db_path
+        # Single writer connection, queries for serving go through `read_pool`
         self.conn = sqlite3.connect(sql_db_path)
+        self.schema_version = migrate(self.conn)
+        self.enable_wal()
+        self._read_pool = None
+        self.catalog = MetricCatalog(self.conn)
+        # MetricVectorStore over `catalog`, kept in sync by update_master_table
+        self.metric_vector_store = None
+        if metric_index:
+            # Imported here, it loads the shared embedding and Chroma resources
+            from src.xm_db.metric_vector_store import MetricVectorStore
+
+            self.metric_vector_store = MetricVectorStore(self.catalog)
         self.cursor = self.conn.cursor()
-        self.api_client = XM_API()
+        self.api_client = XM_API(api_object, cache)
+        self._bulk = False
 
     def get_connection(self) -> tuple:
         """
@@ -99,6 +204,75 @@ class DBClient:
 
         return self.cursor, self.conn
 
+    def enable_wal(self) -> None:
+        """
+        Switches the database to write-ahead logging with NORMAL synchronous mode, so a commit
+        appends to the WAL file instead of forcing an fsync of the main database file, and
+        readers keep reading the last committed data while this connection writes.
+        """
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    @property
+    def read_pool(self) -> ReadOnlyPool:
+        """
+        Pool of read-only connections to the same database, safe to share between threads.
+        """
+        if self._read_pool is None:
+            self._read_pool = ReadOnlyPool(self.sql_db_path)
+        return self._read_pool
+
+    def commit(self) -> None:
+        """
+        Commits the pending writes, unless they belong to an open bulk transaction.
+        """
+        if not self._bulk:
+            self.conn.commit()
+
+    @contextmanager
+    def bulk_transaction(self):
+        """
+        Groups every write done inside the block in a single transaction that is committed
+        on exit and rolled back if the block raises.
+
+        Example:
+            >>> with db_client.bulk_transaction():
+            ...     db_client.delete_last_rows(start, end, "daily_entity", 1)
+            ...     db_client.insert_data("daily_entity", df)
+        """
+        if self._bulk:
+            yield
+            return
+        self._bulk = True
+        try:
+            yield
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self._bulk = False
+
+    @contextmanager
+    def metric_savepoint(self):
+        """
+        Inside a bulk transaction, wraps the writes of a single metric in a savepoint so a
+        failing metric is undone without losing the rest of the run. Does nothing otherwise.
+        """
+        if not self._bulk:
+            yield
+            return
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        self.conn.execute("SAVEPOINT metric_write")
+        try:
+            yield
+        except Exception:
+            self.conn.execute("ROLLBACK TO metric_write")
+            self.conn.execute("RELEASE metric_write")
+            raise
+        self.conn.execute("RELEASE metric_write")
+
     def insert_data(self, table_name: str, df: pd.DataFrame) -> None:
         """
         Inserts data from a pandas DataFrame into a SQL Server table.
@@ -112,15 +286,15 @@ class DBClient:
         """
 
         try:
-            df["Date"] = df["Date"].astype(str)
+            if "Date" in df.columns:
+                df["Date"] = pd.to_datetime(df["Date"]).dt.strftime("%Y-%m-%d")
 
-            rows = [tuple(x) for x in df.values]
             placeholders = ", ".join(["?"] * len(df.columns))
             columns = ", ".join(df.columns)
             sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-            self.cursor.executemany(sql, rows)
-            self.conn.commit()
-            logging.info(f"Datos guardados exitosamente de la metrica {df['id'][0]}.")
+            self.cursor.executemany(sql, df.itertuples(index=False, name=None))
+            self.commit()
+            logging.info(f"Datos guardados exitosamente en {table_name}.")
 
         except Exception as err:
             logging.error(f"Exception: {err}")
@@ -157,10 +331,11 @@ class DBClient:
         record_id: int,
     ) -> None:
         """
-        Delete rows from the specified table for the given metric ID and the specified date and the two preceding dates.
+        Delete rows from the specified table for the given metric ID between two dates, both included.
 
         Args:
             initial_date (datetime): The starting date from which to delete rows.
+            final_date (datetime): The last date to delete rows from.
             table_name (str): The name of the table from which to delete rows.
             record_id (int): The ID of the metric to be deleted.
 
@@ -171,50 +346,43 @@ class DBClient:
             CustomException: If an error occurs during the database operation, it raises a CustomException with the original error and context information.
         """
         try:
-            string_fechas = self.generate_dates(initial_date, final_date)
-            sql = f"DELETE FROM {table_name} WHERE id = {record_id} and date in ({string_fechas})"
-            self.conn.execute(sql)
-            self.conn.commit()
+            sql = f"DELETE FROM {table_name} WHERE id = ? AND date >= ? AND date < ?"
+            self.conn.execute(
+                sql,
+                (
+                    record_id,
+                    initial_date.strftime("%Y-%m-%d"),
+                    (final_date + timedelta(days=1)).strftime("%Y-%m-%d"),
+                ),
+            )
+            self.commit()
         except Exception as err:
             logging.error(f"Exception: {err}")
             raise CustomException(err, sys) from err
 
-    def update_list_entities(self, start_date: datetime, end_date: datetime):
+    def update_list_entities(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        **ingestion_options,
+    ) -> IngestionReport:
         """
         Update all the metrics considered list of entities inside the database.
 
         Args:
             start_date (datetime): Start date to get the data.
             end_date (datetime): Final date to get the data.
+            **ingestion_options: Options of `run_ingestion` (concurrent, max_workers, bulk, ...).
 
         Returns:
-            None
+            IngestionReport: Summary of the run, including the metrics that failed.
 
         Raises:
             CustomException: If an error occurs during the database operation, it raises a CustomException with the original error and context information.
         """
         try:
-            df_metrics = pd.read_sql(
-                "SELECT id, metricId, MetricName, Entity FROM master_table WHERE Type = 'ListsEntities' ",
-                self.conn,
-            )
-            df_metrics = df_metrics[df_metrics["metricId"] != "ListadoMetricas"]
-            for index, record in df_metrics.iterrows():
-                df_variable = self.api_client.get_data(
-                    record["metricId"], record["Entity"], start_date, end_date
-                )
-
-                if not df_variable.empty:
-                    df_variable = df_variable.fillna("").drop("Id", axis=1)
-                    df_variable["id"] = record["id"]
-                    df_variable["metricName"] = record["MetricName"]
-                    name = record["metricId"]
-
-                    if record["metricId"] == "ListadoRecursos":
-                        name = "ListadoRecursos_" + record["Entity"]
-
-                    self.delete_list_entities(record["id"], name)
-                    self.insert_data(name, df_variable)
+            tasks = self.build_fetch_tasks(["ListsEntities"], start_date, end_date)
+            return self.run_ingestion(tasks, **ingestion_options)
         except Exception as err:
             logging.error(f"Exception: {err}")
             raise CustomException(err, sys) from err
@@ -234,19 +402,20 @@ class DBClient:
             CustomException: If an error occurs during the database operation, it raises a CustomException with the original error and context information.
         """
         try:
-            sql = f"DELETE FROM {table_name} WHERE id = {record_id}"
-            self.conn.execute(sql)
-            self.conn.commit()
+            sql = f"DELETE FROM {table_name} WHERE id = ?"
+            self.conn.execute(sql, (record_id,))
+            self.commit()
         except Exception as err:
             logging.error(f"Exception: {err}")
             raise CustomException(err, sys) from err
 
-    def get_metric_id(self, metric_name: str) -> tuple:
+    def get_metric_id(self, metric_name: str, entity: str = None) -> tuple:
         """
-        Retrieves the ID and name of a metric from the master_table.
+        Retrieves the ID and name of a metric from the in-memory metric catalog.
 
         Args:
-            metric_name (str): The name of the metric to retrieve.
+            metric_name (str): The metricId of the metric to retrieve.
+            entity (str): Optional entity, for metrics registered for several entities.
 
         Returns:
             tuple: A tuple containing the metric ID and name, or (None, None) if not found.
@@ -255,129 +424,589 @@ class DBClient:
             CustomException: If an error occurs during the data retrieval process.
         """
         try:
-            self.cursor.execute(
-                "SELECT id, MetricName FROM master_table WHERE metricId = ?",
-                metric_name,
-            )
-            metric_id = self.cursor.fetchone()
-            return metric_id[0], metric_id[1] if metric_id else None
+            record = self.catalog.get(metric_name, entity)
+            if record is None:
+                return None, None
+            return record.id, record.metric_name
         except Exception as err:
             logging.error(f"Exception: {err}")
             raise CustomException(err, sys) from err
 
-    def update_data(self, start_date: datetime, end_date: datetime) -> None:
+    def build_fetch_tasks(
+        self, entity_types: list, start_date: datetime, end_date: datetime
+    ) -> list:
         """
-        Update all the daily, monthly and hourly metrics inside their own tables
+        Builds one FetchTask per metric of the given types registered in master_table.
 
         Args:
+            entity_types (list): Types of master_table to include (HourlyEntities, ListsEntities, ...).
             start_date (datetime): Start date to get the data.
             end_date (datetime): Final date to get the data.
 
         Returns:
-            None
+            list: FetchTask objects in master_table order.
+        """
+        table_names = {
+            entity_type: table_name for table_name, entity_type in self.ENTITY_TABLES
+        }
+        tasks = []
+        for entity_type in entity_types:
+            for record in self.catalog.filter(type=entity_type):
+                if entity_type == "ListsEntities":
+                    if record.metric_id == "ListadoMetricas":
+                        continue
+                elif record.entity == "Enlace":
+                    continue
+
+                table_name = table_names.get(entity_type, record.metric_id)
+                if record.metric_id == "ListadoRecursos":
+                    table_name = "ListadoRecursos_" + record.entity
+                tasks.append(
+                    FetchTask(
+                        record.id,
+                        record.metric_id,
+                        record.metric_name,
+                        record.entity,
+                        entity_type,
+                        table_name,
+                        start_date,
+                        end_date,
+                    )
+                )
+        return tasks
 
-        Raises:
-            CustomException: If an error occurs during the data retrieval process.
+    def normalize_metric_data(
+        self, df_variable: pd.DataFrame, entity_type: str
+    ) -> pd.DataFrame:
         """
-        try:
-            tables_names = [
-                ("hourly_entity", "HourlyEntities"),
-                ("monthly_entity", "MonthlyEntities"),
-                ("daily_entity", "DailyEntities"),
-            ]
-            for table_name, entity_type in tables_names:
-                # Retrieve metrics for the current entity type
-                df_metrics = pd.read_sql(
-                    f"SELECT id, metricId, MetricName, Entity FROM master_table WHERE Type = '{entity_type}'",
+        Renames and combines the columns returned by the XM API to match the table of the entity type,
+        following the declarative mapping in `src.xm_db.normalization.ENTITY_SPECS`.
+
+        Args:
+            df_variable (pandas.DataFrame): Data returned by the XM API.
+            entity_type (str): Type of the metric in master_table (HourlyEntities, ListsEntities, ...).
+
+        Returns:
+            pandas.DataFrame: The normalized data.
+        """
+        return normalize_payload(df_variable, entity_type)
+
+    def write_metric_data(
+        self,
+        task: FetchTask,
+        df_variable: pd.DataFrame,
+        report: IngestionReport = None,
+        change_detection: bool = False,
+    ) -> int:
+        """
+        Replaces the stored rows of a metric with the data fetched from the XM API.
+
+        Args:
+            task (FetchTask): The task the data was fetched for.
+            df_variable (pandas.DataFrame): Non empty data returned by the XM API.
+            report (IngestionReport): Optional report where the time of every stage is added.
+            change_detection (bool): Write only the rows that differ from the stored ones, see
+                `write_changed_rows`. Lists are always replaced.
+
+        Returns:
+            int: Number of rows inserted or updated.
+        """
+        report = report or IngestionReport()
+        with report.time_stage("normalize"):
+            df_variable = self.normalize_metric_data(df_variable, task.entity_type)
+            # Add additional columns
+            df_variable["id"] = task.record_id
+            df_variable["metricName"] = task.metric_name
+
+        changes = None
+        if change_detection and task.entity_type != "ListsEntities":
+            changes = self.write_changed_rows(task, df_variable, report)
+
+        if changes is None:
+            with report.time_stage("delete"):
+                if task.entity_type == "ListsEntities":
+                    self.delete_list_entities(task.record_id, task.table_name)
+                else:
+                    self.delete_last_rows(
+                        df_variable.Date.min().date(),
+                        df_variable.Date.max().date(),
+                        task.table_name,
+                        task.record_id,
+                    )
+
+            with report.time_stage("insert"):
+                self.insert_data(task.table_name, df_variable)
+            rows = len(df_variable)
+            changed_dates = [] if task.entity_type == "ListsEntities" else df_variable.Date
+        else:
+            rows, changed_dates = changes
+
+        if len(changed_dates):
+            with report.time_stage("rollup"):
+                refresh_rollups(
                     self.conn,
+                    task.table_name,
+                    task.record_id,
+                    min(changed_dates),
+                    max(changed_dates),
                 )
+                self.commit()
+        if changes is None or len(changed_dates):
+            self.bump_table_versions([task.table_name, *ROLLUP_TABLES.get(task.table_name, [])])
+        return rows
+
+    def write_changed_rows(
+        self, task: FetchTask, df_variable: pd.DataFrame, report: IngestionReport
+    ) -> Optional[tuple]:
+        """
+        Compares the normalized data of a metric with the rows stored for the same dates and
+        only inserts, updates or deletes the rows that differ. Unchanged rows are not touched.
 
-                df_metrics = df_metrics[df_metrics["Entity"] != "Enlace"]
+        Args:
+            task (FetchTask): The task the data was fetched for.
+            df_variable (pandas.DataFrame): Normalized data with the id and metricName columns.
+            report (IngestionReport): Report where the row counts and stage times are added.
 
-                # Process each record
-                for _, record in df_metrics.iterrows():
-                    df_variable = self.api_client.get_data(
-                        record["metricId"], record["Entity"], start_date, end_date
+        Returns:
+            tuple: (rows inserted or updated, dates of the changed rows), or None when the rows
+            can not be matched one to one and the metric has to be replaced.
+        """
+        df_variable = df_variable.assign(
+            Date=pd.to_datetime(df_variable["Date"]).dt.strftime("%Y-%m-%d")
+        )
+        key_columns = [column for column in KEY_COLUMNS if column in df_variable.columns]
+        value_columns = [
+            column for column in df_variable.columns if column not in ("id", *key_columns)
+        ]
+        with report.time_stage("diff"):
+            stored = pd.read_sql(
+                f"SELECT rowid AS row_id, {', '.join(f'{c} AS {c}' for c in [*key_columns, *value_columns])} "
+                f"FROM {task.table_name} WHERE id = ? AND date >= ? AND date <= ?",
+                self.conn,
+                params=(task.record_id, df_variable.Date.min(), df_variable.Date.max()),
+            )
+            diff = diff_rows(stored, df_variable, value_columns, key_columns)
+        if diff is None:
+            logging.warning(f"Claves repetidas en {task.key}, se reemplazan todas sus filas")
+            return None
+
+        with report.time_stage("delete"):
+            self.conn.executemany(
+                f"DELETE FROM {task.table_name} WHERE rowid = ?",
+                ((int(row_id),) for row_id in diff.deleted["row_id"]),
+            )
+        with report.time_stage("update"):
+            assignments = ", ".join(f"{column} = ?" for column in value_columns)
+            self.conn.executemany(
+                f"UPDATE {task.table_name} SET {assignments} WHERE rowid = ?",
+                diff.updated[[*value_columns, "row_id"]].itertuples(index=False, name=None),
+            )
+        with report.time_stage("insert"):
+            if not diff.new.empty:
+                self.insert_data(task.table_name, diff.new)
+            self.commit()
+
+        report.add_changes(
+            unchanged=diff.unchanged,
+            updated=len(diff.updated),
+            new=len(diff.new),
+            deleted=len(diff.deleted),
+        )
+        return len(diff.new) + len(diff.updated), diff.changed_dates
+
+    def _series_table(self, metric_ids) -> str:
+        """
+        Returns the entity table holding the given metrics, which must share the same Type.
+        """
+        metric_ids = [metric_ids] if isinstance(metric_ids, (int, np.integer)) else metric_ids
+        metric_ids = [int(metric_id) for metric_id in metric_ids]
+        table_names = {entity_type: table_name for table_name, entity_type in self.ENTITY_TABLES}
+        types = set()
+        for metric_id in metric_ids:
+            record = self.catalog.by_id(metric_id)
+            if record is None:
+                raise KeyError(f"Metrica {metric_id} no existe en master_table")
+            types.add(record.type)
+        if len(types) != 1 or next(iter(types)) not in table_names:
+            raise ValueError(f"Las metricas deben ser de un solo tipo horario, diario o mensual: {types}")
+        return table_names[types.pop()]
+
+    def read_series(
+        self, metric_ids, start_date=None, end_date=None, id_recurso: list = None, chunk_rows: int = 20000
+    ) -> dict:
+        """
+        Reads the long series (one value per hour, day or month) of some metrics as NumPy
+        arrays, without building DataFrames, using a connection of `read_pool`.
+
+        Args:
+            metric_ids (int or list): ids of master_table, all of the same Type.
+            start_date: First date to read, included.
+            end_date: Last date to read, included.
+            id_recurso (list): Optional resources to keep.
+            chunk_rows (int): Stored rows fetched at a time.
+
+        Returns:
+            dict: 'id', 'id_recurso', 'timestamp' (datetime64[s]) and 'value' (float64) arrays.
+
+        Example:
+            >>> series = db_client.read_series(12, "2020-01-01", "2024-12-31")
+            >>> series["value"].mean()
+        """
+        table_name = self._series_table(metric_ids)
+        with self.read_pool.connection() as conn:
+            return read_series(
+                conn, metric_ids, start_date, end_date, id_recurso, table_name, chunk_rows
+            )
+
+    def iter_series(
+        self,
+        metric_ids,
+        start_date=None,
+        end_date=None,
+        id_recurso: list = None,
+        chunk_rows: int = 20000,
+        arrow: bool = False,
+    ):
+        """
+        Streams the long series of some metrics in chunks of NumPy arrays, or of
+        pyarrow.RecordBatch objects when `arrow` is set, keeping one chunk in memory at a time.
+
+        Yields:
+            dict or pyarrow.RecordBatch: The next chunk, ordered by id, id_recurso and date.
+        """
+        table_name = self._series_table(metric_ids)
+        options = dict(
+            start_date=start_date,
+            end_date=end_date,
+            id_recurso=id_recurso,
+            table_name=table_name,
+            chunk_rows=chunk_rows,
+        )
+        with self.read_pool.connection() as conn:
+            if arrow:
+                yield from iter_record_batches(conn, metric_ids, **options)
+            else:
+                yield from iter_series(conn, metric_ids, **options)
+
+    def bump_table_versions(self, table_names: list) -> None:
+        """
+        Increments the version of the given tables in table_versions, so the cached query
+        results read from them are discarded.
+
+        Args:
+            table_names (list): Tables whose rows were written.
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        self.conn.executemany(
+            """
+            INSERT INTO table_versions (table_name, version, updated_at) VALUES (?, 1, ?)
+            ON CONFLICT (table_name) DO UPDATE SET
+                version = version + 1,
+                updated_at = excluded.updated_at
+            """,
+            [(table_name, now) for table_name in table_names],
+        )
+        self.commit()
+
+    def get_rollup(
+        self, metric_id: int, start_date=None, end_date=None, level: str = "daily", id_recurso: str = None
+    ) -> pd.DataFrame:
+        """
+        Reads the daily or monthly aggregates (sum, mean, min, max, count) of a metric,
+        maintained by every ingestion for the dates it writes.
+
+        Args:
+            metric_id (int): id of the metric in master_table.
+            start_date: First day or month to read.
+            end_date: Last day or month to read.
+            level (str): 'daily' (hourly metrics) or 'monthly' (hourly and daily metrics).
+            id_recurso (str): Optional resource, '' for metrics without resources.
+
+        Returns:
+            pandas.DataFrame: One row per resource and day or month.
+        """
+        return read_rollup(self.conn, metric_id, start_date, end_date, level, id_recurso)
+
+    def apply_fetch_result(
+        self,
+        task: FetchTask,
+        df_variable,
+        report: IngestionReport,
+        change_detection: bool = False,
+    ) -> None:
+        """
+        Writes the data of a metric and records the outcome in the run report.
+
+        Args:
+            task (FetchTask): The task the data was fetched for.
+            df_variable (pandas.DataFrame): Data returned by the XM API.
+            report (IngestionReport): Report of the current run.
+            change_detection (bool): Write only the rows that changed, see `write_changed_rows`.
+        """
+        start = time.perf_counter()
+        if df_variable is None or df_variable.empty:
+            report.add_empty(task.key)
+            self.record_ingestion_state(task, "empty")
+            report.write_seconds += time.perf_counter() - start
+            return
+        try:
+            with self.metric_savepoint():
+                rows = self.write_metric_data(task, df_variable, report, change_detection)
+                last_date = df_variable["Date"].max() if "Date" in df_variable else None
+                self.record_ingestion_state(task, "ok", last_date, rows=rows)
+            report.add_success(task.key, rows)
+            report.add_written_range(task.table_name, task.record_id, task.start_date, task.end_date)
+        except Exception as err:
+            logging.error(f"Error guardando {task.key}: {err}")
+            report.add_failure(task.key, err, task.start_date, task.end_date)
+            self.record_ingestion_state(task, "failed", error=err)
+        finally:
+            report.write_seconds += time.perf_counter() - start
+
+    def record_ingestion_state(
+        self,
+        task: FetchTask,
+        status: str,
+        last_date=None,
+        error=None,
+        rows: int = 0,
+    ) -> None:
+        """
+        Stores the outcome of a task in ingestion_state, moving the watermark forward when the
+        fetched data reaches a later date, and in backfill_windows for backfill tasks.
+
+        Args:
+            task (FetchTask): The task the outcome belongs to.
+            status (str): 'ok', 'empty' or 'failed'.
+            last_date: Latest date present in the fetched data, None to keep the watermark.
+            error: Error of a failed task.
+            rows (int): Rows written by the task.
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        last_date = to_iso_date(last_date) if last_date is not None else None
+        self.conn.execute(
+            """
+            INSERT INTO ingestion_state (metricId, Entity, last_complete_date, last_run_at, last_status, last_error)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (metricId, Entity) DO UPDATE SET
+                last_complete_date = MAX(COALESCE(last_complete_date, ''), COALESCE(excluded.last_complete_date, '')),
+                last_run_at = excluded.last_run_at,
+                last_status = excluded.last_status,
+                last_error = excluded.last_error
+            """,
+            (task.metric_id, task.entity, last_date, now, status, str(error) if error else None),
+        )
+        if task.backfill:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO backfill_windows (metricId, Entity, window_start, window_end, status, rows, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    task.metric_id,
+                    task.entity,
+                    to_iso_date(task.start_date),
+                    to_iso_date(task.end_date),
+                    "failed" if status == "failed" else "done",
+                    rows,
+                    now,
+                ),
+            )
+        self.commit()
+
+    def get_watermarks(self) -> dict:
+        """
+        Returns the last complete date stored for every metric.
+
+        Returns:
+            dict: (metricId, Entity) -> last complete date as 'YYYY-MM-DD'.
+        """
+        rows = self.conn.execute(
+            "SELECT metricId, Entity, last_complete_date FROM ingestion_state "
+            "WHERE last_complete_date IS NOT NULL AND last_complete_date != ''"
+        ).fetchall()
+        return {(metric_id, entity): last_date for metric_id, entity, last_date in rows}
+
+    def plan_incremental(self, tasks: list, revision_days: dict = None) -> list:
+        """
+        Narrows every task to the range that is missing or may have been revised since the last run.
+
+        Metrics with a watermark start `revision_days` before it, even if that is earlier than the
+        requested start, so gaps left by failed runs are filled. Metrics without a watermark keep the
+        requested range, and metrics already complete past the requested end are skipped.
+
+        Ranges longer than one API window (e.g. after a stale watermark) are split into backfill
+        windows, recorded in backfill_windows as they finish, and the windows that failed in
+        previous runs are fetched again, so a long catch-up is resumable like a backfill.
+
+        Args:
+            tasks (list): FetchTask objects built for the requested range.
+            revision_days (dict): Days re-fetched per entity type. Defaults to REVISION_DAYS.
+
+        Returns:
+            list: The tasks that still have something to fetch.
+        """
+        # backfill imports this module
+        from src.xm_db.backfill import WINDOW_DAYS, split_windows
+
+        revision_days = revision_days or self.REVISION_DAYS
+        watermarks = self.get_watermarks()
+        failed_windows = {}
+        for metric_id, entity, window_start, window_end in self.conn.execute(
+            "SELECT metricId, Entity, window_start, window_end FROM backfill_windows "
+            "WHERE status = 'failed'"
+        ):
+            failed_windows.setdefault((metric_id, entity), []).append(
+                (pd.Timestamp(window_start).date(), pd.Timestamp(window_end).date())
+            )
+
+        planned = []
+        for task in tasks:
+            for window_start, window_end in failed_windows.get((task.metric_id, task.entity), []):
+                planned.append(
+                    replace(task, start_date=window_start, end_date=window_end, backfill=True)
+                )
+
+            watermark = watermarks.get((task.metric_id, task.entity))
+            if watermark is not None and task.entity_type in revision_days:
+                start = pd.Timestamp(watermark) - timedelta(
+                    days=revision_days[task.entity_type] - 1
+                )
+                if start.date() > pd.Timestamp(task.end_date).date():
+                    continue
+                task.start_date = start.date()
+
+            window_days = WINDOW_DAYS.get(task.entity_type)
+            start_date = pd.Timestamp(task.start_date).date()
+            end_date = pd.Timestamp(task.end_date).date()
+            if window_days is None or (end_date - start_date).days < window_days:
+                planned.append(task)
+                continue
+            for window_start, window_end in split_windows(start_date, end_date, window_days):
+                planned.append(
+                    replace(task, start_date=window_start, end_date=window_end, backfill=True)
+                )
+        logging.info(
+            f"Ingesta incremental: {len(planned)} solicitudes pendientes para {len(tasks)} metricas"
+        )
+        return planned
+
+    def _timed_commit(self, report: IngestionReport) -> None:
+        start = time.perf_counter()
+        with report.time_stage("commit"):
+            self.conn.commit()
+        report.write_seconds += time.perf_counter() - start
+
+    def _fetch_sequentially(self, tasks: list):
+        """
+        Fetches the tasks one after another, yielding a FetchResult for each of them.
+        """
+        for task in tasks:
+            start = time.perf_counter()
+            try:
+                df_variable = self.api_client.fetch_data(
+                    task.metric_id, task.entity, task.start_date, task.end_date
+                )
+                yield FetchResult(task, df_variable, 1, None, time.perf_counter() - start)
+            except Exception as err:
+                error = f"{type(err).__name__}: {err}"
+                yield FetchResult(task, None, 1, error, time.perf_counter() - start)
+
+    def run_ingestion(
+        self,
+        tasks: list,
+        concurrent: bool = False,
+        max_workers: int = 8,
+        requests_per_second: float = 5.0,
+        max_retries: int = 3,
+        bulk: bool = False,
+        commit_every: int = None,
+        change_detection: bool = False,
+    ) -> IngestionReport:
+        """
+        Fetches the data of every task and writes it to the database.
+
+        In concurrent mode a ConcurrentFetcher keeps up to `max_workers` requests in flight
+        while this thread, the only one touching SQLite, writes the results as they arrive.
+
+        In bulk mode the writes of the whole run go into one transaction (or one every
+        `commit_every` metrics) instead of two commits per metric.
+
+        Args:
+            tasks (list): FetchTask objects to run.
+            concurrent (bool): Fetch the metrics with a pool of concurrent requests.
+            max_workers (int): Maximum number of requests in flight when concurrent.
+            requests_per_second (float): Request rate limit when concurrent.
+            max_retries (int): Retries per metric when concurrent.
+            bulk (bool): Group the writes of the run in large transactions.
+            commit_every (int): In bulk mode, number of metrics per transaction. None for a single one.
+            change_detection (bool): Compare the fetched rows with the stored ones and only write
+                the differences instead of replacing every row of the fetched dates.
+
+        Returns:
+            IngestionReport: Summary of the run, including the metrics that failed and the write throughput.
+        """
+        report = IngestionReport()
+        if concurrent:
+            fetcher = ConcurrentFetcher(
+                self.api_client,
+                max_workers=max_workers,
+                requests_per_second=requests_per_second,
+                max_retries=max_retries,
+            )
+            results = fetcher.fetch(tasks)
+        else:
+            results = self._fetch_sequentially(tasks)
+
+        with self.bulk_transaction() if bulk else nullcontext():
+            for written, result in enumerate(results, start=1):
+                report.add_stage_time("fetch", result.elapsed)
+                if result.ok:
+                    self.apply_fetch_result(result.task, result.data, report, change_detection)
+                else:
+                    logging.error(f"No fue posible obtener {result.task.key}: {result.error}")
+                    report.add_failure(
+                        result.task.key, result.error, result.task.start_date, result.task.end_date
                     )
+                    self.record_ingestion_state(result.task, "failed", error=result.error)
+
+                if bulk and commit_every and written % commit_every == 0:
+                    self._timed_commit(report)
+            if bulk:
+                self._timed_commit(report)
+
+        report.finish()
+        logging.info(report.summary())
+        return report
+
+    def update_data(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        incremental: bool = False,
+        **ingestion_options,
+    ) -> IngestionReport:
+        """
+        Update all the daily, monthly and hourly metrics inside their own tables
+
+        Args:
+            start_date (datetime): Start date to get the data.
+            end_date (datetime): Final date to get the data.
+            incremental (bool): Fetch only the ranges missing or revisable after each metric watermark.
+            **ingestion_options: Options of `run_ingestion` (concurrent, max_workers, bulk, ...).
 
-                    if not df_variable.empty:
-                        df_variable = df_variable.fillna(0).drop(
-                            "Id", axis=1, errors="ignore"
-                        )
-
-                        # Rename and combine columns based on specific conditions
-                        if (
-                            "Code" in df_variable.columns
-                            or "Name" in df_variable.columns
-                        ):
-                            df_variable.rename(
-                                columns={"Code": "id_recurso", "Name": "id_recurso"},
-                                inplace=True,
-                            )
-
-                        if table_name == "hourly_entity":
-                            if all(
-                                col in df_variable.columns
-                                for col in ["Values_code", "Values_Name"]
-                            ):
-                                df_variable["id_recurso"] = (
-                                    df_variable["Values_code"]
-                                    + " - "
-                                    + df_variable["Values_Name"]
-                                )
-                                df_variable.drop(
-                                    ["Values_code", "Values_Name"], axis=1, inplace=True
-                                )
-                            else:
-                                df_variable.rename(
-                                    columns={
-                                        "Values_code": "id_recurso",
-                                        "Values_Name": "id_recurso",
-                                    },
-                                    inplace=True,
-                                )
-
-                            if (
-                                "Values_Activity" in df_variable.columns
-                                and "Values_Subactivity" in df_variable.columns
-                            ):
-                                df_variable["id_recurso"] = (
-                                    df_variable["Values_Activity"]
-                                    + " - "
-                                    + df_variable["Values_Subactivity"]
-                                )
-                                df_variable.drop(
-                                    ["Values_Activity", "Values_Subactivity"],
-                                    axis=1,
-                                    inplace=True,
-                                )
-
-                            if "Values_MarketType" in df_variable.columns:
-                                df_variable["id_recurso"] += (
-                                    " - " + df_variable["Values_MarketType"]
-                                )
-                                df_variable.drop(
-                                    ["Values_MarketType"], axis=1, inplace=True
-                                )
-                            
-                            if "Values_FuelType" in df_variable.columns:
-                                df_variable["id_recurso"] += (
-                                    " - " + df_variable["Values_FuelType"]
-                                )
-                                df_variable.drop(
-                                    ["Values_FuelType"], axis=1, inplace=True
-                                )
-
-                        # Add additional columns
-                        df_variable["id"] = record["id"]
-                        df_variable["metricName"] = record["MetricName"]
-                        self.delete_last_rows(
-                            df_variable.Date.min().date(),
-                            df_variable.Date.max().date(),
-                            table_name,
-                            record["id"],
-                        )
-                        self.insert_data(table_name, df_variable)
+        Returns:
+            IngestionReport: Summary of the run, including the metrics that failed.
+
+        Raises:
+            CustomException: If an error occurs during the data retrieval process.
+        """
+        try:
+            entity_types = [entity_type for _, entity_type in self.ENTITY_TABLES]
+            tasks = self.build_fetch_tasks(entity_types, start_date, end_date)
+            if incremental:
+                tasks = self.plan_incremental(tasks)
+            return self.run_ingestion(tasks, **ingestion_options)
         except Exception as err:
             logging.error(f"Exception: {err}")
             raise CustomException(err, sys) from err
@@ -402,7 +1031,16 @@ class DBClient:
             )
             if not new_metrics.empty:
                 self.insert_data("master_table", new_metrics)
+                self.bump_table_versions(["master_table"])
+                self.catalog.load()
                 logging.info(f"Nuevas metricas añadidas: {new_metrics}")
+            if self.metric_vector_store is not None:
+                # Only new or changed metric definitions are embedded, the catalog is
+                # already saved if the embedding model is not available
+                try:
+                    self.metric_vector_store.sync()
+                except Exception as err:
+                    logging.warning(f"No se pudo sincronizar el indice de metricas: {err}")
         except Exception as err:
             logging.error(f"Exception: {err}")
             raise CustomException(err, sys) from err
@@ -411,4 +1049,6 @@ class DBClient:
         """
         Closes the connection to the SQL Server database.
         """
+        if self._read_pool is not None:
+            self._read_pool.close()
         self.conn.close()
@@ -0,0 +1,187 @@
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from src.xm_db.migrations import HOUR_COLUMNS
+
+MASTER_COLUMNS = [
+    "MetricId",
+    "MetricName",
+    "Entity",
+    "Type",
+    "Filter",
+    "MetricUnits",
+    "MetricDescription",
+]
+
+
+
+def build_fake_catalog(
+    hourly: int = 5, daily: int = 5, monthly: int = 5, lists: int = 2
+) -> pd.DataFrame:
+    """
+    Builds a metric catalog with the same columns as `ReadDB.get_collections`.
+
+    Args:
+        hourly (int): Number of HourlyEntities metrics.
+        daily (int): Number of DailyEntities metrics.
+        monthly (int): Number of MonthlyEntities metrics.
+        lists (int): Number of ListsEntities metrics.
+
+    Returns:
+        pandas.DataFrame: The fake catalog.
+    """
+    rows = []
+    for entity_type, prefix, count in [
+        ("HourlyEntities", "Hora", hourly),
+        ("DailyEntities", "Dia", daily),
+        ("MonthlyEntities", "Mes", monthly),
+        ("ListsEntities", "Listado", lists),
+    ]:
+        for number in range(count):
+            rows.append(
+                {
+                    "MetricId": f"{prefix}{number:03d}",
+                    "MetricName": f"Metrica {prefix.lower()} {number}",
+                    "Entity": "Recurso" if number % 2 else "Sistema",
+                    "Type": entity_type,
+                    "Filter": "NA",
+                    "MetricUnits": "kWh",
+                    "MetricDescription": f"Metrica sintetica {entity_type} numero {number}",
+                }
+            )
+    return pd.DataFrame(rows, columns=MASTER_COLUMNS)
+
+
+class FakeReadDB:
+    def __init__(
+        self,
+        catalog: pd.DataFrame = None,
+        resources_per_metric: int = 3,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        failing_metrics: tuple = (),
+        seed: int = 0,
+    ):
+        """
+        Offline stand-in for `pydataxm.pydataxm.ReadDB` with the same `request_data` and
+        `get_collections` interface, used to run the ingestion code without network access.
+
+        Payloads mimic the real ones: hourly metrics identify resources by code, code and name,
+        activity and subactivity with market type, or code and name with fuel type; values are
+        deterministic per (metric, resource, date) whatever window is requested.
+
+        Args:
+            catalog (pandas.DataFrame): Metric catalog, see `build_fake_catalog`.
+            resources_per_metric (int): Number of resources returned by non system metrics.
+            latency (float): Seconds every request waits before answering.
+            failure_rate (float): Probability of a request raising a ConnectionError.
+            failing_metrics (tuple): metricIds whose requests always fail.
+            seed (int): Seed of the generated values.
+        """
+        self.catalog = catalog if catalog is not None else build_fake_catalog()
+        self.resources_per_metric = resources_per_metric
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failing_metrics = set(failing_metrics)
+        self.seed = seed
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._failures = np.random.default_rng(seed)
+        self._types = {
+            (row.MetricId, row.Entity): row.Type
+            for row in self.catalog.itertuples(index=False)
+        }
+
+    def get_collections(self) -> pd.DataFrame:
+        return self.catalog.copy()
+
+    def request_data(self, metric: str, entity: str, start_date, end_date) -> pd.DataFrame:
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = metric in self.failing_metrics or self._failures.random() < self.failure_rate
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if fail:
+                raise ConnectionError(f"Fallo simulado para {metric}/{entity}")
+            return self._build_payload(metric, entity, start_date, end_date)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    @staticmethod
+    def _noise(metric_key: int, resource: np.ndarray, day: np.ndarray, slot: np.ndarray) -> np.ndarray:
+        """
+        Deterministic pseudo-random values in [0, 1) for every (metric, resource, day, slot), so
+        the same date returns the same value whatever window it is requested in.
+        """
+        x = (metric_key % 10007) * 0.618 + resource * 12.9898 + day * 78.233 + slot * 37.719
+        return np.modf(np.abs(np.sin(x) * 43758.5453))[0]
+
+    def _build_payload(self, metric: str, entity: str, start_date, end_date) -> pd.DataFrame:
+        entity_type = self._types.get((metric, entity), "DailyEntities")
+        metric_key = self.seed + zlib.crc32(f"{metric}/{entity}".encode())
+        dates = pd.date_range(pd.Timestamp(start_date), pd.Timestamp(end_date), freq="D")
+        if entity_type == "MonthlyEntities":
+            dates = dates[dates.day == 1]
+        resources = 1 if entity == "Sistema" else self.resources_per_metric
+        if dates.empty:
+            return pd.DataFrame()
+
+        date_column = np.repeat(dates.values, resources)
+        resource = np.tile(np.arange(resources), len(dates))
+        day = date_column.astype("datetime64[D]").astype(np.int64)
+        codes = np.char.add("REC", np.char.zfill(resource.astype(str), 4))
+        names = np.char.add("Planta ", resource.astype(str))
+        size = len(date_column)
+        data = {"Id": np.full(size, entity)}
+
+        if entity_type == "HourlyEntities":
+            # The XM hourly payloads identify resources in several ways depending on the metric
+            shape = metric_key % 4
+            if shape == 0:
+                data["Values_code"] = codes
+            elif shape == 1:
+                data["Values_code"] = codes
+                data["Values_Name"] = names
+            elif shape == 2:
+                data["Values_Activity"] = np.array(["Generacion", "Comercializacion"])[resource % 2]
+                data["Values_Subactivity"] = codes
+                data["Values_MarketType"] = np.array(["Regulado", "No Regulado"])[resource % 2]
+            else:
+                data["Values_code"] = codes
+                data["Values_Name"] = names
+                data["Values_FuelType"] = np.array(["AGUA", "GAS", "CARBON", "ACPM"])[resource % 4]
+            hours = np.arange(24)
+            values = 500 * self._noise(
+                metric_key, resource[:, None], day[:, None], hours[None, :]
+            )
+            data.update({column: values[:, hour].round(4) for hour, column in enumerate(HOUR_COLUMNS)})
+        elif entity_type == "ListsEntities":
+            data.update(
+                {
+                    "Values_Code": codes,
+                    "Values_Name": names,
+                    "Values_Type": np.array(["HIDRAULICA", "TERMICA", "SOLAR", "EOLICA"])[resource % 4],
+                    "Values_Disp": np.array(["DESPACHADO CENTRALMENTE", "NO DESPACHADO CENTRALMENTE"])[resource % 2],
+                    "Values_RecType": np.array(["NORMAL", "FILO DE AGUA"])[resource % 2],
+                    "Values_CompanyCode": np.char.add("EMP", (resource % 50).astype(str)),
+                    "Values_EnerSource": np.array(["AGUA", "GAS", "RAD SOLAR", "VIENTO"])[resource % 4],
+                    "Values_OperStartdate": np.full(size, "2000-01-01"),
+                    "Values_State": np.full(size, "OPERACION"),
+                }
+            )
+        else:
+            data["Value"] = (1000 * self._noise(metric_key, resource, day, 0)).round(4)
+            if resources > 1:
+                data["Code"] = codes
+        data["Date"] = date_column
+        return pd.DataFrame(data)
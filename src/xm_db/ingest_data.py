@@ -1,14 +1,39 @@
 from datetime import datetime, timedelta
+from src.xm_db.api_cache import ResponseCache
 from src.xm_db.database_client import DBClient
+from src.xm_db.parquet_store import ParquetStore
+from utils.logger import logging
 
 if __name__ == "__main__":
-    db_client = DBClient()
+    db_client = DBClient(cache=ResponseCache(), metric_index=True)
     start_date = datetime.now().date() - timedelta(days=15)
     end_date = datetime.now().date() - timedelta(days=1)
 
-    # Subir a la base de datos por cada tipo de metrica (horaria, mensual y diaria)
-    db_client.update_data(start_date, end_date)
-    # Actualizar listados
-    #db_client.update_list_entities(start_date, end_date)
-    # Cerrar conexion
-    db_client.close_connection()
+    try:
+        # Subir a la base de datos por cada tipo de metrica (horaria, mensual y diaria)
+        report = db_client.update_data(
+            start_date,
+            end_date,
+            incremental=True,
+            concurrent=True,
+            bulk=True,
+            change_detection=True,
+        )
+        # Copia larga en Parquet de los meses tocados, incluidas las revisiones y ventanas
+        # reintentadas anteriores a start_date
+        parquet_store = ParquetStore()
+        for (table_name, metric_id), (first, last) in report.written_ranges.items():
+            parquet_store.export(
+                db_client.conn, table_name, metric_ids=[metric_id], start_date=first, end_date=last
+            )
+        # Indice vectorial del catalogo de metricas, solo se embeben las nuevas o cambiadas.
+        # Sin Ollama los datos ya quedaron cargados, se sincroniza en la siguiente corrida
+        try:
+            db_client.metric_vector_store.sync()
+        except Exception as err:
+            logging.warning(f"No se pudo sincronizar el indice de metricas: {err}")
+        # Actualizar listados
+        #db_client.update_list_entities(start_date, end_date)
+    finally:
+        # Cerrar conexion
+        db_client.close_connection()
@@ -0,0 +1,124 @@
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+
+
+@dataclass
+class IngestionReport:
+    """
+    Summary of a single ingestion run over the XM metrics.
+
+    Attributes:
+        started_at (datetime): Moment the run started.
+        finished_at (datetime): Moment the run finished, None while running.
+        succeeded (list): metricIds whose data was written to the database.
+        empty (list): metricIds for which the API returned no rows.
+        failed (dict): metricId/Entity -> list of the errors of every request of the metric that
+            could not be fetched or written, one per backfill window, prefixed by its dates.
+        rows_written (int): Total number of rows inserted by the run.
+        write_seconds (float): Time spent deleting, inserting and committing.
+        stage_seconds (dict): Accumulated seconds per stage (fetch, normalize, delete, insert).
+            With concurrent fetching, fetch adds up the time of every request in flight.
+        rows_unchanged (int): With change detection, fetched rows identical to the stored ones.
+        rows_updated (int): With change detection, stored rows whose values changed.
+        rows_new (int): With change detection, fetched rows that were not stored.
+        rows_deleted (int): With change detection, stored rows no longer returned by the API.
+        written_ranges (dict): (table name, id of master_table) -> [first, last] date of the
+            requests written for the metric, e.g. to export the months the run touched.
+    """
+
+    started_at: datetime = field(default_factory=datetime.now)
+    finished_at: Optional[datetime] = None
+    succeeded: list = field(default_factory=list)
+    empty: list = field(default_factory=list)
+    failed: dict = field(default_factory=dict)
+    rows_written: int = 0
+    write_seconds: float = 0.0
+    stage_seconds: dict = field(default_factory=dict)
+    rows_unchanged: int = 0
+    rows_updated: int = 0
+    rows_new: int = 0
+    rows_deleted: int = 0
+    written_ranges: dict = field(default_factory=dict)
+
+    @property
+    def elapsed_seconds(self) -> float:
+        end = self.finished_at or datetime.now()
+        return (end - self.started_at).total_seconds()
+
+    @property
+    def rows_per_second(self) -> float:
+        """
+        Write throughput of the run, measured only over the time spent writing.
+        """
+        if not self.write_seconds:
+            return 0.0
+        return self.rows_written / self.write_seconds
+
+    def add_stage_time(self, stage: str, seconds: float) -> None:
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def time_stage(self, stage: str):
+        """
+        Adds the time spent inside the block to `stage_seconds[stage]`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(stage, time.perf_counter() - start)
+
+    def add_success(self, metric_id: str, rows: int) -> None:
+        self.succeeded.append(metric_id)
+        self.rows_written += rows
+
+    def add_written_range(self, table_name: str, record_id: int, start_date, end_date) -> None:
+        start_date, end_date = pd.Timestamp(start_date).date(), pd.Timestamp(end_date).date()
+        current = self.written_ranges.get((table_name, record_id))
+        if current is not None:
+            start_date, end_date = min(start_date, current[0]), max(end_date, current[1])
+        self.written_ranges[(table_name, record_id)] = [start_date, end_date]
+
+    def add_changes(self, unchanged: int, updated: int, new: int, deleted: int) -> None:
+        self.rows_unchanged += unchanged
+        self.rows_updated += updated
+        self.rows_new += new
+        self.rows_deleted += deleted
+
+    def add_empty(self, metric_id: str) -> None:
+        self.empty.append(metric_id)
+
+    def add_failure(self, metric_id: str, error, start_date=None, end_date=None) -> None:
+        # Several windows of the same metric can fail in a run, each one is kept
+        message = str(error) if start_date is None else f"{start_date} - {end_date}: {error}"
+        self.failed.setdefault(metric_id, []).append(message)
+
+    def finish(self) -> "IngestionReport":
+        self.finished_at = datetime.now()
+        return self
+
+    def summary(self) -> str:
+        """
+        Returns a one line, human readable summary of the run.
+        """
+        text = (
+            f"{len(self.succeeded)} metricas actualizadas, {len(self.empty)} sin datos, "
+            f"{len(self.failed)} con error, {self.rows_written} filas en {self.elapsed_seconds:.1f}s"
+            f" ({self.rows_per_second:,.0f} filas/s de escritura)"
+        )
+        if self.rows_unchanged or self.rows_updated or self.rows_new or self.rows_deleted:
+            text += (
+                f". Filas sin cambios: {self.rows_unchanged}, actualizadas: {self.rows_updated}, "
+                f"nuevas: {self.rows_new}, eliminadas: {self.rows_deleted}"
+            )
+        if self.failed:
+            text += ". Fallidas: " + ", ".join(
+                f"{metric_id} ({len(errors)} ventanas)" if len(errors) > 1 else metric_id
+                for metric_id, errors in sorted(self.failed.items())
+            )
+        return text
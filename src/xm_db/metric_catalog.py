@@ -0,0 +1,255 @@
+import threading
+import unicodedata
+from bisect import bisect_left
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Optional
+
+from utils.logger import logging
+
+CATALOG_COLUMNS = [
+    "id",
+    "metricId",
+    "MetricName",
+    "Entity",
+    "Type",
+    "Filter",
+    "MetricUnits",
+    "MetricDescription",
+]
+
+
+def fold_text(text) -> str:
+    """
+    Lower-cases a text and removes its accents, so 'Generación' and 'generacion' compare equal.
+    """
+    if text is None:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+@dataclass(frozen=True)
+class MetricRecord:
+    """
+    One row of master_table.
+    """
+
+    id: int
+    metric_id: str
+    metric_name: str
+    entity: str
+    type: str
+    filter: Optional[str]
+    units: Optional[str]
+    description: Optional[str]
+
+
+@dataclass(frozen=True)
+class _Index:
+    records: tuple
+    by_id: dict
+    by_metric_id: dict
+    by_type: dict
+    by_entity: dict
+    names: list
+    name_words: tuple
+    description_words: tuple
+    vocabulary: tuple
+
+
+class MetricCatalog:
+    def __init__(self, source):
+        """
+        In-memory index of master_table, loaded once and reloaded only when metrics are added,
+        so lookups from the ingestion loop and the agent never hit the database.
+
+        Args:
+            source: sqlite3.Connection to the XM database, or a ReadOnlyPool to read it from.
+
+        Example:
+            >>> catalog = MetricCatalog(db_client.conn)
+            >>> catalog.get("PrecBolsNaci", "Sistema").id
+            >>> [record.metric_id for record, score in catalog.search("precio bolsa")]
+        """
+        self.source = source
+        self.version = None
+        self._index = None
+        self._lock = threading.Lock()
+        self.load()
+
+    def _query(self, sql: str) -> list:
+        if hasattr(self.source, "connection"):
+            with self.source.connection() as conn:
+                return conn.execute(sql).fetchall()
+        return self.source.execute(sql).fetchall()
+
+    def _master_version(self):
+        try:
+            rows = self._query("SELECT version FROM table_versions WHERE table_name = 'master_table'")
+        except Exception:
+            # Database not migrated yet
+            return None
+        return rows[0][0] if rows else None
+
+    def load(self) -> None:
+        """
+        Reads master_table and rebuilds every index.
+        """
+        with self._lock:
+            version = self._master_version()
+            rows = self._query(f"SELECT {', '.join(CATALOG_COLUMNS)} FROM master_table ORDER BY id")
+            records = tuple(MetricRecord(*row) for row in rows)
+
+            by_metric_id, by_type, by_entity = {}, {}, {}
+            for record in records:
+                by_metric_id.setdefault(record.metric_id, []).append(record)
+                by_type.setdefault(record.type, []).append(record)
+                by_entity.setdefault(record.entity, []).append(record)
+
+            name_words = tuple(tuple(fold_text(record.metric_name).split()) for record in records)
+            description_words = tuple(
+                tuple(fold_text(record.description).split()) for record in records
+            )
+            vocabulary = {word for words in name_words + description_words for word in words}
+            self._index = _Index(
+                records=records,
+                by_id={record.id: record for record in records},
+                by_metric_id={key: tuple(value) for key, value in by_metric_id.items()},
+                by_type={key: tuple(value) for key, value in by_type.items()},
+                by_entity={key: tuple(value) for key, value in by_entity.items()},
+                names=sorted(
+                    (fold_text(record.metric_name), position)
+                    for position, record in enumerate(records)
+                ),
+                name_words=name_words,
+                description_words=description_words,
+                vocabulary=tuple(sorted(vocabulary)),
+            )
+            self.version = version
+        logging.info(f"Catalogo de metricas cargado: {len(records)} metricas")
+
+    def refresh(self) -> bool:
+        """
+        Reloads the catalog if master_table changed since it was loaded.
+
+        Returns:
+            bool: True if the catalog was reloaded.
+        """
+        if self._master_version() == self.version:
+            return False
+        self.load()
+        return True
+
+    def __len__(self) -> int:
+        return len(self._index.records)
+
+    def __iter__(self):
+        return iter(self._index.records)
+
+    def get(self, metric_id: str, entity: str = None) -> Optional[MetricRecord]:
+        """
+        Returns the metric with the given metricId, the first registered one if `entity` is
+        not given and the metric exists for several entities. None if it does not exist.
+        """
+        records = self._index.by_metric_id.get(metric_id, ())
+        for record in records:
+            if entity is None or record.entity == entity:
+                return record
+        return None
+
+    def by_id(self, record_id: int) -> Optional[MetricRecord]:
+        """
+        Returns the metric with the given id of master_table.
+        """
+        return self._index.by_id.get(record_id)
+
+    def filter(self, type: str = None, entity: str = None) -> list:
+        """
+        Returns the metrics of a Type and/or Entity, in master_table order.
+
+        Example:
+            >>> catalog.filter(type="HourlyEntities", entity="Recurso")
+        """
+        if type is not None:
+            records = self._index.by_type.get(type, ())
+            if entity is not None:
+                records = [record for record in records if record.entity == entity]
+        elif entity is not None:
+            records = self._index.by_entity.get(entity, ())
+        else:
+            records = self._index.records
+        return list(records)
+
+    def prefix_search(self, prefix: str) -> list:
+        """
+        Returns the metrics whose name starts with a prefix, ignoring case and accents.
+        """
+        index = self._index
+        prefix = fold_text(prefix)
+        position = bisect_left(index.names, (prefix, -1))
+        matches = []
+        while position < len(index.names) and index.names[position][0].startswith(prefix):
+            matches.append(index.records[index.names[position][1]])
+            position += 1
+        return matches
+
+    def _word_scores(self, token: str) -> dict:
+        """
+        Similarity between a word of the query and every word of the catalog: 1 for prefixes,
+        the SequenceMatcher ratio when it is above 0.75.
+        """
+        scores = {}
+        # SequenceMatcher caches the second sequence, so the token is fixed as seq2
+        matcher = SequenceMatcher(b=token, autojunk=False)
+        for word in self._index.vocabulary:
+            if word.startswith(token):
+                scores[word] = 1.0
+                continue
+            matcher.set_seq1(word)
+            if matcher.real_quick_ratio() > 0.75 and matcher.quick_ratio() > 0.75:
+                ratio = matcher.ratio()
+                if ratio > 0.75:
+                    scores[word] = ratio
+        return scores
+
+    def search(self, text: str, limit: int = 10, type: str = None, entity: str = None) -> list:
+        """
+        Fuzzy search over MetricName and MetricDescription, tolerant to missing accents,
+        typos and partial words. Words of the name weigh more than those of the description.
+
+        Args:
+            text (str): Words to look for, e.g. 'generacion real'.
+            limit (int): Maximum number of results.
+            type (str): Optional Type to restrict the search to.
+            entity (str): Optional Entity to restrict the search to.
+
+        Returns:
+            list: (MetricRecord, score between 0 and 1) pairs, best match first.
+        """
+        index = self._index
+        tokens = fold_text(text).split()
+        if not tokens:
+            return []
+        token_scores = [self._word_scores(token) for token in tokens]
+
+        results = []
+        for position, record in enumerate(index.records):
+            if (type is not None and record.type != type) or (
+                entity is not None and record.entity != entity
+            ):
+                continue
+            name_score = description_score = 0.0
+            for scores in token_scores:
+                name_score += max(
+                    (scores.get(word, 0.0) for word in index.name_words[position]), default=0.0
+                )
+                description_score += max(
+                    (scores.get(word, 0.0) for word in index.description_words[position]),
+                    default=0.0,
+                )
+            score = max(name_score, 0.8 * description_score) / len(tokens)
+            if score > 0:
+                results.append((record, score))
+        results.sort(key=lambda item: (-item[1], item[0].id))
+        return results[:limit]
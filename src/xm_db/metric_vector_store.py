@@ -0,0 +1,159 @@
+import hashlib
+import sys
+
+from src.xm_db.metric_catalog import MetricCatalog, MetricRecord
+from utils.logger import logging, CustomException
+from utils.resources import get_chroma_client, get_embedding_model
+
+
+def metric_text(record: MetricRecord) -> str:
+    """
+    Text embedded for a metric of the catalog.
+    """
+    parts = [f"{record.metric_name} ({record.metric_id})"]
+    if record.description:
+        parts.append(record.description)
+    parts.append(f"Entidad: {record.entity}. Tipo: {record.type}.")
+    if record.units:
+        parts.append(f"Unidades: {record.units}.")
+    return " ".join(parts)
+
+
+class MetricVectorStore:
+    def __init__(
+        self,
+        catalog: MetricCatalog,
+        embedding_model=None,
+        chroma_path: str = "chroma_db",
+        collection_name: str = "xm_metrics_index",
+    ):
+        """
+        Chroma collection with one embedding per metric of master_table, next to creg_index and
+        upme_index, used to resolve a question to the metrics it talks about.
+
+        Every entry stores the hash of its text and embedding model, so `sync` only embeds the
+        metrics that are new or whose definition changed.
+
+        Args:
+            catalog (MetricCatalog): Catalog of the metrics to embed.
+            embedding_model: LlamaIndex embedding model. Defaults to the shared Ollama
+                mxbai-embed-large behind the embedding cache.
+            chroma_path (str): Folder of the persistent Chroma client.
+            collection_name (str): Name of the collection.
+        """
+        self.catalog = catalog
+        # Shared with creg_index and upme_index: same embedding cache and Chroma client
+        self.embedding_model = embedding_model or get_embedding_model()
+        self.chroma_path = chroma_path
+        self.collection_name = collection_name
+
+    @property
+    def collection(self):
+        # Looked up on every use, the shared client is reopened when the resolution indexes change
+        return get_chroma_client(self.chroma_path).get_or_create_collection(
+            self.collection_name, metadata={"hnsw:space": "cosine"}
+        )
+
+    def content_hash(self, text: str) -> str:
+        model_name = getattr(self.embedding_model, "model_name", "")
+        return hashlib.sha1(f"{model_name}|{text}".encode("utf-8")).hexdigest()
+
+    def sync(self, batch_size: int = 64) -> dict:
+        """
+        Embeds the new and changed metrics of the catalog and removes the ones no longer in it.
+
+        Args:
+            batch_size (int): Metrics embedded per request to the embedding model.
+
+        Returns:
+            dict: Number of metrics 'embedded', 'unchanged' and 'deleted'.
+
+        Raises:
+            CustomException: If the embedding model or Chroma fail.
+        """
+        try:
+            entries = {str(record.id): record for record in self.catalog}
+            stored = self.collection.get(include=["metadatas"])
+            stored_hashes = {
+                entry_id: (metadata or {}).get("content_hash")
+                for entry_id, metadata in zip(stored["ids"], stored["metadatas"])
+            }
+
+            pending = []
+            for entry_id, record in entries.items():
+                text = metric_text(record)
+                content_hash = self.content_hash(text)
+                if stored_hashes.get(entry_id) != content_hash:
+                    pending.append((entry_id, record, text, content_hash))
+
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                texts = [text for _, _, text, _ in batch]
+                self.collection.upsert(
+                    ids=[entry_id for entry_id, _, _, _ in batch],
+                    embeddings=self.embedding_model.get_text_embedding_batch(texts),
+                    documents=texts,
+                    metadatas=[
+                        {
+                            "content_hash": content_hash,
+                            "metricId": record.metric_id,
+                            "entity": record.entity,
+                            "type": record.type,
+                        }
+                        for _, record, _, content_hash in batch
+                    ],
+                )
+
+            stale = [entry_id for entry_id in stored_hashes if entry_id not in entries]
+            if stale:
+                self.collection.delete(ids=stale)
+
+            counts = {
+                "embedded": len(pending),
+                "unchanged": len(entries) - len(pending),
+                "deleted": len(stale),
+            }
+            logging.info(f"Indice de metricas sincronizado: {counts}")
+            return counts
+        except Exception as err:
+            logging.error(f"Exception: {err}")
+            raise CustomException(err, sys) from err
+
+    def resolve(self, question: str, limit: int = 5, type: str = None, entity: str = None) -> list:
+        """
+        Finds the metrics a question refers to with a single vector lookup.
+
+        Args:
+            question (str): Question or description, e.g. 'precio de bolsa de ayer'.
+            limit (int): Maximum number of metrics returned.
+            type (str): Optional Type of master_table to restrict the lookup to.
+            entity (str): Optional Entity to restrict the lookup to.
+
+        Returns:
+            list: (MetricRecord, similarity between 0 and 1) pairs, best match first.
+
+        Example:
+            >>> store = MetricVectorStore(db_client.catalog)
+            >>> store.sync()
+            >>> store.resolve("generacion real por planta", type="HourlyEntities")
+        """
+        conditions = [
+            {key: value} for key, value in (("type", type), ("entity", entity)) if value is not None
+        ]
+        where = None
+        if len(conditions) == 1:
+            where = conditions[0]
+        elif conditions:
+            where = {"$and": conditions}
+
+        result = self.collection.query(
+            query_embeddings=[self.embedding_model.get_query_embedding(question)],
+            n_results=limit,
+            where=where,
+        )
+        matches = []
+        for entry_id, distance in zip(result["ids"][0], result["distances"][0]):
+            record = self.catalog.by_id(int(entry_id))
+            if record is not None:
+                matches.append((record, 1.0 - distance))
+        return matches
@@ -0,0 +1,259 @@
+import sqlite3
+
+from utils.logger import logging
+
+HOUR_COLUMNS = [f"Values_Hour{hour:02d}" for hour in range(1, 25)]
+
+ENTITY_COLUMNS = {
+    "hourly_entity": ["id", "id_recurso", *HOUR_COLUMNS, "date", "metricName"],
+    "daily_entity": ["id", "value", "id_recurso", "date", "metricName"],
+    "monthly_entity": ["id", "value", "id_recurso", "date", "metricName"],
+}
+
+
+def _create_base_schema(conn: sqlite3.Connection) -> None:
+    """
+    Creates the tables originally built by hand in notebooks/test_db.ipynb, if they do not exist.
+    """
+    hour_columns = ",\n            ".join(f"{column} REAL" for column in HOUR_COLUMNS)
+    statements = f"""
+        CREATE TABLE IF NOT EXISTS master_table (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            metricId VARCHAR(255),
+            MetricName VARCHAR(255),
+            Entity VARCHAR(255),
+            Type VARCHAR(255),
+            Filter VARCHAR(255),
+            MetricUnits VARCHAR(255),
+            MetricDescription VARCHAR(255)
+        );
+        CREATE TABLE IF NOT EXISTS monthly_entity (
+            id INTEGER,
+            value REAL,
+            date VARCHAR(255),
+            metricName VARCHAR(255)
+        );
+        CREATE TABLE IF NOT EXISTS daily_entity (
+            id INTEGER,
+            value REAL,
+            id_recurso VARCHAR(255),
+            date VARCHAR(255),
+            metricName VARCHAR(255)
+        );
+        CREATE TABLE IF NOT EXISTS hourly_entity (
+            id INTEGER,
+            id_recurso VARCHAR(1000),
+            {hour_columns},
+            date VARCHAR(255),
+            metricName VARCHAR(255)
+        );
+    """
+    # executescript would commit the migration transaction, so run the statements one by one
+    for statement in statements.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def _typed_dates_and_indexes(conn: sqlite3.Connection) -> None:
+    """
+    Rebuilds the entity tables with a NOT NULL ISO 'YYYY-MM-DD' date column, adds id_recurso to
+    monthly_entity and creates the (id, date) and (id, id_recurso, date) indexes.
+    """
+    for table_name, columns in ENTITY_COLUMNS.items():
+        existing = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+        definitions = []
+        for column in columns:
+            if column == "date":
+                definitions.append(
+                    "date TEXT NOT NULL CHECK (date = strftime('%Y-%m-%d', date))"
+                )
+            elif column in ("id_recurso", "metricName"):
+                definitions.append(f"{column} TEXT")
+            elif column == "id":
+                definitions.append("id INTEGER")
+            else:
+                definitions.append(f"{column} REAL")
+
+        conn.execute(f"ALTER TABLE {table_name} RENAME TO {table_name}_old")
+        conn.execute(f"CREATE TABLE {table_name} ({', '.join(definitions)})")
+        selected = [
+            "strftime('%Y-%m-%d', date)" if column == "date"
+            else column if column in existing
+            else "NULL"
+            for column in columns
+        ]
+        conn.execute(
+            f"""
+            INSERT INTO {table_name} ({', '.join(columns)})
+            SELECT {', '.join(selected)} FROM {table_name}_old
+            WHERE strftime('%Y-%m-%d', date) IS NOT NULL
+            """
+        )
+        invalid = conn.execute(
+            f"SELECT COUNT(*) FROM {table_name}_old WHERE strftime('%Y-%m-%d', date) IS NULL"
+        ).fetchone()[0]
+        if invalid:
+            # Keep the rows that can not be migrated for manual review instead of losing them
+            conn.execute(
+                f"""
+                CREATE TABLE {table_name}_invalid_dates AS
+                SELECT * FROM {table_name}_old WHERE strftime('%Y-%m-%d', date) IS NULL
+                """
+            )
+            logging.warning(
+                f"{invalid} filas de {table_name} sin fecha valida movidas a {table_name}_invalid_dates"
+            )
+        conn.execute(f"DROP TABLE {table_name}_old")
+        conn.execute(
+            f"CREATE INDEX idx_{table_name}_id_date ON {table_name} (id, date)"
+        )
+        conn.execute(
+            f"CREATE INDEX idx_{table_name}_id_recurso_date ON {table_name} (id, id_recurso, date)"
+        )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_master_table_type ON master_table (Type, Entity)"
+    )
+
+
+def _ingestion_state(conn: sqlite3.Connection) -> None:
+    """
+    Creates the per-metric ingestion watermark table and the backfill window log.
+    """
+    conn.execute(
+        """
+        CREATE TABLE ingestion_state (
+            metricId TEXT NOT NULL,
+            Entity TEXT NOT NULL,
+            last_complete_date TEXT,
+            last_run_at TEXT,
+            last_status TEXT,
+            last_error TEXT,
+            PRIMARY KEY (metricId, Entity)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE backfill_windows (
+            metricId TEXT NOT NULL,
+            Entity TEXT NOT NULL,
+            window_start TEXT NOT NULL,
+            window_end TEXT NOT NULL,
+            status TEXT NOT NULL,
+            rows INTEGER DEFAULT 0,
+            updated_at TEXT,
+            PRIMARY KEY (metricId, Entity, window_start, window_end)
+        )
+        """
+    )
+
+
+def _rollup_tables(conn: sqlite3.Connection) -> None:
+    """
+    Creates the daily rollups of the hourly metrics and the monthly rollups of the hourly and
+    daily metrics, and fills them from the rows already stored.
+    """
+    # Imported here, rollups builds its queries from HOUR_COLUMNS of this module
+    from src.xm_db.rollups import refresh_rollups
+
+    for table_name, column in (("daily_rollup", "date"), ("monthly_rollup", "month")):
+        conn.execute(
+            f"""
+            CREATE TABLE {table_name} (
+                id INTEGER NOT NULL,
+                id_recurso TEXT NOT NULL DEFAULT '',
+                {column} TEXT NOT NULL,
+                value_sum REAL,
+                value_mean REAL,
+                value_min REAL,
+                value_max REAL,
+                value_count INTEGER NOT NULL,
+                PRIMARY KEY (id, id_recurso, {column})
+            )
+            """
+        )
+
+    for table_name in ("hourly_entity", "daily_entity"):
+        for metric_id, start, end in conn.execute(
+            f"SELECT id, MIN(date), MAX(date) FROM {table_name} WHERE id IS NOT NULL GROUP BY id"
+        ).fetchall():
+            refresh_rollups(conn, table_name, metric_id, start, end)
+
+
+VERSIONED_TABLES = [
+    "master_table",
+    "hourly_entity",
+    "daily_entity",
+    "monthly_entity",
+    "daily_rollup",
+    "monthly_rollup",
+]
+
+
+def _table_versions(conn: sqlite3.Connection) -> None:
+    """
+    Creates the per-table version counter bumped by every write, used to invalidate cached
+    query results.
+    """
+    conn.execute(
+        """
+        CREATE TABLE table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+        """
+    )
+    conn.executemany(
+        "INSERT INTO table_versions (table_name) VALUES (?)",
+        [(table_name,) for table_name in VERSIONED_TABLES],
+    )
+
+
+MIGRATIONS = [
+    (1, "Esquema base de master_table y tablas de entidades", _create_base_schema),
+    (2, "Fechas ISO tipadas e indices compuestos", _typed_dates_and_indexes),
+    (3, "Estado de ingesta por metrica y ventanas de backfill", _ingestion_state),
+    (4, "Tablas de agregados diarios y mensuales", _rollup_tables),
+    (5, "Versiones por tabla para invalidar la cache de consultas", _table_versions),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """
+    Returns the schema version stored in the database (PRAGMA user_version).
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target: int = None) -> int:
+    """
+    Applies in order every migration newer than the version stored in the database.
+
+    Every migration runs in its own transaction together with the update of PRAGMA
+    user_version, so an interrupted migration leaves the database in its previous version.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the XM database.
+        target (int): Last version to apply. Defaults to the latest one.
+
+    Returns:
+        int: The schema version of the database after migrating.
+    """
+    version = get_schema_version(conn)
+    for number, description, apply in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        try:
+            conn.execute("BEGIN")
+            apply(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = number
+        logging.info(f"Migracion {number} aplicada: {description}")
+    return version
@@ -0,0 +1,179 @@
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class EntityColumnSpec:
+    """
+    Declarative description of how the payload of an entity type is mapped to its table.
+
+    Attributes:
+        id_recurso_sources (tuple): Groups of columns joined with " - " to build id_recurso.
+            The first group whose columns are all present in the payload is used.
+        id_recurso_suffixes (tuple): Columns appended to id_recurso with " - " when present.
+        value_pattern (str): Regex of the numeric columns whose missing values become 0.
+        text_fill (object): Value used to fill the missing values of the remaining columns,
+            None to leave them untouched.
+        drop (tuple): Columns removed from the payload.
+    """
+
+    id_recurso_sources: tuple = ()
+    id_recurso_suffixes: tuple = ()
+    value_pattern: str = r"^Value$"
+    text_fill: object = None
+    drop: tuple = ("Id",)
+    consumed: frozenset = field(init=False)
+
+    def __post_init__(self):
+        columns = {column for group in self.id_recurso_sources for column in group}
+        object.__setattr__(
+            self, "consumed", frozenset(columns | set(self.id_recurso_suffixes) | set(self.drop))
+        )
+
+
+ENTITY_SPECS = {
+    "HourlyEntities": EntityColumnSpec(
+        id_recurso_sources=(
+            ("Values_Activity", "Values_Subactivity"),
+            ("Values_code", "Values_Name"),
+            ("Values_code",),
+            ("Values_Name",),
+            ("Code",),
+            ("Name",),
+        ),
+        id_recurso_suffixes=("Values_MarketType", "Values_FuelType"),
+        value_pattern=r"^Values_Hour\d{2}$",
+    ),
+    "DailyEntities": EntityColumnSpec(id_recurso_sources=(("Code",), ("Name",))),
+    "MonthlyEntities": EntityColumnSpec(id_recurso_sources=(("Code",), ("Name",))),
+    "ListsEntities": EntityColumnSpec(value_pattern=r"^$", text_fill=""),
+}
+
+
+@dataclass(frozen=True)
+class CompiledTransform:
+    """
+    Transformation of an entity spec resolved for a concrete set of payload columns.
+    """
+
+    id_recurso_parts: tuple
+    kept_columns: tuple
+    value_columns: frozenset
+    text_fill: object
+
+    def __call__(self, df: pd.DataFrame) -> pd.DataFrame:
+        data = {}
+        for column in self.kept_columns:
+            series = df[column]
+            if column in self.value_columns:
+                if series.hasnans:
+                    series = series.fillna(0)
+            elif self.text_fill is not None and series.hasnans:
+                series = series.fillna(self.text_fill)
+            data[column] = series
+
+        if self.id_recurso_parts:
+            parts = [
+                df[column].fillna("") if df[column].hasnans else df[column]
+                for column in self.id_recurso_parts
+            ]
+            if len(parts) == 1:
+                id_recurso = parts[0]
+            else:
+                id_recurso = pd.Series(join_parts(parts), index=df.index, dtype=object)
+            data["id_recurso"] = id_recurso
+
+        return pd.DataFrame(data, index=df.index, copy=False)
+
+
+def join_parts(parts: list, separator: str = " - ") -> np.ndarray:
+    """
+    Joins several columns row by row with `separator`, building each distinct combination once.
+
+    XM payloads repeat the same few hundred resources on every date, so the combinations are
+    factorized into integer codes and only the unique ones are turned into strings.
+
+    Args:
+        parts (list): Series of the same length, without missing values.
+        separator (str): Text placed between the values of each row.
+
+    Returns:
+        numpy.ndarray: Object array with the joined text of every row.
+    """
+    rows = len(parts[0])
+    key = np.zeros(rows, dtype=np.int64)
+    combinations = 1
+    for part in parts:
+        codes, uniques = pd.factorize(part)
+        # Re-factorize after every column so the combined key never overflows
+        key, seen = pd.factorize(key * len(uniques) + codes)
+        combinations = len(seen)
+
+    # Row of the first occurrence of every combination; assigning in reverse keeps the first one
+    first_rows = np.empty(combinations, dtype=np.int64)
+    first_rows[key[::-1]] = np.arange(rows - 1, -1, -1)
+
+    columns = [part.to_numpy() for part in parts]
+    labels = np.array(
+        [separator.join(str(column[row]) for column in columns) for row in first_rows],
+        dtype=object,
+    )
+    return labels[key]
+
+
+_compiled = {}
+
+
+def compile_transform(entity_type: str, columns: tuple) -> CompiledTransform:
+    """
+    Resolves the spec of an entity type against the columns of a payload. Results are cached
+    per (entity type, columns), so the column checks run once per payload shape instead of
+    once per metric.
+
+    Args:
+        entity_type (str): Type of the metric in master_table.
+        columns (tuple): Columns of the payload returned by the XM API.
+
+    Returns:
+        CompiledTransform: Callable that normalizes payloads with those columns.
+    """
+    key = (entity_type, columns)
+    if key in _compiled:
+        return _compiled[key]
+
+    spec = ENTITY_SPECS[entity_type]
+    present = set(columns)
+    parts = ()
+    for group in spec.id_recurso_sources:
+        if all(column in present for column in group):
+            parts = group
+            break
+    parts += tuple(column for column in spec.id_recurso_suffixes if column in present)
+
+    value_regex = re.compile(spec.value_pattern)
+    kept = tuple(column for column in columns if column not in spec.consumed)
+    transform = CompiledTransform(
+        id_recurso_parts=parts,
+        kept_columns=kept,
+        value_columns=frozenset(column for column in kept if value_regex.match(column)),
+        text_fill=spec.text_fill,
+    )
+    _compiled[key] = transform
+    return transform
+
+
+def normalize_payload(df: pd.DataFrame, entity_type: str) -> pd.DataFrame:
+    """
+    Normalizes a payload of the XM API to the columns of the table of its entity type.
+
+    Args:
+        df (pandas.DataFrame): Data returned by the XM API.
+        entity_type (str): Type of the metric in master_table.
+
+    Returns:
+        pandas.DataFrame: A new frame with id_recurso built and the source columns removed.
+    """
+    return compile_transform(entity_type, tuple(df.columns))(df)
@@ -0,0 +1,195 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from src.xm_db.migrations import HOUR_COLUMNS
+from utils.logger import logging
+
+LONG_SCHEMA = pa.schema(
+    [
+        ("id", pa.int64()),
+        ("id_recurso", pa.string()),
+        ("timestamp", pa.timestamp("s")),
+        ("value", pa.float64()),
+    ]
+)
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("metric", pa.int64()), ("month", pa.string())]), flavor="hive"
+)
+
+
+def hourly_to_long(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Unpivots rows of hourly_entity into one row per hour.
+
+    Values_HourNN is the energy of the NN-th hour of the day, so it is stamped at the start
+    of that hour: Values_Hour01 -> 00:00, Values_Hour24 -> 23:00.
+
+    Args:
+        df (pandas.DataFrame): Rows with id, id_recurso, date and the 24 Values_HourNN columns.
+
+    Returns:
+        pandas.DataFrame: Columns id, id_recurso, timestamp and value, 24 rows per input row.
+    """
+    hours = len(HOUR_COLUMNS)
+    days = pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[s]")
+    offsets = np.arange(hours, dtype="timedelta64[h]").astype("timedelta64[s]")
+    return pd.DataFrame(
+        {
+            "id": np.repeat(df["id"].to_numpy(dtype=np.int64), hours),
+            "id_recurso": np.repeat(df["id_recurso"].to_numpy(dtype=object), hours),
+            "timestamp": (days[:, None] + offsets[None, :]).ravel(),
+            "value": df[HOUR_COLUMNS].to_numpy(dtype=np.float64).ravel(),
+        }
+    )
+
+
+def value_to_long(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Maps rows of daily_entity or monthly_entity to the long representation.
+    """
+    return pd.DataFrame(
+        {
+            "id": df["id"].to_numpy(dtype=np.int64),
+            "id_recurso": df["id_recurso"].to_numpy(dtype=object),
+            "timestamp": pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[s]"),
+            "value": df["value"].to_numpy(dtype=np.float64),
+        }
+    )
+
+
+class ParquetStore:
+    def __init__(self, root: str = "src/xm_db/parquet"):
+        """
+        Long (id, id_recurso, timestamp, value) copy of the XM tables as Parquet files
+        partitioned by metric and month:
+
+            <root>/<table>/metric=<id>/month=<YYYY-MM>/part-0.parquet
+
+        Reads are memory mapped and only open the partitions matching the requested metrics
+        and months, so pulling one metric for one year touches twelve small files.
+
+        Args:
+            root (str): Folder of the dataset.
+        """
+        self.root = root
+        self.filesystem = fs.LocalFileSystem(use_mmap=True)
+
+    def _table_path(self, table_name: str) -> str:
+        return os.path.join(self.root, table_name)
+
+    def export(
+        self,
+        conn: sqlite3.Connection,
+        table_name: str = "hourly_entity",
+        metric_ids: list = None,
+        start_date=None,
+        end_date=None,
+    ) -> int:
+        """
+        Writes the partitions of the given metrics and dates, replacing the existing ones.
+        Whole months are exported, so a partition always holds the complete month.
+
+        Args:
+            conn (sqlite3.Connection): Connection to the XM database.
+            table_name (str): hourly_entity, daily_entity or monthly_entity.
+            metric_ids (list): ids of master_table to export. Defaults to every metric.
+            start_date: First date to export, the whole month is included. Defaults to the oldest.
+            end_date: Last date to export, the whole month is included. Defaults to the newest.
+
+        Returns:
+            int: Number of long rows written.
+        """
+        conditions, params = [], []
+        if metric_ids is not None and len(metric_ids):
+            conditions.append(f"id IN ({', '.join('?' * len(metric_ids))})")
+            # sqlite3 binds NumPy integers as blobs, which never equal the stored ids
+            params.extend(int(metric_id) for metric_id in metric_ids)
+        if start_date is not None:
+            conditions.append("date >= ?")
+            params.append(pd.Timestamp(start_date).strftime("%Y-%m-01"))
+        if end_date is not None:
+            conditions.append("substr(date, 1, 7) <= ?")
+            params.append(pd.Timestamp(end_date).strftime("%Y-%m"))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        partitions = conn.execute(
+            f"SELECT DISTINCT id, substr(date, 1, 7) FROM {table_name} {where}", params
+        ).fetchall()
+
+        columns = ["id", "id_recurso", "date"]
+        columns += HOUR_COLUMNS if table_name == "hourly_entity" else ["value"]
+        to_long = hourly_to_long if table_name == "hourly_entity" else value_to_long
+        written = 0
+        for metric_id, month in partitions:
+            df = pd.read_sql(
+                f"SELECT {', '.join(columns)} FROM {table_name} "
+                "WHERE id = ? AND date >= ? AND date < date(?, '+1 month') ORDER BY id_recurso, date",
+                conn,
+                params=(metric_id, f"{month}-01", f"{month}-01"),
+            )
+            long_df = to_long(df)
+            folder = os.path.join(
+                self._table_path(table_name), f"metric={metric_id}", f"month={month}"
+            )
+            os.makedirs(folder, exist_ok=True)
+            table = pa.Table.from_pandas(long_df, schema=LONG_SCHEMA, preserve_index=False)
+            temporary = os.path.join(folder, "part-0.parquet.tmp")
+            pq.write_table(table, temporary, compression="zstd")
+            os.replace(temporary, os.path.join(folder, "part-0.parquet"))
+            written += table.num_rows
+
+        logging.info(f"{written} filas de {table_name} exportadas en {len(partitions)} particiones")
+        return written
+
+    def read(
+        self,
+        metric_ids,
+        start_date=None,
+        end_date=None,
+        id_recurso: list = None,
+        columns: list = None,
+        table_name: str = "hourly_entity",
+    ) -> pa.Table:
+        """
+        Scans the dataset reading only the partitions, row groups and columns needed.
+
+        Args:
+            metric_ids (int or list): ids of master_table to read.
+            start_date: First date to read, included.
+            end_date: Last date to read, included.
+            id_recurso (list): Optional resources to keep.
+            columns (list): Columns to return. Defaults to id, id_recurso, timestamp and value.
+            table_name (str): hourly_entity, daily_entity or monthly_entity.
+
+        Returns:
+            pyarrow.Table: The matching rows, `.to_pandas()` converts it to a DataFrame.
+        """
+        if isinstance(metric_ids, (int, np.integer)):
+            metric_ids = [metric_ids]
+        dataset = ds.dataset(
+            self._table_path(table_name),
+            format="parquet",
+            partitioning=PARTITIONING,
+            filesystem=self.filesystem,
+        )
+
+        expression = ds.field("metric").isin(metric_ids)
+        if start_date is not None:
+            start = pd.Timestamp(start_date)
+            expression &= ds.field("month") >= start.strftime("%Y-%m")
+            expression &= ds.field("timestamp") >= pa.scalar(start.to_pydatetime(), pa.timestamp("s"))
+        if end_date is not None:
+            end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+            expression &= ds.field("month") <= pd.Timestamp(end_date).strftime("%Y-%m")
+            expression &= ds.field("timestamp") < pa.scalar(end.to_pydatetime(), pa.timestamp("s"))
+        if id_recurso:
+            expression &= ds.field("id_recurso").isin(id_recurso)
+
+        return dataset.to_table(columns=columns or LONG_SCHEMA.names, filter=expression)
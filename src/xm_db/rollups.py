@@ -0,0 +1,157 @@
+import sqlite3
+
+import pandas as pd
+
+from src.xm_db.migrations import HOUR_COLUMNS
+
+AGGREGATE_COLUMNS = ["value_sum", "value_mean", "value_min", "value_max", "value_count"]
+
+# Rollup tables derived from every entity table
+ROLLUP_TABLES = {
+    "hourly_entity": ["daily_rollup", "monthly_rollup"],
+    "daily_entity": ["monthly_rollup"],
+}
+
+# One row per stored hour of the selected hourly_entity rows
+_HOURLY_VALUES = " UNION ALL ".join(
+    f"SELECT id, id_recurso, date, {column} AS value FROM selected" for column in HOUR_COLUMNS
+)
+
+DAILY_FROM_HOURLY = f"""
+    INSERT INTO daily_rollup (id, id_recurso, date, {', '.join(AGGREGATE_COLUMNS)})
+    WITH selected AS (
+        SELECT * FROM hourly_entity WHERE id = ? AND date >= ? AND date <= ?
+    )
+    SELECT id, COALESCE(id_recurso, ''), date,
+           SUM(value), AVG(value), MIN(value), MAX(value), COUNT(value)
+    FROM ({_HOURLY_VALUES})
+    GROUP BY id, COALESCE(id_recurso, ''), date
+"""
+
+MONTHLY_FROM_DAILY = f"""
+    INSERT INTO monthly_rollup (id, id_recurso, month, {', '.join(AGGREGATE_COLUMNS)})
+    SELECT id, COALESCE(id_recurso, ''), substr(date, 1, 7),
+           SUM(value), AVG(value), MIN(value), MAX(value), COUNT(value)
+    FROM daily_entity
+    WHERE id = ? AND date >= ? AND date < ?
+    GROUP BY id, COALESCE(id_recurso, ''), substr(date, 1, 7)
+"""
+
+MONTHLY_FROM_DAILY_ROLLUP = f"""
+    INSERT INTO monthly_rollup (id, id_recurso, month, {', '.join(AGGREGATE_COLUMNS)})
+    SELECT id, id_recurso, substr(date, 1, 7),
+           SUM(value_sum), SUM(value_sum) / SUM(value_count), MIN(value_min), MAX(value_max),
+           SUM(value_count)
+    FROM daily_rollup
+    WHERE id = ? AND date >= ? AND date < ?
+    GROUP BY id, id_recurso, substr(date, 1, 7)
+"""
+
+
+def _month_bounds(start_date, end_date) -> tuple:
+    """
+    Returns the first day of the month of start_date and the first day after the month of end_date.
+    """
+    first = pd.Timestamp(start_date).strftime("%Y-%m-01")
+    after = (pd.Timestamp(end_date) + pd.offsets.MonthBegin(1)).strftime("%Y-%m-01")
+    return first, after
+
+
+def refresh_daily_rollup(conn: sqlite3.Connection, metric_id: int, start_date, end_date) -> None:
+    """
+    Recomputes the daily aggregates of an hourly metric for the days between two dates.
+    """
+    start = pd.Timestamp(start_date).strftime("%Y-%m-%d")
+    end = pd.Timestamp(end_date).strftime("%Y-%m-%d")
+    conn.execute(
+        "DELETE FROM daily_rollup WHERE id = ? AND date >= ? AND date <= ?",
+        (metric_id, start, end),
+    )
+    conn.execute(DAILY_FROM_HOURLY, (metric_id, start, end))
+
+
+def refresh_monthly_rollup(
+    conn: sqlite3.Connection, metric_id: int, start_date, end_date, source: str
+) -> None:
+    """
+    Recomputes the monthly aggregates of a metric for every month touched by the date range.
+
+    Args:
+        source (str): 'daily_entity' for daily metrics, 'daily_rollup' for hourly metrics.
+    """
+    first, after = _month_bounds(start_date, end_date)
+    conn.execute(
+        "DELETE FROM monthly_rollup WHERE id = ? AND month >= ? AND month < ?",
+        (metric_id, first[:7], after[:7]),
+    )
+    sql = MONTHLY_FROM_DAILY if source == "daily_entity" else MONTHLY_FROM_DAILY_ROLLUP
+    conn.execute(sql, (metric_id, first, after))
+
+
+def refresh_rollups(
+    conn: sqlite3.Connection, table_name: str, metric_id: int, start_date, end_date
+) -> None:
+    """
+    Updates the rollups derived from the rows of a metric written between two dates.
+    Hourly data feeds daily_rollup and then monthly_rollup, daily data feeds monthly_rollup.
+    Does not commit, so it joins the transaction of the write it follows.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the XM database.
+        table_name (str): Table the rows were written to.
+        metric_id (int): id of the metric in master_table.
+        start_date: First date written.
+        end_date: Last date written.
+    """
+    # sqlite3 binds NumPy integers as blobs, which never equal the stored ids
+    metric_id = int(metric_id)
+    if table_name == "hourly_entity":
+        refresh_daily_rollup(conn, metric_id, start_date, end_date)
+        refresh_monthly_rollup(conn, metric_id, start_date, end_date, "daily_rollup")
+    elif table_name == "daily_entity":
+        refresh_monthly_rollup(conn, metric_id, start_date, end_date, "daily_entity")
+
+
+def read_rollup(
+    conn: sqlite3.Connection,
+    metric_id: int,
+    start_date=None,
+    end_date=None,
+    level: str = "daily",
+    id_recurso: str = None,
+) -> pd.DataFrame:
+    """
+    Reads pre-aggregated values of a metric.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the XM database.
+        metric_id (int): id of the metric in master_table.
+        start_date: First day (daily) or month (monthly) to read.
+        end_date: Last day (daily) or month (monthly) to read.
+        level (str): 'daily' (hourly metrics only) or 'monthly'.
+        id_recurso (str): Optional resource, '' for metrics without resources.
+
+    Returns:
+        pandas.DataFrame: id, id_recurso, date or month and the sum/mean/min/max/count columns.
+
+    Example:
+        >>> read_rollup(conn, 12, "2024-01-01", "2024-03-31", level="monthly")
+    """
+    table_name, column, fmt = (
+        ("daily_rollup", "date", "%Y-%m-%d") if level == "daily" else ("monthly_rollup", "month", "%Y-%m")
+    )
+    conditions, params = ["id = ?"], [int(metric_id)]
+    if start_date is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(pd.Timestamp(start_date).strftime(fmt))
+    if end_date is not None:
+        conditions.append(f"{column} <= ?")
+        params.append(pd.Timestamp(end_date).strftime(fmt))
+    if id_recurso is not None:
+        conditions.append("id_recurso = ?")
+        params.append(id_recurso)
+    return pd.read_sql(
+        f"SELECT * FROM {table_name} WHERE {' AND '.join(conditions)} ORDER BY id_recurso, {column}",
+        conn,
+        params=params,
+    )
@@ -0,0 +1,470 @@
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+
+from src.xm_db.connection_pool import ReadOnlyPool
+from utils.logger import logging, CustomException
+
+QUERYABLE_TABLES = [
+    "master_table",
+    "hourly_entity",
+    "daily_entity",
+    "monthly_entity",
+    "daily_rollup",
+    "monthly_rollup",
+]
+
+TABLE_NOTES = """\
+- master_table: catalog of the XM metrics. `id` is referenced by the `id` column of every other table.
+  Type is HourlyEntities, DailyEntities, MonthlyEntities or ListsEntities.
+- hourly_entity: one row per metric, resource (id_recurso) and day, Values_Hour01..Values_Hour24
+  hold the value of each hour of the day (Values_Hour01 is 00:00-01:00).
+- daily_entity, monthly_entity: one `value` per metric, resource and day or month.
+- daily_rollup: sum/mean/min/max/count per hourly metric, resource and day. Prefer it to
+  aggregating the 24 columns of hourly_entity.
+- monthly_rollup: the same per month ('YYYY-MM') for hourly and daily metrics.
+- Dates are TEXT 'YYYY-MM-DD', compare them as strings or with the date() functions.
+- id_recurso is NULL in hourly_entity/daily_entity/monthly_entity and '' in the rollups for
+  metrics without resources."""
+
+CONTEXT_TEMPLATE = """You translate questions about the Colombian electricity market (XM) into one SQLite query.
+
+Database schema:
+{schema}
+
+Notes:
+{notes}
+
+Metrics available (id | metricId | MetricName | Entity | Type | MetricUnits):
+{catalog}
+
+Rules: answer with a single read-only SELECT statement in a ```sql block, use the metric ids
+of the catalog, never modify the database.
+
+"""
+
+QUESTION_TEMPLATE = "Question: {question}\n"
+
+RESOLVED_TEMPLATE = """Metrics matching the question (id | metricId | MetricName | Entity | Type | MetricUnits):
+{metrics}
+
+Question: {question}
+"""
+
+# Catalog section of the context when the metrics are resolved per question
+RESOLVED_CATALOG = "Only the metrics listed next to the question are relevant."
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_SQL_BLOCK = re.compile(r"```(?:sql)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_QUOTED_IDENTIFIER = re.compile(r'"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]')
+
+# Operations a query may perform, any other one (writes, pragmas, attach...) is denied by SQLite
+_ALLOWED_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    getattr(sqlite3, "SQLITE_RECURSIVE", 33),
+}
+
+
+class UnsafeQueryError(ValueError):
+    """
+    Raised when a generated or given SQL statement is not a single read-only query.
+    """
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Removes comments, the trailing semicolon and repeated whitespace outside string literals,
+    so equivalent queries share the same result cache entry.
+
+    Example:
+        >>> normalize_sql("SELECT *\\n  FROM master_table; -- todo")
+        'SELECT * FROM master_table'
+    """
+    parts, position = [], 0
+    for literal in _STRING_LITERAL.finditer(sql):
+        parts.append(_COMMENT.sub(" ", sql[position:literal.start()]))
+        parts.append(literal.group())
+        position = literal.end()
+    parts.append(_COMMENT.sub(" ", sql[position:]))
+    code = []
+    for part in parts:
+        code.append(part if part.startswith("'") else re.sub(r"\s+", " ", part))
+    return "".join(code).strip().rstrip(";").strip()
+
+
+def validate_sql(sql: str) -> str:
+    """
+    Checks that a statement is a single SELECT (or WITH ... SELECT) query.
+
+    Writes are denied by SQLite itself: the connection used by SQLQueryEngine is read-only
+    and its authorizer only allows reads. This check rejects other kinds of statement and
+    stacked statements before they reach SQLite, with a clearer error.
+
+    Returns:
+        str: The normalized statement.
+
+    Raises:
+        UnsafeQueryError: If the statement is not a SELECT or holds several statements.
+    """
+    normalized = normalize_sql(sql)
+    code = _QUOTED_IDENTIFIER.sub('""', _STRING_LITERAL.sub("''", normalized))
+    if not re.match(r"(SELECT|WITH)\b", code, re.IGNORECASE):
+        raise UnsafeQueryError(f"Solo se permiten consultas SELECT: {normalized[:100]}")
+    if ";" in code:
+        raise UnsafeQueryError("Solo se permite una sentencia por consulta")
+    return normalized
+
+
+@dataclass
+class QueryResult:
+    """
+    Result of a question or SQL statement run by SQLQueryEngine.
+
+    Attributes:
+        sql (str): The normalized statement that was run.
+        data (pandas.DataFrame): Returned rows, at most `max_rows`.
+        truncated (bool): True when the statement returned more than `max_rows` rows.
+        from_cache (bool): True when the rows came from the result cache.
+        seconds (float): Time spent answering, including the SQL generation.
+        question (str): The question the statement was generated for, if any.
+        error (str): Readable reason the question could not be answered, None on success.
+    """
+
+    sql: str
+    data: pd.DataFrame
+    truncated: bool = False
+    from_cache: bool = False
+    seconds: float = 0.0
+    question: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class _CachedResult:
+    data: pd.DataFrame
+    truncated: bool
+    versions: dict
+
+
+class SQLQueryEngine:
+    def __init__(
+        self,
+        sql_db_path: str = "src/xm_db/dbs/test_xm_data.db",
+        llm=None,
+        max_rows: int = 500,
+        cache_size: int = 256,
+        timeout_seconds: float = 10.0,
+        tables: list = None,
+        pool: ReadOnlyPool = None,
+        metric_resolver=None,
+        resolved_metrics: int = 5,
+    ):
+        """
+        Answers questions about the XM database by generating a SQLite query with an LLM and
+        running it over the read-only connections of a ReadOnlyPool, so several threads can
+        query at once while an ingestion writes.
+
+        The schema and metric catalog part of the prompt is built once and reused until
+        master_table changes, so every prompt starts with the same prefix. Results are cached
+        by normalized SQL and discarded when an ingestion bumps the version of a table they
+        read, see `DBClient.bump_table_versions`.
+
+        Args:
+            sql_db_path (str): Path to the SQLite database file.
+            llm: LlamaIndex LLM used to write the queries. Defaults to Ollama llama3.2:3b.
+            max_rows (int): Maximum number of rows returned by a query.
+            cache_size (int): Maximum number of cached results and generated statements.
+            timeout_seconds (float): Queries running longer than this are interrupted.
+            tables (list): Tables the queries may read. Defaults to QUERYABLE_TABLES.
+            pool (ReadOnlyPool): Pool to run the queries on, e.g. `DBClient.read_pool`.
+                Defaults to a new pool over `sql_db_path`.
+            metric_resolver: Object with a `resolve(question, limit)` method returning
+                (MetricRecord, score) pairs, e.g. MetricVectorStore. When given, only the
+                resolved metrics are sent with each question instead of the whole catalog.
+            resolved_metrics (int): Metrics sent per question when using `metric_resolver`.
+        """
+        self.sql_db_path = sql_db_path
+        self._llm = llm
+        self.max_rows = max_rows
+        self.cache_size = cache_size
+        self.timeout_seconds = timeout_seconds
+        self.tables = set(tables or QUERYABLE_TABLES)
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.RLock()
+        self._results = OrderedDict()
+        self._generated = OrderedDict()
+        self._context = None
+        self._context_version = None
+        self.pool = pool or ReadOnlyPool(sql_db_path)
+        self.metric_resolver = metric_resolver
+        self.resolved_metrics = resolved_metrics
+
+    @property
+    def llm(self):
+        # Created on first use, running SQL directly never needs the model
+        if self._llm is None:
+            from llama_index.llms.ollama import Ollama
+
+            self._llm = Ollama(model="llama3.2:3b", request_timeout=120.0)
+        return self._llm
+
+    def _authorizer(self, reads: set, state: dict, stored: set):
+        """
+        Returns an authorizer that, while `state['restricted']` is set, denies anything but
+        reading the allowed tables and records the tables read in `reads`. Names that are not
+        stored tables (`stored`, lowercase) are common table expressions and can be read.
+        """
+
+        def authorize(action, arg1, arg2, database, trigger):
+            if not state["restricted"]:
+                return sqlite3.SQLITE_OK
+            if action not in _ALLOWED_ACTIONS:
+                return sqlite3.SQLITE_DENY
+            if action == sqlite3.SQLITE_READ:
+                if arg1 in self.tables:
+                    reads.add(arg1)
+                elif arg1.lower() in stored or arg1.lower().startswith("sqlite_"):
+                    return sqlite3.SQLITE_DENY
+            return sqlite3.SQLITE_OK
+
+        return authorize
+
+    def table_versions(self, table_names=None) -> dict:
+        """
+        Returns the current version of the given tables, of every versioned table by default.
+        """
+        with self.pool.connection() as conn:
+            rows = conn.execute("SELECT table_name, version FROM table_versions").fetchall()
+        versions = dict(rows)
+        if table_names is None:
+            return versions
+        return {table_name: versions.get(table_name) for table_name in table_names}
+
+    def schema_context(self) -> str:
+        """
+        Returns the schema, notes and metric catalog section of the prompt, rebuilt only when
+        the version of master_table changes.
+        """
+        version = self.table_versions(["master_table"])["master_table"]
+        with self._lock:
+            if self._context is not None and self._context_version == version:
+                return self._context
+            placeholders = ", ".join("?" * len(self.tables))
+            with self.pool.connection() as conn:
+                schema = "\n".join(
+                    sql
+                    for (sql,) in conn.execute(
+                        f"SELECT sql FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders}) "
+                        "ORDER BY name",
+                        sorted(self.tables),
+                    )
+                )
+                catalog = RESOLVED_CATALOG
+                if self.metric_resolver is None:
+                    catalog = "\n".join(
+                        " | ".join("" if value is None else str(value) for value in row)
+                        for row in conn.execute(
+                            "SELECT id, metricId, MetricName, Entity, Type, MetricUnits FROM master_table ORDER BY id"
+                        )
+                    )
+            self._context = CONTEXT_TEMPLATE.format(
+                schema=schema, notes=TABLE_NOTES, catalog=catalog
+            )
+            self._context_version = version
+            logging.info(f"Contexto del esquema construido ({len(self._context)} caracteres)")
+            return self._context
+
+    def generate_sql(self, question: str) -> str:
+        """
+        Writes the SQL statement answering a question, reusing the one generated before for
+        the same question while master_table does not change.
+
+        Raises:
+            UnsafeQueryError: If the model does not answer with a single read-only query.
+        """
+        context = self.schema_context()
+        key = (" ".join(question.lower().split()), self._context_version)
+        with self._lock:
+            if key in self._generated:
+                self._generated.move_to_end(key)
+                return self._generated[key]
+
+        if self.metric_resolver is None:
+            prompt = QUESTION_TEMPLATE.format(question=question)
+        else:
+            matches = self.metric_resolver.resolve(question, self.resolved_metrics)
+            metrics = "\n".join(
+                " | ".join(
+                    "" if value is None else str(value)
+                    for value in (
+                        record.id,
+                        record.metric_id,
+                        record.metric_name,
+                        record.entity,
+                        record.type,
+                        record.units,
+                    )
+                )
+                for record, _ in matches
+            )
+            prompt = RESOLVED_TEMPLATE.format(metrics=metrics, question=question)
+        # The context always comes first, so the model server can reuse the cached prefix
+        completion = str(self.llm.complete(context + prompt))
+        block = _SQL_BLOCK.search(completion)
+        sql = validate_sql(block.group(1) if block else completion)
+        with self._lock:
+            self._generated[key] = sql
+            if len(self._generated) > self.cache_size:
+                self._generated.popitem(last=False)
+        return sql
+
+    def _cached(self, sql: str) -> Optional[_CachedResult]:
+        with self._lock:
+            entry = self._results.get(sql)
+        if entry is None:
+            return None
+        fresh = self.table_versions(entry.versions) == entry.versions
+        with self._lock:
+            if not fresh:
+                self._results.pop(sql, None)
+                return None
+            if sql in self._results:
+                self._results.move_to_end(sql)
+        return entry
+
+    def run_sql(self, sql: str) -> QueryResult:
+        """
+        Runs a read-only statement, answering from the result cache when none of the tables it
+        reads changed since it was cached.
+
+        Args:
+            sql (str): A single SELECT statement.
+
+        Returns:
+            QueryResult: The first `max_rows` rows of the statement.
+
+        Raises:
+            UnsafeQueryError: If the statement is not a single read-only query.
+            CustomException: If SQLite fails running the statement or it times out.
+
+        Example:
+            >>> engine = SQLQueryEngine()
+            >>> engine.run_sql("SELECT month, value_mean FROM monthly_rollup WHERE id = 3").data
+        """
+        start = time.perf_counter()
+        sql = validate_sql(sql)
+        entry = self._cached(sql)
+        if entry is not None:
+            self.hits += 1
+            return QueryResult(
+                sql, entry.data.copy(), entry.truncated, True, time.perf_counter() - start
+            )
+
+        self.misses += 1
+        reads, state = set(), {"restricted": False}
+        deadline = time.monotonic() + self.timeout_seconds
+        with self.pool.connection() as conn:
+            try:
+                stored = {
+                    name.lower()
+                    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")
+                }
+                # Installed only for this query, the connection goes back to a shared pool
+                conn.set_authorizer(self._authorizer(reads, state, stored))
+                conn.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+                # One read transaction, so the versions match the snapshot the rows come from
+                conn.execute("BEGIN")
+                state["restricted"] = True
+                cursor = conn.execute(sql)
+                rows = cursor.fetchmany(self.max_rows + 1)
+                columns = [description[0] for description in cursor.description]
+                cursor.close()
+                state["restricted"] = False
+                versions = dict(
+                    conn.execute("SELECT table_name, version FROM table_versions").fetchall()
+                )
+            except sqlite3.Error as err:
+                logging.error(f"Exception: {err}")
+                raise CustomException(err, sys) from err
+            finally:
+                state["restricted"] = False
+                conn.set_progress_handler(None, 0)
+                conn.rollback()
+                conn.set_authorizer(None)
+
+        truncated = len(rows) > self.max_rows
+        data = pd.DataFrame(rows[: self.max_rows], columns=columns)
+        with self._lock:
+            self._results[sql] = _CachedResult(
+                data, truncated, {table_name: versions.get(table_name) for table_name in reads}
+            )
+            if len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+        if truncated:
+            logging.info(f"Resultado truncado a {self.max_rows} filas")
+        return QueryResult(sql, data.copy(), truncated, False, time.perf_counter() - start)
+
+    def query(self, question: str) -> QueryResult:
+        """
+        Answers a question in natural language with the rows of the generated query.
+
+        Args:
+            question (str): Question about the XM metrics, e.g. 'precio de bolsa promedio de enero'.
+
+        Returns:
+            QueryResult: The generated statement and its rows. If the statement cannot be
+            generated or run, no rows and the reason in `error`.
+        """
+        start = time.perf_counter()
+        sql = ""
+        try:
+            sql = self.generate_sql(question)
+            result = self.run_sql(sql)
+        except Exception as e:
+            logging.error(f"Error answering '{question}': {CustomException(e, sys)}")
+            return QueryResult(
+                sql,
+                pd.DataFrame(),
+                seconds=time.perf_counter() - start,
+                question=question,
+                error=self.error_message(e),
+            )
+        result.question = question
+        result.seconds = time.perf_counter() - start
+        logging.info(f"Consulta generada para '{question}': {sql}")
+        return result
+
+    def error_message(self, error: Exception) -> str:
+        """
+        Returns the message shown to the user for an error answering a question.
+        """
+        cause = error.__cause__ or error
+        if isinstance(cause, UnsafeQueryError):
+            return f"La consulta generada no es una consulta de solo lectura. {cause}"
+        if isinstance(cause, sqlite3.DatabaseError):
+            if "interrupted" in str(cause):
+                return f"La consulta supero el tiempo maximo de {self.timeout_seconds:g} segundos"
+            if "not authorized" in str(cause) or "prohibited" in str(cause):
+                return "La consulta generada lee tablas u operaciones no permitidas"
+            return f"La consulta generada no es valida: {cause}"
+        return f"No fue posible responder la pregunta: {cause}"
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._results.clear()
+            self._generated.clear()
+
+    def close(self) -> None:
+        self.pool.close()
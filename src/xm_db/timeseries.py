@@ -0,0 +1,180 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from src.xm_db.migrations import HOUR_COLUMNS
+from src.xm_db.parquet_store import LONG_SCHEMA
+
+SERIES_FIELDS = LONG_SCHEMA.names
+
+_HOUR_OFFSETS = np.arange(len(HOUR_COLUMNS), dtype="timedelta64[h]").astype("timedelta64[s]")
+
+
+def _series_query(table_name: str, metric_ids: list, start_date, end_date, id_recurso) -> tuple:
+    """
+    Builds the statements reading and counting the rows of some metrics, with every filter in
+    the WHERE clause so SQLite answers them from the (id, id_recurso, date) index.
+    """
+    value_columns = HOUR_COLUMNS if table_name == "hourly_entity" else ["value"]
+    conditions = [f"id IN ({', '.join('?' * len(metric_ids))})"]
+    # sqlite3 binds NumPy integers as blobs, which never equal the stored integer ids
+    params = [int(metric_id) for metric_id in metric_ids]
+    if start_date is not None:
+        conditions.append("date >= ?")
+        params.append(pd.Timestamp(start_date).strftime("%Y-%m-%d"))
+    if end_date is not None:
+        conditions.append("date <= ?")
+        params.append(pd.Timestamp(end_date).strftime("%Y-%m-%d"))
+    if id_recurso:
+        conditions.append(f"id_recurso IN ({', '.join('?' * len(id_recurso))})")
+        params.extend(id_recurso)
+    where = " AND ".join(conditions)
+    select = (
+        f"SELECT id, id_recurso, date, {', '.join(value_columns)} FROM {table_name} "
+        f"WHERE {where} ORDER BY id, id_recurso, date"
+    )
+    return select, f"SELECT COUNT(*) FROM {table_name} WHERE {where}", params
+
+
+def empty_series(size: int) -> dict:
+    """
+    Allocates the long arrays of a series of `size` values.
+    """
+    return {
+        "id": np.empty(size, dtype=np.int64),
+        "id_recurso": np.empty(size, dtype=object),
+        "timestamp": np.empty(size, dtype="datetime64[s]"),
+        "value": np.empty(size, dtype=np.float64),
+    }
+
+
+def fill_series(rows: list, series: dict, position: int, hourly: bool) -> int:
+    """
+    Writes fetched rows (id, id_recurso, date, values...) into the long arrays of `series`
+    starting at `position`, one entry per hour for hourly rows, without intermediate arrays
+    per column. Missing values become NaN.
+
+    Returns:
+        int: Position after the last written entry.
+    """
+    table = np.array(rows, dtype=object)
+    hours = len(HOUR_COLUMNS) if hourly else 1
+    end = position + len(rows) * hours
+    # Every slice is reshaped to (rows, hours) and filled by broadcasting the row columns
+    target = {name: series[name][position:end].reshape(len(rows), hours) for name in SERIES_FIELDS}
+    target["id"][...] = table[:, 0:1].astype(np.int64)
+    target["id_recurso"][...] = table[:, 1:2]
+    target["timestamp"][...] = table[:, 2:3].astype("datetime64[D]") + _HOUR_OFFSETS[:hours]
+    target["value"][...] = table[:, 3:]
+    return end
+
+
+def rows_to_arrays(rows: list, hourly: bool) -> dict:
+    """
+    Converts fetched rows (id, id_recurso, date, values...) to contiguous long arrays.
+
+    Returns:
+        dict: 'id' (int64), 'id_recurso' (object), 'timestamp' (datetime64[s]) and 'value' (float64).
+    """
+    series = empty_series(len(rows) * (len(HOUR_COLUMNS) if hourly else 1))
+    fill_series(rows, series, 0, hourly)
+    return series
+
+
+def iter_series(
+    conn: sqlite3.Connection,
+    metric_ids,
+    start_date=None,
+    end_date=None,
+    id_recurso: list = None,
+    table_name: str = "hourly_entity",
+    chunk_rows: int = 20000,
+):
+    """
+    Streams the long (id, id_recurso, timestamp, value) series of some metrics in chunks of
+    at most `chunk_rows` stored rows, so reading years of data keeps a bounded memory use.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the XM database.
+        metric_ids (int or list): ids of master_table to read.
+        start_date: First date to read, included.
+        end_date: Last date to read, included.
+        id_recurso (list): Optional resources to keep.
+        table_name (str): hourly_entity, daily_entity or monthly_entity.
+        chunk_rows (int): Stored rows per chunk, 24 long rows each for hourly_entity.
+
+    Yields:
+        dict: NumPy arrays of the chunk, see `rows_to_arrays`. Rows are ordered by id,
+        id_recurso and date.
+    """
+    if isinstance(metric_ids, (int, np.integer)):
+        metric_ids = [metric_ids]
+    sql, _, params = _series_query(table_name, metric_ids, start_date, end_date, id_recurso)
+    cursor = conn.execute(sql, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield rows_to_arrays(rows, table_name == "hourly_entity")
+    finally:
+        cursor.close()
+
+
+def iter_record_batches(conn: sqlite3.Connection, metric_ids, **options):
+    """
+    Same as `iter_series`, yielding pyarrow.RecordBatch objects with the LONG_SCHEMA of the
+    Parquet store.
+    """
+    for arrays in iter_series(conn, metric_ids, **options):
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(arrays[name], type=LONG_SCHEMA.field(name).type) for name in SERIES_FIELDS],
+            schema=LONG_SCHEMA,
+        )
+
+
+def read_series(
+    conn: sqlite3.Connection,
+    metric_ids,
+    start_date=None,
+    end_date=None,
+    id_recurso: list = None,
+    table_name: str = "hourly_entity",
+    chunk_rows: int = 20000,
+) -> dict:
+    """
+    Reads the long series of some metrics into preallocated NumPy arrays, filled in place
+    chunk by chunk, so the peak memory is the result plus a single chunk of fetched rows.
+
+    Returns:
+        dict: 'id', 'id_recurso', 'timestamp' and 'value' arrays of the same length.
+
+    Example:
+        >>> series = read_series(conn, 12, "2023-01-01", "2024-12-31", id_recurso=["TBST"])
+        >>> series["timestamp"][:3], series["value"][:3]
+    """
+    if isinstance(metric_ids, (int, np.integer)):
+        metric_ids = [metric_ids]
+    sql, count_sql, params = _series_query(table_name, metric_ids, start_date, end_date, id_recurso)
+    # Count and read in the same snapshot, so the arrays have exactly the counted size
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        conn.execute("BEGIN")
+    try:
+        stored_rows = conn.execute(count_sql, params).fetchone()[0]
+        hourly = table_name == "hourly_entity"
+        series = empty_series(stored_rows * (len(HOUR_COLUMNS) if hourly else 1))
+        cursor = conn.execute(sql, params)
+        position = 0
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            position = fill_series(rows, series, position, hourly)
+        cursor.close()
+    finally:
+        if own_transaction:
+            conn.rollback()
+    return series
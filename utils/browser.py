@@ -0,0 +1,113 @@
+import atexit
+import threading
+from contextlib import contextmanager
+
+from utils.logger import logging
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/119.0.0.0 Safari/537.36"
+)
+
+
+def start_chrome():
+    """
+    Starts a headless Chrome driver. Selenium is imported here so listing pages over plain
+    HTTP does not need it installed.
+
+    Returns:
+        driver (webdriver.Chrome): Chrome driver
+    """
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless")  # Run in headless mode (optional)
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("start-maximized")
+    options.add_argument("disable-infobars")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument(f"user-agent={USER_AGENT}")
+    return webdriver.Chrome(options=options)
+
+
+class SharedBrowser:
+    def __init__(self, max_pages: int = 100):
+        """
+        Headless Chrome started on first use and kept alive for the whole process, so
+        scraping runs reuse it instead of paying the browser startup every time.
+
+        The driver is restarted when it stops answering and after `max_pages` page loads,
+        to give back the memory Chrome accumulates. Only one thread uses it at a time.
+
+        Args:
+            max_pages (int): Page loads before the browser is restarted.
+
+        Example:
+            >>> with shared_browser.page(url, "a.ms-srch-item-link") as driver:
+            ...     links = driver.find_elements(By.CSS_SELECTOR, "a.ms-srch-item-link")
+        """
+        self.max_pages = max_pages
+        self.pages = 0
+        self._driver = None
+        self._lock = threading.RLock()
+
+    def _alive(self) -> bool:
+        try:
+            self._driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def driver(self):
+        """
+        Returns the running driver, starting a new one if needed.
+        """
+        with self._lock:
+            if self._driver is not None and (self.pages >= self.max_pages or not self._alive()):
+                self.close()
+            if self._driver is None:
+                self._driver = start_chrome()
+                self.pages = 0
+                logging.info("Navegador compartido iniciado")
+            return self._driver
+
+    @contextmanager
+    def page(self, url: str, wait_selector: str = "body", timeout: float = 10):
+        """
+        Loads a page and lends the driver, with exclusive use, until the block ends.
+
+        Args:
+            url (str): Page to load.
+            wait_selector (str): CSS selector that must be present before returning.
+            timeout (float): Seconds to wait for the selector.
+        """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        with self._lock:
+            driver = self.driver()
+            driver.get(url)
+            self.pages += 1
+            WebDriverWait(driver, timeout).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, wait_selector))
+            )
+            yield driver
+
+    def close(self) -> None:
+        """
+        Quits the browser if it is running.
+        """
+        with self._lock:
+            if self._driver is None:
+                return
+            try:
+                self._driver.quit()
+            except Exception as err:
+                logging.warning(f"Error cerrando el navegador compartido: {err}")
+            self._driver = None
+
+
+shared_browser = SharedBrowser()
+atexit.register(shared_browser.close)
@@ -0,0 +1,244 @@
+import json
+import os
+import threading
+import unicodedata
+from typing import Iterable, Iterator, Optional
+from urllib.parse import urlparse
+
+from utils.logger import logging
+
+INDEX_FIELDS = ["name", "resolution_date", "concept", "process_date", "content_hash"]
+
+# Issuer named in the letterhead of the resolutions of every source, used to split the
+# resolutions_processed.json that CREG and UPME shared in previous versions
+LEGACY_MARKERS = {
+    "creg": ["COMISION DE REGULACION DE ENERGIA Y GAS", "CREG"],
+    "upme": ["UNIDAD DE PLANEACION MINERO ENERGETICA", "UPME"],
+}
+
+
+def record_key(record: dict) -> str:
+    """
+    Key of a processed resolution: its url, or its name for records saved without url.
+    """
+    return record.get("url") or f"name:{record.get('name')}"
+
+
+def legacy_source(record: dict, header_chars: int = 2000) -> Optional[str]:
+    """
+    Source ('creg' or 'upme') of a record of the shared legacy file: the host of its url,
+    or else the issuer named first in the beginning of its text. None if neither is found.
+    """
+    host = urlparse(record.get("url") or "").netloc
+    for source in LEGACY_MARKERS:
+        if host.endswith(f"{source}.gov.co"):
+            return source
+    header = unicodedata.normalize("NFKD", (record.get("full_text") or "")[:header_chars])
+    header = "".join(char for char in header if not unicodedata.combining(char)).upper()
+    positions = {
+        source: min((header.find(marker) for marker in markers if marker in header), default=-1)
+        for source, markers in LEGACY_MARKERS.items()
+    }
+    found = {source: position for source, position in positions.items() if position >= 0}
+    return min(found, key=found.get) if found else None
+
+
+class CorpusStore:
+    def __init__(self, folder: str, legacy_json: str = None, source: str = None):
+        """
+        Append-only JSONL file of processed resolutions with a small side index, so listing
+        the corpus never reads the full texts and documents are loaded one at a time.
+
+        Every record is one line of corpus.jsonl. corpus_index.json keeps, per resolution,
+        its metadata and the byte offset of its last version. A changed resolution is
+        appended again and the index points to the new line; `compact` drops the old ones.
+
+        Args:
+            folder (str): Folder of corpus.jsonl and corpus_index.json.
+            legacy_json (str): resolutions_processed.json of previous versions, imported
+                once if the store is empty.
+            source (str): 'creg' or 'upme' to import only the legacy records of that source,
+                see `legacy_source`. All of them by default.
+
+        Example:
+            >>> store = CorpusStore("src/creg/data/processed")
+            >>> [entry["name"] for entry in store.metadata()]
+            >>> for document in store.iter_documents():
+            ...     print(document.metadata["name"])
+        """
+        self.folder = folder
+        self.corpus_path = os.path.join(folder, "corpus.jsonl")
+        self.index_path = os.path.join(folder, "corpus_index.json")
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self.index = self._load_index()
+        if not self.index and legacy_json and os.path.exists(legacy_json):
+            self._import_legacy(legacy_json, source)
+
+    def _import_legacy(self, legacy_json: str, source: str = None) -> None:
+        with open(legacy_json, "r", encoding="utf-8") as file:
+            records = json.load(file)
+        if source is not None:
+            unknown = [record.get("name") for record in records if legacy_source(record) is None]
+            if unknown:
+                logging.warning(
+                    f"{len(unknown)} resoluciones de {legacy_json} sin fuente reconocida, "
+                    f"no se importan: {unknown}"
+                )
+            records = [record for record in records if legacy_source(record) == source]
+        if records:
+            self.append(records)
+            logging.info(f"{len(records)} resoluciones importadas de {legacy_json}")
+
+    def _corpus_size(self) -> int:
+        return os.path.getsize(self.corpus_path) if os.path.exists(self.corpus_path) else 0
+
+    def _load_index(self) -> dict:
+        """
+        Reads the side index, rebuilding it from the corpus if it is missing or does not
+        cover the whole file (e.g. the process stopped between both writes).
+        """
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                saved = json.load(file)
+            if saved.get("size") == self._corpus_size():
+                return saved["documents"]
+        return self._rebuild_index()
+
+    def _rebuild_index(self) -> dict:
+        """
+        Reads the whole corpus again. A last line left incomplete by a process stopped in
+        the middle of `append` is cut from the file. CREG and UPME mark a document as parsed
+        only after `append` returns, so the registry never holds a record cut here and its
+        file is still in the data folder to be parsed by the next run.
+        """
+        index = {}
+        if os.path.exists(self.corpus_path):
+            offset = 0
+            with open(self.corpus_path, "rb") as file:
+                for line in file:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("line without end")
+                        if line.strip():
+                            record = json.loads(line)
+                            index[record_key(record)] = self._index_entry(record, offset, len(line))
+                    except ValueError as err:
+                        logging.warning(
+                            f"Corpus {self.corpus_path} truncado en el byte {offset}: {err}"
+                        )
+                        break
+                    offset += len(line)
+            if offset < self._corpus_size():
+                with open(self.corpus_path, "r+b") as file:
+                    file.truncate(offset)
+        self._save_index(index)
+        return index
+
+    @staticmethod
+    def _index_entry(record: dict, offset: int, length: int) -> dict:
+        entry = {field: record.get(field) for field in INDEX_FIELDS}
+        entry.update(offset=offset, length=length)
+        return entry
+
+    def _save_index(self, index: dict) -> None:
+        temporary_path = f"{self.index_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"size": self._corpus_size(), "documents": index}, file, ensure_ascii=False)
+        os.replace(temporary_path, self.index_path)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def append(self, records: Iterable[dict]) -> int:
+        """
+        Adds processed resolutions, replacing the previous version of the ones already
+        stored (same url, or same name for records without url).
+
+        Returns:
+            int: Number of resolutions in the store.
+        """
+        with self._lock:
+            with open(self.corpus_path, "ab") as file:
+                for record in records:
+                    line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+                    entry = self._index_entry(record, file.tell(), len(line))
+                    # Record and newline in a single write, a stopped process leaves at most
+                    # one incomplete last line
+                    file.write(line)
+                    self.index[record_key(record)] = entry
+                file.flush()
+                os.fsync(file.fileno())
+            self._save_index(self.index)
+            return len(self.index)
+
+    def metadata(self) -> list:
+        """
+        Returns the metadata of every resolution (key, name, resolution_date, concept,
+        process_date, content_hash) without reading the corpus file.
+        """
+        return [
+            {"key": key, **{field: entry[field] for field in INDEX_FIELDS}}
+            for key, entry in self.index.items()
+        ]
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Returns the full record of a resolution, None if it is not stored.
+        """
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        with open(self.corpus_path, "rb") as file:
+            file.seek(entry["offset"])
+            return json.loads(file.read(entry["length"]))
+
+    def iter_records(self, keys: Iterable[str] = None) -> Iterator[dict]:
+        """
+        Yields the full records of some resolutions, all by default, reading one line at
+        a time in file order.
+        """
+        keys = list(self.index) if keys is None else [key for key in keys if key in self.index]
+        entries = sorted((self.index[key] for key in keys), key=lambda entry: entry["offset"])
+        if not entries:
+            return
+        with open(self.corpus_path, "rb") as file:
+            for entry in entries:
+                file.seek(entry["offset"])
+                yield json.loads(file.read(entry["length"]))
+
+    def iter_documents(self, keys: Iterable[str] = None) -> Iterator:
+        """
+        Yields llama-index Documents of some resolutions, all by default, one at a time.
+        """
+        from llama_index.core import Document
+
+        for record in self.iter_records(keys):
+            yield Document(
+                text=record["full_text"],
+                metadata={
+                    "name": record["name"],
+                    "date": record["resolution_date"],
+                    "concept": record["concept"],
+                },
+            )
+
+    def compact(self) -> None:
+        """
+        Rewrites corpus.jsonl with only the last version of every resolution.
+        """
+        with self._lock:
+            temporary_path = f"{self.corpus_path}.tmp"
+            index = {}
+            with open(self.corpus_path, "rb") as source, open(temporary_path, "wb") as target:
+                for key, entry in sorted(self.index.items(), key=lambda item: item[1]["offset"]):
+                    source.seek(entry["offset"])
+                    line = source.read(entry["length"])
+                    index[key] = {**entry, "offset": target.tell()}
+                    target.write(line)
+            os.replace(temporary_path, self.corpus_path)
+            self.index = index
+            self._save_index(index)
@@ -0,0 +1,185 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    source TEXT NOT NULL,
+    url TEXT NOT NULL,
+    filename TEXT,
+    content_hash TEXT,
+    downloaded_at TEXT,
+    parsed_hash TEXT,
+    parse_error TEXT,
+    name TEXT,
+    parsed_at TEXT,
+    indexed_hash TEXT,
+    indexed_at TEXT,
+    PRIMARY KEY (source, url)
+);
+CREATE INDEX IF NOT EXISTS idx_documents_filename ON documents (source, filename);
+CREATE INDEX IF NOT EXISTS idx_documents_parsed_hash ON documents (source, parsed_hash);
+"""
+
+
+def file_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    sha256 of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DocumentRegistry:
+    def __init__(self, source: str, path: str):
+        """
+        Persistent record of the documents of a source (CREG, UPME) keyed by URL, with the
+        content hash seen by every stage, so downloads, parsing and embedding only do work
+        for documents that are new or whose content changed.
+
+        A document needs parsing when its downloaded content hash differs from the parsed
+        one, and indexing when its parsed hash differs from the indexed one. Content already
+        parsed under another URL of the same source is not parsed again.
+
+        Args:
+            source (str): Namespace of the documents, e.g. 'creg' or 'upme'.
+            path (str): SQLite file of the registry, it can be shared by several sources.
+
+        Example:
+            >>> registry = DocumentRegistry("creg", "src/creg/data/document_registry.db")
+            >>> registry.record_download(url, "file.docx", content_hash)
+            True
+        """
+        self.source = source
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def _fetch(self, sql: str, params: tuple) -> list:
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def _write(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            self.conn.execute(sql, params)
+            self.conn.commit()
+
+    def get(self, url: str) -> Optional[dict]:
+        rows = self._fetch("SELECT * FROM documents WHERE source = ? AND url = ?", (self.source, url))
+        return rows[0] if rows else None
+
+    def by_filename(self, filename: str) -> Optional[dict]:
+        """
+        Returns the last downloaded document saved with a given file name.
+        """
+        rows = self._fetch(
+            "SELECT * FROM documents WHERE source = ? AND filename = ? "
+            "ORDER BY downloaded_at DESC LIMIT 1",
+            (self.source, filename),
+        )
+        return rows[0] if rows else None
+
+    def needs_parsing(self, url: str, content_hash: str) -> bool:
+        """
+        Whether a content was not parsed yet, under this URL or any other of the source.
+        """
+        rows = self._fetch(
+            "SELECT 1 FROM documents WHERE source = ? AND parsed_hash = ? "
+            "AND (url = ? OR parse_error IS NULL) LIMIT 1",
+            (self.source, content_hash, url),
+        )
+        return not rows
+
+    def record_download(self, url: str, filename: str, content_hash: str) -> bool:
+        """
+        Records the content downloaded from a URL.
+
+        Returns:
+            bool: True if the content has to be parsed, False if it was already parsed.
+        """
+        self._write(
+            "INSERT INTO documents (source, url, filename, content_hash, downloaded_at) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT (source, url) DO UPDATE SET "
+            "filename = excluded.filename, content_hash = excluded.content_hash, "
+            "downloaded_at = excluded.downloaded_at",
+            (self.source, url, filename, content_hash, self._now()),
+        )
+        return self.needs_parsing(url, content_hash)
+
+    def mark_parsed(self, url: str, content_hash: str, name: str = None, error: str = None) -> None:
+        """
+        Records the outcome of parsing a content. Failed contents are not parsed again until
+        they change, they stay in the to_check folder for a manual review.
+        """
+        self._write(
+            "INSERT INTO documents (source, url, content_hash, parsed_hash, parse_error, name, "
+            "parsed_at) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (source, url) DO UPDATE SET "
+            "content_hash = excluded.content_hash, parsed_hash = excluded.parsed_hash, "
+            "parse_error = excluded.parse_error, name = excluded.name, "
+            "parsed_at = excluded.parsed_at",
+            (self.source, url, content_hash, content_hash, error, name, self._now()),
+        )
+
+    def pending_index(self) -> list:
+        """
+        Returns the documents parsed successfully whose last content is not indexed yet.
+        """
+        return self._fetch(
+            "SELECT * FROM documents WHERE source = ? AND parsed_hash IS NOT NULL "
+            "AND parse_error IS NULL AND (indexed_hash IS NULL OR indexed_hash != parsed_hash) "
+            "ORDER BY url",
+            (self.source,),
+        )
+
+    def mark_indexed(self, url: str, content_hash: str) -> None:
+        """
+        Records that the given content of a document is in the vector store.
+        """
+        self._write(
+            "UPDATE documents SET indexed_hash = ?, indexed_at = ? WHERE source = ? AND url = ?",
+            (content_hash, self._now(), self.source, url),
+        )
+
+    def reset_indexed(self) -> None:
+        """
+        Marks every document of the source as not indexed, e.g. after emptying its collection.
+        """
+        self._write(
+            "UPDATE documents SET indexed_hash = NULL, indexed_at = NULL WHERE source = ?",
+            (self.source,),
+        )
+
+    def index_version(self) -> str:
+        """
+        Token that changes whenever a document of the source is indexed or the index is
+        reset, used by readers of the vector store to know when to reload it.
+        """
+        rows = self._fetch(
+            "SELECT COUNT(indexed_hash) AS indexed, MAX(indexed_at) AS last_indexed, "
+            "GROUP_CONCAT(indexed_hash) AS hashes FROM documents WHERE source = ?",
+            (self.source,),
+        )
+        row = rows[0]
+        digest = hashlib.sha1((row["hashes"] or "").encode("utf-8")).hexdigest()
+        return f"{row['indexed']}:{row['last_indexed']}:{digest}"
+
+    def documents(self) -> list:
+        return self._fetch("SELECT * FROM documents WHERE source = ? ORDER BY url", (self.source,))
+
+    def close(self) -> None:
+        self.conn.close()
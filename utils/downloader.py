@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.logger import logging
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class RetryableStatus(Exception):
+    """
+    Raised for responses worth retrying, e.g. 503 while the server is overloaded.
+    """
+
+
+@dataclass
+class DownloadResult:
+    """
+    Outcome of the download of one file.
+
+    Attributes:
+        url (str): Requested URL.
+        path (str): Local destination of the file.
+        status (str): 'downloaded', 'not_modified' (the server answered 304) or 'failed'.
+        size (int): Bytes written to disk, 0 unless downloaded.
+        attempts (int): Number of requests sent.
+        error (str): Last error message, None unless failed.
+        content_hash (str): sha256 of the body, None unless downloaded.
+    """
+
+    url: str
+    path: str
+    status: str
+    size: int = 0
+    attempts: int = 0
+    error: Optional[str] = None
+    content_hash: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status != "failed"
+
+
+class Downloader:
+    def __init__(
+        self,
+        headers: dict = None,
+        validators_path: str = None,
+        max_workers: int = 4,
+        timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff_seconds: float = 1.0,
+        backoff_factor: float = 2.0,
+        chunk_size: int = 64 * 1024,
+    ):
+        """
+        Downloads documents over a pooled HTTP session with a bounded number of requests in
+        flight, streaming every body to disk in chunks instead of holding it in memory.
+
+        The ETag and Last-Modified headers of every download are kept in `validators_path`,
+        so the next request of the same URL is conditional and files the server reports as
+        unchanged (304) are skipped, even if they were already processed and removed.
+
+        Args:
+            headers (dict): Headers sent with every request, e.g. the User-Agent.
+            validators_path (str): JSON file with the validators of past downloads. Without
+                it requests are never conditional.
+            max_workers (int): Maximum number of downloads in flight, also the size of the
+                connection pool.
+            timeout (float): Seconds to wait for the server to connect or send data.
+            max_retries (int): Retries per file after the first failed attempt.
+            backoff_seconds (float): Wait before the first retry.
+            backoff_factor (float): Multiplier applied to the wait on every new retry.
+            chunk_size (int): Bytes written to disk at a time.
+
+        Example:
+            >>> downloader = Downloader(validators_path="src/creg/data/download_validators.json")
+            >>> results = downloader.download_many([(url, "src/creg/data/file.docx")])
+            >>> [result.status for result in results]
+        """
+        self.validators_path = validators_path
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.backoff_factor = backoff_factor
+        self.chunk_size = chunk_size
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self.validators = self._load_validators()
+
+    def _load_validators(self) -> dict:
+        if not self.validators_path or not os.path.exists(self.validators_path):
+            return {}
+        try:
+            with open(self.validators_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError) as err:
+            logging.warning(f"No se pudieron leer los validadores de descarga: {err}")
+            return {}
+
+    def save_validators(self) -> None:
+        """
+        Writes the validators of the downloads to `validators_path`, atomically.
+        """
+        if not self.validators_path:
+            return
+        folder = os.path.dirname(self.validators_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self._lock:
+            content = json.dumps(self.validators, indent=4, ensure_ascii=False)
+        temporary_path = f"{self.validators_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(temporary_path, self.validators_path)
+
+    def _backoff(self, attempt: int) -> float:
+        delay = self.backoff_seconds * self.backoff_factor ** (attempt - 1)
+        return delay + random.uniform(0, delay / 2)
+
+    def _conditional_headers(self, url: str) -> dict:
+        with self._lock:
+            validator = self.validators.get(url, {})
+        headers = {}
+        if validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator.get("last_modified"):
+            headers["If-Modified-Since"] = validator["last_modified"]
+        return headers
+
+    def _request(self, url: str, path: str) -> tuple:
+        """
+        Sends one request and streams the body to a temporary file, renamed to `path` only
+        once complete so an interrupted download never leaves a truncated document.
+        """
+        with self.session.get(
+            url, headers=self._conditional_headers(url), stream=True, timeout=self.timeout
+        ) as response:
+            if response.status_code == 304:
+                return "not_modified", 0, None
+            if response.status_code in RETRY_STATUS:
+                raise RetryableStatus(f"HTTP {response.status_code}")
+            response.raise_for_status()
+
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            temporary_path = f"{path}.part"
+            size = 0
+            digest = hashlib.sha256()
+            try:
+                with open(temporary_path, "wb") as file:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        file.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                os.replace(temporary_path, path)
+            finally:
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+
+            validator = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "path": path,
+                "size": size,
+                "content_hash": digest.hexdigest(),
+            }
+        with self._lock:
+            self.validators[url] = validator
+        return "downloaded", size, validator["content_hash"]
+
+    def download(self, url: str, path: str) -> DownloadResult:
+        """
+        Downloads a file, retrying connection errors, timeouts and 429/5xx answers with an
+        exponential backoff. Other HTTP errors fail at once.
+
+        Args:
+            url (str): URL of the file.
+            path (str): Local destination of the file.
+
+        Returns:
+            DownloadResult: Outcome of the download, never raises.
+        """
+        error = None
+        for attempt in range(1, self.max_retries + 2):
+            try:
+                status, size, content_hash = self._request(url, path)
+                return DownloadResult(url, path, status, size, attempt, None, content_hash)
+            except (requests.ConnectionError, requests.Timeout, RetryableStatus) as err:
+                error = f"{type(err).__name__}: {err}"
+                logging.warning(f"Intento {attempt} fallido para {url}: {error}")
+                if attempt <= self.max_retries:
+                    time.sleep(self._backoff(attempt))
+            except Exception as err:
+                error = f"{type(err).__name__}: {err}"
+                break
+        logging.error(f"Error descargando {url}: {error}")
+        return DownloadResult(url, path, "failed", 0, attempt, error)
+
+    def download_many(self, items: Iterable[tuple]) -> list:
+        """
+        Downloads several files at the same time, at most `max_workers` in flight, and saves
+        the validators once all of them are done.
+
+        Args:
+            items (iterable): (url, path) pairs.
+
+        Returns:
+            list: DownloadResult of every item, in the same order.
+        """
+        items = list(items)
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="downloader"
+        ) as executor:
+            results = list(executor.map(lambda item: self.download(*item), items))
+        self.save_validators()
+
+        counts = {}
+        for result in results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+        logging.info(f"Descargas terminadas: {counts}")
+        return results
+
+    def close(self) -> None:
+        """
+        Closes the pooled connections of the session.
+        """
+        self.session.close()
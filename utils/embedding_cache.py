@@ -0,0 +1,230 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Any, List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+from utils.logger import logging
+
+EMBEDDING_CACHE_PATH = "embedding_cache/embeddings.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    model_name TEXT NOT NULL,
+    dimension INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def normalize_text(text: str) -> str:
+    """
+    Text as compared by the cache: NFC unicode and collapsed whitespace, so the same chunk
+    extracted again with other line breaks or spaces is still a hit.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    normalized = normalize_text(text)
+    return hashlib.sha256(f"{model_name}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = 1024 ** 3):
+        """
+        Persistent store of embeddings keyed by model name and normalized text hash, so a
+        chunk is only sent to the embedding model once, whatever collection, splitter run
+        or rebuild asks for it.
+
+        Vectors are saved as float32 arrays (4 bytes per dimension). When the vectors take
+        more than `max_bytes`, the least recently used ones are evicted.
+
+        Args:
+            path (str): SQLite file of the cache, it can be shared by several models.
+            max_bytes (int): Maximum size of the stored vectors.
+
+        Example:
+            >>> cache = EmbeddingCache("embedding_cache/embeddings.db")
+            >>> cache.put_many("mxbai-embed-large", ["texto"], [[0.1, 0.2]])
+            >>> cache.get_many("mxbai-embed-large", ["texto"])
+            [[0.10000000149011612, 0.20000000298023224]]
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self.size = self.conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Returns the cached embedding of every text, None for the ones not cached.
+        """
+        keys = [cache_key(model_name, text) for text in texts]
+        found = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self.conn.commit()
+
+        embeddings = [
+            None if found.get(key) is None else array("f", found[key]).tolist() for key in keys
+        ]
+        hits = sum(embedding is not None for embedding in embeddings)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return embeddings
+
+    def put_many(self, model_name: str, texts: List[str], embeddings: List[List[float]]) -> None:
+        """
+        Stores the embeddings of some texts, evicting the least recently used ones if the
+        cache goes over its size.
+        """
+        now = time.time()
+        rows = {}
+        for text, embedding in zip(texts, embeddings):
+            vector = array("f", embedding).tobytes()
+            rows[cache_key(model_name, text)] = (model_name, len(embedding), vector, now)
+        with self._lock:
+            for start in range(0, len(rows), 500):
+                chunk = list(rows)[start:start + 500]
+                replaced = self.conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings "
+                    f"WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchone()[0]
+                self.size -= replaced
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model_name, dimension, vector, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(key, *row) for key, row in rows.items()],
+            )
+            self.size += sum(len(row[2]) for row in rows.values())
+            if self.size > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        """
+        Deletes the least recently used vectors until the cache is 10% under its size.
+        """
+        target = self.max_bytes * 0.9
+        keys = []
+        rows = self.conn.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used"
+        )
+        for key, length in rows:
+            if self.size <= target:
+                break
+            keys.append((key,))
+            self.size -= length
+        self.conn.executemany("DELETE FROM embeddings WHERE key = ?", keys)
+        self.evicted += len(keys)
+        logging.info(f"Cache de embeddings: {len(keys)} vectores eliminados por tamaño")
+
+    def stats(self) -> dict:
+        """
+        Returns hits, misses and evictions of this process and the entries and bytes stored.
+        """
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "entries": entries,
+            "bytes": self.size,
+        }
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    LlamaIndex embedding model that answers document embeddings from an EmbeddingCache and
+    only sends the texts it misses to the wrapped model. Queries are not cached, every
+    question is embedded by the wrapped model.
+
+    Example:
+        >>> model = CachedEmbedding(OllamaEmbedding(model_name="mxbai-embed-large"))
+        >>> Settings.embed_model = model
+    """
+
+    model: BaseEmbedding
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, model: BaseEmbedding, cache: EmbeddingCache = None, **kwargs: Any):
+        super().__init__(
+            model=model,
+            model_name=model.model_name,
+            embed_batch_size=model.embed_batch_size,
+            **kwargs,
+        )
+        self._cache = cache or EmbeddingCache()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self.model.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self._cache.get_many(self.model_name, texts)
+        missing = {}
+        for position, (text, embedding) in enumerate(zip(texts, embeddings)):
+            if embedding is None:
+                missing.setdefault(normalize_text(text), []).append(position)
+        if missing:
+            # One text per distinct chunk, repeated chunks of a batch are embedded once
+            first_texts = [texts[positions[0]] for positions in missing.values()]
+            computed = self.model.get_text_embedding_batch(first_texts)
+            self._cache.put_many(self.model_name, first_texts, computed)
+            for positions, embedding in zip(missing.values(), computed):
+                for position in positions:
+                    embeddings[position] = embedding
+        return embeddings
@@ -0,0 +1,73 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+
+class EmbeddingScheduler:
+    def __init__(self, embedding_model, max_in_flight: int = 2):
+        """
+        Embeds batches of nodes with up to `max_in_flight` requests to the embedding model
+        running at the same time, and hands every embedded batch back while the next ones
+        are still being computed, so the model, the network and the Chroma writes overlap.
+
+        Batches are yielded in the order they were received, which lets the caller mark a
+        document as indexed once its last batch is written. At most `max_in_flight` + 1 batches
+        are pending at any time, so a long backfill does not hold every chunk in memory.
+
+        Args:
+            embedding_model: LlamaIndex embedding model. Every batch is sent with
+                get_text_embedding_batch, so its embed_batch_size should be at least the
+                size of the batches to embed each one in a single request.
+            max_in_flight (int): Batch requests running at the same time, 1 embeds them
+                one after the other in a background thread.
+
+        Example:
+            >>> scheduler = EmbeddingScheduler(model, max_in_flight=4)
+            >>> for nodes, payload in scheduler.embed(batches):
+            ...     vector_store.add(nodes)
+        """
+        self.embedding_model = embedding_model
+        self.max_in_flight = max(1, max_in_flight)
+
+    def _embed_batch(self, nodes: list) -> list:
+        from llama_index.core.schema import MetadataMode
+
+        if not nodes:
+            return nodes
+        embeddings = self.embedding_model.get_text_embedding_batch(
+            [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        )
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding
+        return nodes
+
+    def embed(self, batches: Iterable[tuple]) -> Iterator[tuple]:
+        """
+        Embeds an iterable of (nodes, payload) batches.
+
+        Args:
+            batches (iterable): Tuples of a list of nodes and any value the caller needs
+                back with them, e.g. the documents completed by the batch. Batches without
+                nodes are passed through.
+
+        Yields:
+            tuple: (nodes with their embedding set, payload), in the input order. An error
+            of the embedding model is raised when its batch is reached.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            in_flight = deque()
+            try:
+                for nodes, payload in batches:
+                    in_flight.append((executor.submit(self._embed_batch, nodes), payload))
+                    # One batch waits in the queue so the workers stay busy while the
+                    # caller writes the batch it receives
+                    if len(in_flight) > self.max_in_flight:
+                        future, pending_payload = in_flight.popleft()
+                        yield future.result(), pending_payload
+                while in_flight:
+                    future, pending_payload = in_flight.popleft()
+                    yield future.result(), pending_payload
+            finally:
+                for future, _ in in_flight:
+                    future.cancel()
+
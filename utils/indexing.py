@@ -0,0 +1,201 @@
+import hashlib
+import sys
+from typing import Iterator
+
+from utils.corpus_store import CorpusStore
+from utils.document_registry import DocumentRegistry
+from utils.embedding_scheduler import EmbeddingScheduler
+from utils.logger import logging, CustomException
+
+
+def document_id(source: str, key: str) -> str:
+    """
+    Stable id of a resolution inside the vector store.
+    """
+    return hashlib.sha1(f"{source}|{key}".encode("utf-8")).hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IndexingPipeline:
+    def __init__(
+        self,
+        source: str,
+        corpus: CorpusStore,
+        registry: DocumentRegistry,
+        collection,
+        embedding_model,
+        splitter=None,
+        batch_size: int = 32,
+        max_in_flight: int = 2,
+    ):
+        """
+        Chunks the processed resolutions of a source and embeds them into its Chroma
+        collection (creg_index, upme_index), only for the resolutions the registry reports as
+        not indexed yet, so a daily refresh costs time proportional to the new documents.
+
+        Node ids are derived from the document id and the hash of the chunk, so unchanged
+        chunks of a changed resolution keep their id and are not embedded again, and the
+        nodes of its old chunks are deleted.
+
+        Args:
+            source (str): Namespace of the documents, 'creg' or 'upme'.
+            corpus (CorpusStore): Processed resolutions of the source.
+            registry (DocumentRegistry): Registry of the source.
+            collection: Chroma collection of the source.
+            embedding_model: LlamaIndex embedding model.
+            splitter: LlamaIndex node parser. Defaults to a SentenceSplitter with the
+                llama-index default chunk size.
+            batch_size (int): Chunks sent per request to the embedding model.
+            max_in_flight (int): Batch requests to the embedding model running at the
+                same time.
+
+        Example:
+            >>> pipeline = IndexingPipeline("creg", creg.corpus, creg.registry, collection, model)
+            >>> pipeline.run()
+            {'documents': 3, 'embedded': 41, 'reused': 0, 'deleted': 0}
+        """
+        from llama_index.core.node_parser import SentenceSplitter
+        from llama_index.vector_stores.chroma import ChromaVectorStore
+
+        self.source = source
+        self.corpus = corpus
+        self.registry = registry
+        self.collection = collection
+        self.vector_store = ChromaVectorStore(chroma_collection=collection)
+        self.embedding_model = embedding_model
+        self.splitter = splitter or SentenceSplitter()
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+
+    def register_corpus(self) -> int:
+        """
+        Adds to the registry the resolutions of the corpus it does not know, e.g. imported
+        from a resolutions_processed.json of a previous version, so they get indexed once.
+
+        Returns:
+            int: Number of resolutions registered.
+        """
+        known = {document["url"] for document in self.registry.documents()}
+        registered = 0
+        for entry in self.corpus.metadata():
+            if entry["key"] in known:
+                continue
+            content_hash = entry["content_hash"]
+            if content_hash is None:
+                content_hash = text_hash(self.corpus.get(entry["key"])["full_text"])
+            self.registry.mark_parsed(entry["key"], content_hash, name=entry["name"])
+            registered += 1
+        return registered
+
+    def build_nodes(self, key: str) -> list:
+        """
+        Splits a resolution in nodes with deterministic ids.
+        """
+        from llama_index.core import Document
+        from llama_index.core.schema import MetadataMode
+
+        record = self.corpus.get(key)
+        doc_id = document_id(self.source, key)
+        document = Document(
+            id_=doc_id,
+            text=record["full_text"],
+            metadata={
+                "name": record["name"],
+                "date": record["resolution_date"],
+                "concept": record["concept"],
+            },
+        )
+        nodes = self.splitter.get_nodes_from_documents([document])
+        occurrences = {}
+        for node in nodes:
+            # The embedded content includes the metadata, a new concept changes every chunk
+            chunk_hash = text_hash(node.get_content(metadata_mode=MetadataMode.EMBED))
+            occurrence = occurrences.get(chunk_hash, 0)
+            occurrences[chunk_hash] = occurrence + 1
+            node_key = f"{doc_id}|{chunk_hash}|{occurrence}"
+            node.id_ = hashlib.sha1(node_key.encode("utf-8")).hexdigest()
+        return nodes
+
+    def _batches(self, counts: dict) -> Iterator[tuple]:
+        """
+        Yields the nodes to embed in batches of `batch_size`, each with the old node ids to
+        delete and the documents whose last node is in the batch.
+        """
+        nodes, stale_ids, documents = [], [], []
+        for pending in self.registry.pending_index():
+            key, content_hash = pending["url"], pending["parsed_hash"]
+            if key not in self.corpus:
+                continue
+            new_nodes = self.build_nodes(key)
+            stored_ids = set(
+                self.collection.get(
+                    where={"document_id": document_id(self.source, key)}, include=[]
+                )["ids"]
+            )
+            new_ids = {node.id_ for node in new_nodes}
+            nodes.extend(node for node in new_nodes if node.id_ not in stored_ids)
+            stale_ids.extend(stored_ids - new_ids)
+            documents.append((key, content_hash))
+
+            counts["documents"] += 1
+            counts["embedded"] += len(new_ids - stored_ids)
+            counts["reused"] += len(new_ids & stored_ids)
+            counts["deleted"] += len(stored_ids - new_ids)
+            while len(nodes) >= self.batch_size:
+                batch, nodes = nodes[:self.batch_size], nodes[self.batch_size:]
+                if nodes:
+                    # The last document still has nodes in the next batch
+                    yield batch, ([], [])
+                else:
+                    yield batch, (stale_ids, documents)
+                    stale_ids, documents = [], []
+        if nodes or documents:
+            yield nodes, (stale_ids, documents)
+
+    def run(self, rebuild: bool = False) -> dict:
+        """
+        Indexes the resolutions that are new or changed since the last run.
+
+        Chunks are embedded in batches of `batch_size` with up to `max_in_flight` requests
+        at the same time, and every batch is written to Chroma as soon as it is embedded.
+        The old chunks of a document are deleted and the document marked as indexed after
+        its last batch is written, so a failure never marks a document it did not write.
+
+        Args:
+            rebuild (bool): Empty the collection and index every resolution again, e.g. once
+                for collections built by hand in the notebooks, whose ids are random.
+
+        Returns:
+            dict: Number of 'documents' indexed, chunks 'embedded', chunks 'reused' from
+            the previous version of a document and old chunks 'deleted'.
+
+        Raises:
+            CustomException: If the embedding model or Chroma fail. Documents written
+            before the failure stay indexed.
+        """
+        try:
+            if rebuild:
+                ids = self.collection.get(include=[])["ids"]
+                for start in range(0, len(ids), 5000):
+                    self.collection.delete(ids=ids[start:start + 5000])
+                self.registry.reset_indexed()
+            self.register_corpus()
+
+            counts = {"documents": 0, "embedded": 0, "reused": 0, "deleted": 0}
+            scheduler = EmbeddingScheduler(self.embedding_model, self.max_in_flight)
+            for nodes, (stale_ids, documents) in scheduler.embed(self._batches(counts)):
+                if nodes:
+                    self.vector_store.add(nodes)
+                if stale_ids:
+                    self.collection.delete(ids=stale_ids)
+                for key, content_hash in documents:
+                    self.registry.mark_indexed(key, content_hash)
+
+            logging.info(f"Indice {self.source} actualizado: {counts}")
+            return counts
+        except Exception as err:
+            logging.error(f"Exception: {err}")
+            raise CustomException(err, sys) from err
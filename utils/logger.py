@@ -4,9 +4,23 @@ from datetime import datetime
 
 LOG_FILE = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
 logs_path = os.path.join(os.getcwd(), "logs", LOG_FILE)
-os.makedirs(logs_path, exist_ok=True)
 LOG_FILE_PATH = os.path.join(logs_path, LOG_FILE)
 
+
+class LazyFileHandler(logging.FileHandler):
+    """
+    File handler that creates the log folder and file with the first record, so importing
+    this module (e.g. from the app) does not leave an empty log folder behind.
+    """
+
+    def __init__(self, filename: str):
+        super().__init__(filename, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
 def error_message_detail(error, error_detail:sys):
     _,_,exc_tb = error_detail.exc_info()
     file_name = exc_tb.tb_frame.f_code.co_filename
@@ -24,7 +38,7 @@ class CustomException(Exception):
         return self.error_message
 
 logging.basicConfig(
-    filename=LOG_FILE_PATH,
+    handlers=[LazyFileHandler(LOG_FILE_PATH)],
     format="[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s",
     level=logging.INFO,
 )
@@ -0,0 +1,74 @@
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Iterator
+
+
+def _parse_one(parse_function: Callable, path: str) -> tuple:
+    """
+    Runs a parse function on one file inside a worker, returning the error instead of
+    raising it so a broken document never stops the rest of the batch.
+    """
+    try:
+        return path, parse_function(path), None
+    except Exception as err:
+        return path, None, f"{type(err).__name__}: {err}"
+
+
+def iter_parsed(
+    parse_function: Callable,
+    paths: list,
+    workers: int = 1,
+    max_tasks_per_child: int = 25,
+    start_method: str = "spawn",
+) -> Iterator[tuple]:
+    """
+    Parses documents on a process pool and yields their results as they complete.
+
+    Only twice `workers` documents are submitted at any time and workers are replaced after
+    `max_tasks_per_child` documents, so neither the pending results nor the memory held by
+    the parsing libraries grow during a long backfill. Errors of a document are yielded
+    with it; if the pool itself breaks (e.g. a worker killed for using too much memory)
+    BrokenProcessPool is raised and the documents not yielded yet are left untouched.
+
+    Args:
+        parse_function (callable): Module-level function receiving a path, so it can be
+            pickled to the workers, e.g. src.creg.parsing.parse_resolution.
+        paths (list): Files to parse.
+        workers (int): Number of processes, 1 parses in the calling process.
+        max_tasks_per_child (int): Documents parsed by a worker before it is replaced.
+        start_method (str): multiprocessing start method. 'spawn' avoids forking a process
+            that already runs threads (downloads, Streamlit), and requires scripts calling
+            this function to be guarded by `if __name__ == "__main__":`.
+
+    Yields:
+        tuple: (path, parsed result or None, error message or None), in completion order.
+
+    Example:
+        >>> for path, resolution, error in iter_parsed(parse_resolution, paths, workers=4):
+        ...     print(path, error or resolution["name"])
+    """
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield _parse_one(parse_function, path)
+        return
+
+    pending_paths = iter(paths)
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(paths)),
+        mp_context=multiprocessing.get_context(start_method),
+        max_tasks_per_child=max_tasks_per_child,
+    ) as executor:
+        in_flight = {}
+        for path in pending_paths:
+            in_flight[executor.submit(_parse_one, parse_function, path)] = path
+            if len(in_flight) >= 2 * workers:
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                in_flight.pop(future)
+                yield future.result()
+                next_path = next(pending_paths, None)
+                if next_path is not None:
+                    in_flight[executor.submit(_parse_one, parse_function, next_path)] = next_path
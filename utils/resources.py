@@ -0,0 +1,223 @@
+import atexit
+import os
+import threading
+from typing import Any, Callable
+
+from utils.logger import logging
+
+OLLAMA_URL = "http://localhost:11434"
+EMBEDDING_MODEL_NAME = "mxbai-embed-large"
+LLM_MODEL_NAME = "llama3.2:3b"
+CHROMA_PATH = "chroma_db"
+
+# Chroma collection and document registry of every source of resolutions
+SOURCES = {
+    "creg": {"collection": "creg_index", "registry": "src/creg/data/document_registry.db"},
+    "upme": {"collection": "upme_index", "registry": "src/upme/data/document_registry.db"},
+}
+
+
+class ResourceRegistry:
+    def __init__(self):
+        """
+        Process-wide store of the expensive clients shared by every Streamlit session and
+        every CREG/UPME object: embedding model, LLM, Chroma clients and query engines.
+
+        A resource is created by its factory on first use and kept until the process ends.
+        A resource requested with a version is created again, releasing the previous one,
+        when the version changes, e.g. a query engine after its index is updated.
+
+        Example:
+            >>> client = resources.get("chroma", lambda: chromadb.PersistentClient("chroma_db"))
+            >>> engine = resources.get("query_engine:creg", build, version=index_versions())
+        """
+        self._resources = {}
+        self._lock = threading.RLock()
+
+    def get(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        version: Any = None,
+        release: Callable[[Any], None] = None,
+    ) -> Any:
+        """
+        Returns the resource `name`, creating it if it does not exist or its version changed.
+
+        Args:
+            name (str): Name of the resource.
+            factory (callable): Function without arguments that creates the resource.
+            version: Version of the resource, None to never reload it.
+            release (callable): Function called with the resource when it is replaced or
+                the registry is closed.
+        """
+        with self._lock:
+            entry = self._resources.get(name)
+            if entry is not None and (version is None or entry["version"] == version):
+                return entry["resource"]
+            if entry is not None:
+                logging.info(f"Recurso {name} recargado, version {version}")
+                self.release(name)
+            self._resources[name] = {
+                "resource": factory(),
+                "version": version,
+                "release": release,
+            }
+            return self._resources[name]["resource"]
+
+    def release(self, name: str) -> None:
+        """
+        Drops a resource so the next `get` creates it again.
+        """
+        with self._lock:
+            entry = self._resources.pop(name, None)
+        if entry is not None and entry["release"] is not None:
+            try:
+                entry["release"](entry["resource"])
+            except Exception as err:
+                logging.warning(f"Error liberando el recurso {name}: {err}")
+
+    def names(self) -> list:
+        with self._lock:
+            return list(self._resources)
+
+    def close(self) -> None:
+        for name in self.names():
+            self.release(name)
+
+
+resources = ResourceRegistry()
+atexit.register(resources.close)
+
+
+def get_embedding_model():
+    """
+    Ollama mxbai-embed-large behind the persistent embedding cache.
+    """
+    from llama_index.embeddings.ollama import OllamaEmbedding
+
+    from utils.embedding_cache import EMBEDDING_CACHE_PATH, CachedEmbedding, EmbeddingCache
+
+    return resources.get(
+        "embedding_model",
+        # Chunks already embedded by any previous run are answered from the disk cache
+        lambda: CachedEmbedding(
+            OllamaEmbedding(
+                model_name=EMBEDDING_MODEL_NAME,
+                base_url=OLLAMA_URL,
+                embed_batch_size=32,
+                ollama_additional_kwargs={"mirostat": 0},
+            ),
+            EmbeddingCache(EMBEDDING_CACHE_PATH),
+        ),
+        release=lambda model: model.cache.close(),
+    )
+
+
+def get_llm():
+    from llama_index.llms.ollama import Ollama
+
+    return resources.get(
+        "llm", lambda: Ollama(model=LLM_MODEL_NAME, base_url=OLLAMA_URL, request_timeout=120.0)
+    )
+
+
+def _release_chroma(client) -> None:
+    # Chroma keeps one system per path for the whole process, a new client of the same
+    # path only reads the collections again once it is dropped. Only the system of this
+    # path is dropped, clear_system_cache would also drop the ones of every other path.
+    # It is not stopped, collections still answering other sessions resolve the system
+    # by path and move to the one of the new client
+    from chromadb.api.client import SharedSystemClient
+
+    SharedSystemClient._identifier_to_system.pop(client._identifier, None)
+    SharedSystemClient._identifier_to_refcount.pop(client._identifier, None)
+
+
+def get_chroma_client(path: str = CHROMA_PATH, version: Any = None):
+    """
+    Persistent Chroma client of a folder. Passing a version reopens the client when it
+    changes, so a serving process reads what another process indexed.
+    """
+    import chromadb
+
+    return resources.get(
+        f"chroma:{os.path.abspath(path)}",
+        lambda: chromadb.PersistentClient(path=path),
+        version=version,
+        release=_release_chroma,
+    )
+
+
+def get_document_registry(source: str):
+    from utils.document_registry import DocumentRegistry
+
+    return resources.get(
+        f"registry:{source}",
+        lambda: DocumentRegistry(source, SOURCES[source]["registry"]),
+        release=lambda registry: registry.close(),
+    )
+
+
+def index_versions() -> tuple:
+    """
+    Index version of every source, it changes whenever any resolution is indexed.
+    """
+    return tuple(get_document_registry(source).index_version() for source in SOURCES)
+
+
+def get_query_engine(source: str):
+    """
+    Query engine over the Chroma collection of a source ('creg' or 'upme'), rebuilt with a
+    fresh Chroma client only when the index of any source changed since it was created.
+    """
+    versions = index_versions()
+
+    def build():
+        from llama_index.core import VectorStoreIndex
+        from llama_index.vector_stores.chroma import ChromaVectorStore
+
+        collection = get_chroma_client(version=versions).get_or_create_collection(
+            SOURCES[source]["collection"]
+        )
+        index = VectorStoreIndex.from_vector_store(
+            ChromaVectorStore(chroma_collection=collection),
+            embed_model=get_embedding_model(),
+        )
+        return index.as_query_engine(llm=get_llm())
+
+    return resources.get(f"query_engine:{source}", build, version=versions)
+
+
+def configure_settings() -> None:
+    """
+    Points the llama-index global Settings to the shared models, once per process.
+    """
+
+    def configure():
+        from llama_index.core import Settings
+
+        Settings.embed_model = get_embedding_model()
+        Settings.llm = get_llm()
+        return Settings
+
+    resources.get("settings", configure)
+
+
+def warm_up(sources: tuple = tuple(SOURCES)) -> None:
+    """
+    Creates the shared models, Chroma client and query engines and loads the embedding
+    model in Ollama, so the first question of a session does not pay for them.
+    """
+    configure_settings()
+    for source in sources:
+        try:
+            get_query_engine(source)
+        except Exception as err:
+            # Created again on the first question, e.g. once Ollama is running
+            logging.warning(f"No se pudo crear el motor de consultas de {source}: {err}")
+    try:
+        get_embedding_model().get_query_embedding("calentamiento")
+    except Exception as err:
+        logging.warning(f"No se pudo cargar el modelo de embeddings en Ollama: {err}")
+    logging.info(f"Recursos compartidos listos: {resources.names()}")